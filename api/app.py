@@ -1,321 +1,1231 @@
-from flask import Flask, request, jsonify
+import time
+# Taken before anything else is imported, to report how long loading the API takes
+IMPORT_STARTED = time.perf_counter()
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import google.generativeai as genai
+import asyncio
+import contextvars
+import json
+import logging
 import os
-import re
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from api.prompts import PROMPT_VERSION, PromptBuilder, split_batch_response
+from api.cache import ExtractionCache, cache_key
+from api.async_client import AsyncModelClient, ModelOverloaded
+from api.backends import create_backend
+from api.cascade import (ModelTier, cascade_model_name, fields_to_escalate, mark_degraded, merge_tier_fields,
+                           ordered_fields, parse_thresholds)
+from api.fields import FORM_1003_FIELDS, build_match_index, calculate_confidence
+from api.normalize import canonical_value
+from api.rules import extract_fields_locally
+from api.deadline import DeadlineExceeded, check_deadline, request_deadline
+from api.scheduler import BULK, INTERACTIVE, ModelScheduler, is_retryable, model_lane
+from api.structured import (MalformedResponse, batch_response_schema, generation_config, parse_answer,
+                            parse_batch_answer, response_schema)
+from api.chunking import merge_chunk_fields, split_transcript
+from api.jobs import InvalidJobInput, JobQueue, JobStore, parse_jsonl, parse_transcripts
+from api.sessions import SessionConflict, SessionLimitExceeded, SessionStore
+from api.results import ResultStore, transcript_hash
+from api.logs import configure_logging
+from api.metrics import (CASCADE_ESCALATIONS, CONTENT_TYPE, EXTRACTIONS, IN_FLIGHT, MODEL_CALLS, MODEL_IN_FLIGHT,
+                         READY, REGISTRY, REQUEST_LATENCY, REQUESTS, SESSION_UPDATES, STAGE_LATENCY,
+                         STARTUP_SECONDS, STRUCTURED_OUTPUT, record_error, record_token_usage)
 
 app = Flask(__name__)
 CORS(app)
 
 # Load environment variables
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
-# Configure Gemini AI
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-if not GOOGLE_API_KEY:
-    raise ValueError("No API key found in .env file")
-
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-pro')
-
-# Form 1003 specific fields and their patterns
-FORM_1003_FIELDS = {
-    "Borrower Name": {
-        'patterns': [
-            r"borrower(?:'s)?\s+name\s+is\b",
-            r"speaking\s+with\b",
-            r"\b(?:mr|mrs|ms|dr)\.\s+",
-            r"(?:I am|I'm|this is)\s+",
-        ],
-        'format': r'^[A-Za-z\s\.-]+$',
-        'section': 'Section I: Borrower Information'
-    },
-    "Loan Amount": {
-        'patterns': [
-            r"loan\s+(?:amount|of|for)\s+",
-            r"requesting\s+(?:a\s+)?(?:loan\s+)?(?:of\s+)?\$?",
-            r"borrow(?:ing)?\s+",
-            r"mortgage\s+(?:of|for)\s+",
-        ],
-        'format': r'^\$?\d{1,3}(?:,\d{3})*(?:\.\d{2})?$',
-        'section': 'Section L: Loan and Property Information'
-    },
-    "Property Address": {
-        'patterns': [
-            r"(?:property|address|located)\s+(?:at|is)\s+",
-            r"looking\s+at\s+",
-            r"buying\s+(?:at|in)\s+",
-        ],
-        'format': r'^\d+\s+[A-Za-z0-9\s,\.]+$',
-        'section': 'Section L: Loan and Property Information'
-    },
-    "Annual Income": {
-        'patterns': [
-            r"(?:annual|yearly|base)\s+income\s+(?:is|of)\s+",
-            r"makes\s+",
-            r"earning\s+",
-            r"salary\s+(?:is|of)\s+",
-        ],
-        'format': r'^\$?\d{1,3}(?:,\d{3})*(?:\.\d{2})?$',
-        'section': 'Section 1a: Employment Information'
-    },
-    "Employment Info": {
-        'patterns': [
-            r"(?:work(?:s|ing)?|employed)\s+(?:at|with|for)\s+",
-            r"(?:job|position|role)\s+(?:is|as)\s+",
-        ],
-        'format': r'^.+$',
-        'section': 'Section 1a: Employment Information'
-    },
-    "Property Type": {
-        'patterns': [
-            r"(?:property|home)\s+(?:is|type)\s+(?:a)?\s+",
-            r"(?:buying|looking at)\s+(?:a)?\s+",
-        ],
-        'format': r'^[A-Za-z\s\-]+$',
-        'section': 'Section L: Loan and Property Information'
-    },
-    "Loan Purpose": {
-        'patterns': [
-            r"(?:looking to|want to|planning to)\s+",
-            r"(?:refinance|purchase|buying)\b",
-        ],
-        'format': r'^(?:Purchase|Refinance)$',
-        'section': 'Section L: Loan and Property Information'
+# Prompt size cap in estimated tokens; few-shot examples are dropped to fit. 0 disables the cap
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '6000'))
+# How the model answers: 'text' ('Field: Value' lines) or 'json' (schema-constrained, see api.structured)
+MODEL_OUTPUT_FORMAT = os.getenv('MODEL_OUTPUT_FORMAT', 'text').lower()
+if MODEL_OUTPUT_FORMAT not in ('text', 'json'):
+    raise ValueError(f"Unknown MODEL_OUTPUT_FORMAT: {MODEL_OUTPUT_FORMAT}")
+# JSON answers that fail validation even after repair are asked for again this many times
+JSON_OUTPUT_RETRIES = int(os.getenv('JSON_OUTPUT_RETRIES', '1'))
+prompt_builder = PromptBuilder(PROMPT_TOKEN_BUDGET or None, MODEL_OUTPUT_FORMAT)
+
+# Everything besides the model that shapes its answers: cached results are keyed by it, and
+# on-disk cache rows stored under any other version are dropped
+CACHE_VERSION = f"{PROMPT_VERSION}/{MODEL_OUTPUT_FORMAT}/{PROMPT_TOKEN_BUDGET}"
+
+# Where the sqlite files of the jobs and sessions APIs go unless JOB_DB / SESSION_DB name them;
+# point it at a persistent volume for queued jobs to survive restarts
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(tempfile.gettempdir(), 'formsiq'))
+
+def init_worker():
+    """Create the per-process model client, cache and async client.
+
+    Runs at import, and again in every gunicorn worker right after the fork (see
+    gunicorn.conf.py): the master preloads the app so prompts and compiled patterns are
+    shared, but model connections and sqlite handles must not be shared across a fork.
+    """
+    global model, MODEL_NAME, extraction_cache, async_model_client, model_tiers, job_store, job_queue
+    global session_store, result_store, ready, warm_up_error
+
+    # Configure the model backend (MODEL_BACKEND=gemini|fake, see api/backends.py) behind the
+    # rate-limit-aware scheduler (api/scheduler.py). Creating it is cheap: the SDK is loaded
+    # and the client built by warm_up() or the first model call
+    model = schedule_model(create_backend())
+    MODEL_NAME = model.model_name
+
+    # Extraction result cache: in-process LRU plus an optional sqlite tier
+    extraction_cache = ExtractionCache(
+        max_entries=int(os.getenv('EXTRACTION_CACHE_SIZE', '1024')),
+        ttl_seconds=int(os.getenv('EXTRACTION_CACHE_TTL', '86400')),
+        db_path=os.getenv('EXTRACTION_CACHE_DB'),
+        max_db_entries=int(os.getenv('EXTRACTION_CACHE_DB_MAX_ENTRIES', '100000')),
+        prompt_version=CACHE_VERSION
+    )
+
+    # Async serving path (api/asgi.py): bounded model concurrency with a rejection queue limit
+    async_model_client = async_client(model)
+
+    # Optional model cascade (api/cascade.py): CASCADE_FAST_MODEL answers first and the model
+    # above is asked only for the fields it answered with low confidence
+    model_tiers = []
+    if os.getenv('MODEL_CASCADE', 'false').lower() == 'true':
+        fast_model = schedule_model(create_backend(model_name=os.getenv('CASCADE_FAST_MODEL', 'gemini-1.5-flash')))
+        model_tiers = [ModelTier('fast', fast_model, async_client(fast_model)),
+                       ModelTier('pro', model, async_model_client)]
+        MODEL_NAME = cascade_model_name(model_tiers)
+
+    # Bulk jobs (/jobs): sqlite job state shared by all workers, drained by a thread pool per process.
+    # The database is opened and the threads started on first use or via start_job_workers(),
+    # never in a preloading master.
+    job_store = JobStore(os.getenv('JOB_DB', os.path.join(DATA_DIR, 'jobs.db')),
+                         lease_seconds=int(os.getenv('JOB_LEASE_SECONDS', '300')))
+    job_queue = JobQueue(
+        job_store,
+        lambda transcript: extract_fields_bulk(transcript),
+        workers=int(os.getenv('JOB_WORKERS', '4')),
+        max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '5')),
+        base_delay=float(os.getenv('JOB_RETRY_BASE_DELAY', '1')),
+        max_delay=float(os.getenv('JOB_RETRY_MAX_DELAY', '60'))
+    )
+
+    # Live call sessions (/sessions): sqlite state shared by all workers, recent sessions cached per process
+    session_store = SessionStore(
+        os.getenv('SESSION_DB', os.path.join(DATA_DIR, 'sessions.db')),
+        idle_seconds=int(os.getenv('SESSION_IDLE_SECONDS', '900')),
+        max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', '1000')),
+        max_chars=int(os.getenv('SESSION_MAX_CHARS', '200000')),
+        cache_size=int(os.getenv('SESSION_CACHE_SIZE', '256'))
+    )
+
+    # Optional result store (/results): every fresh /extract-fields result, indexed for lookup
+    retention_days = float(os.getenv('RESULT_RETENTION_DAYS', '0'))
+    result_store = ResultStore(
+        os.getenv('RESULT_DB'),
+        retention_seconds=retention_days * 86400 if retention_days else None
+    ) if os.getenv('RESULT_DB') else None
+
+    # Readiness (/readyz): set once warm_up() has succeeded in this process
+    ready = False
+    warm_up_error = None
+    READY.set(0)
+
+def schedule_model(backend):
+    """``backend`` behind a ModelScheduler configured from the environment; quotas of 0 mean unlimited"""
+    return ModelScheduler(
+        backend,
+        requests_per_minute=int(os.getenv('MODEL_RPM', '0')),
+        tokens_per_minute=int(os.getenv('MODEL_TPM', '0')),
+        max_waiting=int(os.getenv('SCHEDULER_MAX_WAITING', '64')),
+        max_wait={INTERACTIVE: float(os.getenv('SCHEDULER_INTERACTIVE_MAX_WAIT', '10')),
+                  BULK: float(os.getenv('SCHEDULER_BULK_MAX_WAIT', '300'))},
+        max_retries=int(os.getenv('MODEL_MAX_RETRIES', '2')),
+        base_delay=float(os.getenv('MODEL_RETRY_BASE_DELAY', '0.5')),
+        max_delay=float(os.getenv('MODEL_RETRY_MAX_DELAY', '8'))
+    )
+
+def async_client(scheduled_model):
+    """AsyncModelClient over ``scheduled_model``, configured from the environment"""
+    return AsyncModelClient(
+        scheduled_model,
+        max_concurrency=int(os.getenv('MODEL_MAX_CONCURRENCY', '8')),
+        max_queue=int(os.getenv('MODEL_MAX_QUEUE', '32')),
+        retry_after=int(os.getenv('MODEL_RETRY_AFTER', '1'))
+    )
+
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    """Load and build the model client ahead of the first request; returns whether this process is ready.
+
+    Called in the background when a gunicorn worker starts (see gunicorn.conf.py) or an ASGI
+    server starts up, and by /readyz until it succeeds. Safe to call repeatedly.
+    """
+    global ready, warm_up_error
+    if ready:
+        return True
+    with _warm_up_lock:
+        if ready:
+            return True
+        started = time.perf_counter()
+        try:
+            model.warm_up()
+            for tier in model_tiers:
+                if tier.model is not model:
+                    tier.model.warm_up()
+        except Exception as e:
+            warm_up_error = str(e)
+            record_error('warm_up', e)
+            logger.warning("Warm-up failed", extra={"error": type(e).__name__})
+            return False
+        STARTUP_SECONDS.set(time.perf_counter() - started, phase='warm_up')
+        ready, warm_up_error = True, None
+        READY.set(1)
+        logger.info("Warmed up", extra={"seconds": round(time.perf_counter() - started, 3)})
+    return True
+
+def start_warm_up():
+    """Warm up on a background thread, so starting a worker doesn't wait for it"""
+    if WARM_UP_ON_START:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+def start_job_workers():
+    """Start this process's job worker threads, resuming any jobs left unfinished"""
+    job_queue.start()
+
+def shutdown_worker():
+    """Release per-process resources before the process exits"""
+    job_queue.stop(timeout=float(os.getenv('JOB_SHUTDOWN_TIMEOUT', '10')))
+    job_store.close()
+    session_store.close()
+    if result_store is not None:
+        result_store.close()
+    extraction_cache.close()
+
+# Warm up each process as soon as it starts, rather than on its first readiness probe
+WARM_UP_ON_START = os.getenv('WARM_UP_ON_START', 'true').lower() == 'true'
+
+def model_queue_size():
+    """Model calls of this process waiting for an async concurrency slot or for quota, or running"""
+    clients = {id(client): client for client in [async_model_client, *(tier.async_client for tier in model_tiers)]}
+    schedulers = {id(scheduler): scheduler for scheduler in [model, *(tier.model for tier in model_tiers)]}
+    # Calls of the async path reach their scheduler once they have a slot, so none is counted twice
+    return (sum(getattr(client, 'queued', 0) for client in clients.values())
+            + sum(scheduler.queued() for scheduler in schedulers.values() if hasattr(scheduler, 'queued')))
+
+init_worker()
+REGISTRY.gauge('formsiq_model_queue_size',
+               'Model calls waiting for a concurrency slot or rate-limit quota, or running, over every lane',
+               callback=model_queue_size)
+
+# Every model call a request makes (retries, cascade tiers and chunks included) must finish
+# within this many seconds of the request starting; 0 disables the deadline (see api/deadline.py)
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '90'))
+
+# Rule-based fast path: fields found locally at or above this confidence skip the model
+FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'true').lower() == 'true'
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv('FAST_PATH_MIN_CONFIDENCE', '0.85'))
+
+# Model cascade: a fast-tier field scoring below its threshold is asked again of the next tier.
+# CASCADE_FIELD_THRESHOLDS overrides the default per field ("Loan Amount=0.95;Property Address=0.6")
+CASCADE_MIN_CONFIDENCE = float(os.getenv('CASCADE_MIN_CONFIDENCE', '0.8'))
+CASCADE_THRESHOLDS = parse_thresholds(os.getenv('CASCADE_FIELD_THRESHOLDS'))
+
+# Long transcripts: above LONG_TRANSCRIPT_CHARS, extract overlapping chunks in parallel and merge
+LONG_TRANSCRIPT_CHARS = int(os.getenv('LONG_TRANSCRIPT_CHARS', '32000'))
+LONG_TRANSCRIPT_CHUNK_TOKENS = int(os.getenv('LONG_TRANSCRIPT_CHUNK_TOKENS', '2000'))
+LONG_TRANSCRIPT_OVERLAP_TOKENS = int(os.getenv('LONG_TRANSCRIPT_OVERLAP_TOKENS', '200'))
+LONG_TRANSCRIPT_WORKERS = int(os.getenv('LONG_TRANSCRIPT_WORKERS', '8'))
+
+# Batch extraction: transcripts packed into one model call, and the request size cap
+BATCH_PACK_SIZE = int(os.getenv('BATCH_PACK_SIZE', '5'))
+BATCH_MAX_TRANSCRIPTS = int(os.getenv('BATCH_MAX_TRANSCRIPTS', '100'))
+
+# Bulk jobs: the size cap for one submitted job
+JOB_MAX_TRANSCRIPTS = int(os.getenv('JOB_MAX_TRANSCRIPTS', '10000'))
+
+# Result store queries: the most results one /results request returns
+RESULT_QUERY_MAX_LIMIT = int(os.getenv('RESULT_QUERY_MAX_LIMIT', '1000'))
+
+# Live call sessions: new text goes to the model once this many characters are pending (or on
+# flush), after up to SESSION_CONTEXT_CHARS of text the model has already seen
+SESSION_MODEL_MIN_CHARS = int(os.getenv('SESSION_MODEL_MIN_CHARS', '200'))
+SESSION_CONTEXT_CHARS = int(os.getenv('SESSION_CONTEXT_CHARS', '400'))
+
+def split_field_line(line, requested_fields=None):
+    """Split one 'Field: Value' line from the model into (field_name, value), or None"""
+    line = line.strip()
+    if ':' not in line:
+        return None
+    field_name, value = [x.strip() for x in line.split(':', 1)]
+    if requested_fields is not None and field_name not in requested_fields:
+        return None
+
+    # Only include fields with actual values
+    if not value or value.lower() == 'not specified':
+        return None
+    return field_name, value
+
+def score_field(field_name, value, transcript, match_index):
+    """Build the field dict for a model answer, with its value normalized and its confidence score.
+
+    The value is scored in its canonical form (see api/normalize.py), at the position where
+    the model's wording of it occurs in the transcript.
+    """
+    canonical = canonical_value(field_name, value)
+    return {
+        "field_name": field_name,
+        "field_value": canonical,
+        "confidence_score": calculate_confidence(field_name, canonical, transcript, match_index,
+                                                 transcript.find(value)),
+        "source": "model"
     }
-}
-
-def calculate_confidence(field_name, value, transcript):
-    """Calculate confidence score based on Form 1003 specific patterns and context"""
-    confidence = 0.5  # Base confidence
-    
-    field_info = FORM_1003_FIELDS.get(field_name, {})
-    
-    # Check for pattern matches
-    for pattern in field_info.get('patterns', []):
-        if re.search(pattern, transcript, re.IGNORECASE):
-            confidence += 0.2
+
+def parse_field_line(line, transcript, match_index, requested_fields=None):
+    """Turn one 'Field: Value' line from the model into a scored field dict, or None"""
+    parsed = split_field_line(line, requested_fields)
+    if parsed is None:
+        return None
+    return score_field(*parsed, transcript, match_index)
+
+def parse_fields_param(value):
+    """Validate a request's optional "fields" list.
+
+    Returns the requested fields in form order, or None when every field is wanted.
+    Raises ValueError for anything that isn't a list of known Form 1003 field names.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, list) or not value or not all(isinstance(field, str) for field in value):
+        raise ValueError("fields must be a non-empty list of field names")
+    unknown = [field for field in value if field not in FORM_1003_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    fields = [field for field in FORM_1003_FIELDS if field in value]
+    return None if len(fields) == len(FORM_1003_FIELDS) else fields
+
+def parse_timestamp(value):
+    """A query's time bound, as a Unix timestamp or ISO 8601 date/time (UTC unless it has an offset)"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}")
+    return (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp()
+
+def fields_for_model(missing_fields):
+    """The field subset to ask the model for, or None to ask for every field"""
+    return None if len(missing_fields) == len(FORM_1003_FIELDS) else missing_fields
+
+def index_transcript(transcript, fields=None):
+    """build_match_index, timed as part of the scoring stage"""
+    with STAGE_LATENCY.time(stage='scoring'):
+        return build_match_index(transcript, fields)
+
+def split_field_lines(text, requested_fields=None):
+    """(field_name, value) pairs from 'Field: Value' lines"""
+    return [p for p in (split_field_line(line, requested_fields) for line in text.split('\n')) if p]
+
+def parse_answer_pairs(text, requested_fields=None):
+    """(field_name, value) pairs from the model's answer: 'Field: Value' lines, or JSON in JSON output mode.
+
+    Raises MalformedResponse for JSON answers that don't match the response schema.
+    """
+    with STAGE_LATENCY.time(stage='parse'):
+        if prompt_builder.output_format == 'json':
+            return parse_answer(text, requested_fields)
+        return split_field_lines(text, requested_fields)
+
+def parse_extraction_response(text, transcript, requested_fields=None, match_index=None):
+    """Turn the model's answer into scored field dicts.
+
+    When ``requested_fields`` is given, answers for any other field are dropped unscored.
+    Raises MalformedResponse for JSON answers that don't match the response schema.
+    """
+    return score_fields(parse_answer_pairs(text, requested_fields), transcript, requested_fields, match_index)
+
+def parse_batch_response(text, count, fields=None):
+    """Per-transcript (field_name, value) pairs from a batch answer, None where one is missing"""
+    with STAGE_LATENCY.time(stage='parse'):
+        if prompt_builder.output_format == 'json':
+            return parse_batch_answer(text, count, fields)
+        return [None if section is None else split_field_lines(section, fields)
+                for section in split_batch_response(text, count)]
+
+def score_fields(parsed, transcript, requested_fields=None, match_index=None):
+    """Scored field dicts for (field_name, value) pairs; fields that fail to score are dropped"""
+    if match_index is None:
+        match_index = index_transcript(transcript, requested_fields)
+    fields = []
+    with STAGE_LATENCY.time(stage='scoring'):
+        for field_name, value in parsed:
+            try:
+                fields.append(score_field(field_name, value, transcript, match_index))
+            except Exception as e:
+                record_error('scoring', e)
+                logger.warning("Could not score field", extra={"field_name": field_name, "error": str(e)})
+    return fields
+
+def call_model(prompt, client=None, **kwargs):
+    """Call the model (or ``client``, a cascade tier's), recording latency, token usage and errors"""
+    check_deadline()
+    MODEL_IN_FLIGHT.inc()
+    try:
+        with STAGE_LATENCY.time(stage='model_call'):
+            response = (client or model).generate_content(prompt, **kwargs)
+    except Exception as e:
+        MODEL_CALLS.inc(outcome='error')
+        record_error('model', e)
+        raise
+    finally:
+        MODEL_IN_FLIGHT.dec()
+    MODEL_CALLS.inc(outcome='ok')
+    record_token_usage(response)
+    return response
+
+async def call_model_async(prompt, client=None, **kwargs):
+    """Async variant of call_model through the shared AsyncModelClient (or ``client``)"""
+    check_deadline()
+    MODEL_IN_FLIGHT.inc()
+    try:
+        with STAGE_LATENCY.time(stage='model_call'):
+            response = await (client or async_model_client).generate_content(prompt, **kwargs)
+    except Exception as e:
+        MODEL_CALLS.inc(outcome='error')
+        record_error('model', e)
+        raise
+    finally:
+        MODEL_IN_FLIGHT.dec()
+    MODEL_CALLS.inc(outcome='ok')
+    record_token_usage(response)
+    return response
+
+def stream_model(prompt):
+    """Yield streamed model chunks like call_model; only time spent waiting on the model counts as model_call"""
+    MODEL_IN_FLIGHT.inc()
+    elapsed, chunk = 0.0, None
+    try:
+        started = time.perf_counter()
+        chunks = iter(model.generate_content(prompt, stream=True))
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - started
+            yield chunk
+            started = time.perf_counter()
+    except Exception as e:
+        MODEL_CALLS.inc(outcome='error')
+        record_error('model', e)
+        raise
+    finally:
+        MODEL_IN_FLIGHT.dec()
+        STAGE_LATENCY.observe(elapsed, stage='model_call')
+    MODEL_CALLS.inc(outcome='ok')
+    # Streamed responses report their usage on the final chunk
+    if chunk is not None:
+        record_token_usage(chunk)
+
+def output_kwargs(schema):
+    """Model call arguments that constrain the answer to ``schema`` in JSON output mode"""
+    if prompt_builder.output_format == 'json':
+        return {"generation_config": generation_config(schema)}
+    return {}
+
+def _malformed(error, attempt):
+    """Record a malformed JSON answer; returns whether to ask the model again"""
+    record_error('parse', error)
+    if attempt >= JSON_OUTPUT_RETRIES:
+        return False
+    STRUCTURED_OUTPUT.inc(outcome='retried')
+    logger.warning("Retrying malformed model answer", extra={"attempt": attempt + 1, "error": str(error)})
+    return True
+
+def generate_parsed(prompt, parse, schema, client=None):
+    """call_model, then ``parse(response.text)``.
+
+    In JSON output mode the call is constrained to ``schema``, and an answer that fails
+    validation even after repair is requested again, up to JSON_OUTPUT_RETRIES times.
+    """
+    kwargs = output_kwargs(schema)
+    for attempt in range(JSON_OUTPUT_RETRIES + 1):
+        response = call_model(prompt, client, **kwargs)
+        try:
+            return parse(response.text)
+        except MalformedResponse as e:
+            if not _malformed(e, attempt):
+                raise
+
+async def generate_parsed_async(prompt, parse, schema, client=None):
+    """Async variant of generate_parsed"""
+    kwargs = output_kwargs(schema)
+    for attempt in range(JSON_OUTPUT_RETRIES + 1):
+        response = await call_model_async(prompt, client, **kwargs)
+        try:
+            # Parsing scores every field against the transcript: CPU work that would stall the loop
+            return await asyncio.to_thread(parse, response.text)
+        except MalformedResponse as e:
+            if not _malformed(e, attempt):
+                raise
+
+def model_fields(transcript, requested_fields=None, match_index=None, client=None):
+    """Ask the model (or ``client``) for ``requested_fields`` (default: every field) and return them scored"""
+    prompt = prompt_builder.extraction_prompt(transcript, requested_fields)
+    return generate_parsed(
+        prompt, lambda text: parse_extraction_response(text, transcript, requested_fields, match_index),
+        response_schema(requested_fields), client)
+
+async def model_fields_async(transcript, requested_fields=None, match_index=None, client=None):
+    """Async variant of model_fields"""
+    prompt = prompt_builder.extraction_prompt(transcript, requested_fields)
+    return await generate_parsed_async(
+        prompt, lambda text: parse_extraction_response(text, transcript, requested_fields, match_index),
+        response_schema(requested_fields), client)
+
+def _escalate(tier, merged, fields, last):
+    """Fold a tier's answers into ``merged``; returns the fields to ask the next tier"""
+    merge_tier_fields(merged, fields, tier.name)
+    escalate = [] if last else fields_to_escalate(fields, CASCADE_THRESHOLDS, CASCADE_MIN_CONFIDENCE)
+    if escalate:
+        CASCADE_ESCALATIONS.inc(len(escalate), tier=tier.name)
+    return escalate
+
+def _tier_failed(tier, error, merged, last, asked):
+    """Handle a cascade tier's failed call for the ``asked`` fields.
+
+    The next tier is asked instead; when the last tier fails, the earlier tiers' answers are
+    returned, with the fields it was asked for marked "degraded". Raises only when no tier
+    answered.
+    """
+    if last and not merged:
+        raise error
+    if last:
+        mark_degraded(merged, asked)
+    logger.warning("Model tier failed", extra={"tier": tier.name, "error": str(error), "escalated": not last})
+
+def cascade_fields(transcript, requested_fields=None, match_index=None):
+    """model_fields through the model tiers, each asked only for the previous tier's low-confidence fields.
+
+    Every field carries the "tier" that produced it (see api/cascade.py).
+    """
+    merged, asked = {}, requested_fields
+    for position, tier in enumerate(model_tiers):
+        last = position == len(model_tiers) - 1
+        try:
+            fields = model_fields(transcript, asked, match_index, tier.model)
+        except Exception as e:
+            _tier_failed(tier, e, merged, last, asked)
+            continue
+        escalate = _escalate(tier, merged, fields, last)
+        if not escalate:
+            break
+        asked = fields_for_model(escalate)
+    return ordered_fields(merged)
+
+async def cascade_fields_async(transcript, requested_fields=None, match_index=None):
+    """Async variant of cascade_fields"""
+    merged, asked = {}, requested_fields
+    for position, tier in enumerate(model_tiers):
+        last = position == len(model_tiers) - 1
+        try:
+            fields = await model_fields_async(transcript, asked, match_index, tier.async_client)
+        except Exception as e:
+            _tier_failed(tier, e, merged, last, asked)
+            continue
+        escalate = _escalate(tier, merged, fields, last)
+        if not escalate:
             break
-    
-    # Check value format
-    if field_info.get('format') and re.match(field_info['format'], value.strip()):
-        confidence += 0.15
-    
-    # Context analysis
-    context_window = 50
-    value_pos = transcript.find(value)
-    if value_pos != -1:
-        context = transcript[max(0, value_pos - context_window):
-                           min(len(transcript), value_pos + len(value) + context_window)]
-        if any(re.search(pattern, context, re.IGNORECASE) for pattern in field_info.get('patterns', [])):
-            confidence += 0.15
-    
-    # Field-specific adjustments
-    if field_name == "Borrower Name":
-        name_parts = value.split()
-        if len(name_parts) >= 2:  # Full name is more likely correct
-            confidence += 0.1
-    elif field_name == "Loan Amount":
-        if re.match(r'^\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?$', value):
-            confidence += 0.1
-    elif field_name == "Property Type":
-        valid_types = ['Single Family', 'Condo', 'Townhouse', 'Multi-Family', 'Manufactured']
-        if any(t.lower() in value.lower() for t in valid_types):
-            confidence += 0.1
-    
-    return round(min(max(confidence, 0.0), 1.0), 2)
-
-def extract_fields_with_gemini(transcript):
+        asked = fields_for_model(escalate)
+    return ordered_fields(merged)
+
+def ask_model(transcript, requested_fields=None, match_index=None):
+    """model_fields, through the model cascade when one is configured"""
+    if model_tiers:
+        return cascade_fields(transcript, requested_fields, match_index)
+    return model_fields(transcript, requested_fields, match_index)
+
+async def ask_model_async(transcript, requested_fields=None, match_index=None):
+    """Async variant of ask_model"""
+    if model_tiers:
+        return await cascade_fields_async(transcript, requested_fields, match_index)
+    return await model_fields_async(transcript, requested_fields, match_index)
+
+def run_fast_path(transcript, match_index, fields=None):
+    """Run the rule-based extractor first over ``fields`` (default: every field).
+
+    Returns the confidently extracted fields and the fields still left for the model;
+    with the fast path disabled every field is left for the model.
+    """
+    fields = fields or list(FORM_1003_FIELDS)
+    if not FAST_PATH_ENABLED:
+        return [], fields
+    with STAGE_LATENCY.time(stage='fast_path'):
+        local_fields = [field for field in extract_fields_locally(transcript, fields, match_index)
+                        if field['confidence_score'] >= FAST_PATH_MIN_CONFIDENCE]
+    found = {field['field_name'] for field in local_fields}
+    return local_fields, [field_name for field_name in fields if field_name not in found]
+
+def _merge_chunk_results(chunk_results):
+    """Merge per-chunk field lists, skipping chunks whose model call failed"""
+    chunk_fields = [fields for fields in chunk_results if not isinstance(fields, Exception)]
+    failed = len(chunk_results) - len(chunk_fields)
+    if not chunk_fields:
+        overloaded = [e for e in chunk_results if isinstance(e, ModelOverloaded)]
+        raise (overloaded or chunk_results)[0]
+    if failed:
+        logger.warning("Some transcript chunks failed", extra={"failed_chunks": failed, "chunks": len(chunk_results)})
+    return merge_chunk_fields(chunk_fields)
+
+def extract_chunked(transcript, requested_fields=None):
+    """Map-reduce extraction for long transcripts.
+
+    Chunks from split_transcript are extracted in parallel on LONG_TRANSCRIPT_WORKERS
+    threads and merged with merge_chunk_fields. Failed chunks are skipped; the call only
+    raises when every chunk fails (ModelOverloaded if any chunk was overloaded). Returns
+    (fields, number of chunks).
+    """
+    chunks = split_transcript(transcript, LONG_TRANSCRIPT_CHUNK_TOKENS, LONG_TRANSCRIPT_OVERLAP_TOKENS)
+
+    def extract_chunk(chunk):
+        try:
+            return ask_model(chunk, requested_fields)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LONG_TRANSCRIPT_WORKERS, len(chunks)))) as executor:
+        # Each chunk runs in a copy of the caller's context, so its model calls keep the caller's lane
+        futures = [executor.submit(contextvars.copy_context().run, extract_chunk, chunk) for chunk in chunks]
+        chunk_results = [future.result() for future in futures]
+    return _merge_chunk_results(chunk_results), len(chunks)
+
+async def extract_chunked_async(transcript, requested_fields=None):
+    """Async variant of extract_chunked; chunk calls share the async client's concurrency limit"""
+    chunks = await asyncio.to_thread(split_transcript, transcript, LONG_TRANSCRIPT_CHUNK_TOKENS,
+                                     LONG_TRANSCRIPT_OVERLAP_TOKENS)
+
+    chunk_results = await asyncio.gather(*[ask_model_async(chunk, requested_fields) for chunk in chunks],
+                                         return_exceptions=True)
+    return _merge_chunk_results(chunk_results), len(chunks)
+
+def cache_result(key, result):
+    """Cache a model result, unless it has degraded fields: a later call may get the full answer"""
+    if any(field.get('degraded') for field in result['fields']):
+        return
+    extraction_cache.set(key, result)
+
+def extract_fields(transcript, fields=None):
+    """Extract Form 1003 fields: cache, then the rule-based fast path, then the model.
+
+    ``fields`` limits extraction (and scoring) to a subset of FORM_1003_FIELDS. Model errors
+    propagate; extract_fields_with_gemini is the variant that records them for a response.
+    """
+    key = cache_key(transcript, MODEL_NAME, CACHE_VERSION, fields)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        EXTRACTIONS.inc(path='cache')
+        return {**cached, "cached": True}
+
+    match_index = index_transcript(transcript, fields)
+    local_fields, missing_fields = run_fast_path(transcript, match_index, fields)
+    if not missing_fields:
+        EXTRACTIONS.inc(path='rules')
+        result = {"fields": local_fields}
+        extraction_cache.set(key, result)
+        return {**result, "cached": False}
+
+    requested_fields = fields_for_model(missing_fields)
+    if len(transcript) > LONG_TRANSCRIPT_CHARS:
+        chunk_fields, chunk_count = extract_chunked(transcript, requested_fields)
+        logger.info("Extracted long transcript in chunks",
+                    extra={"transcript_chars": len(transcript), "chunks": chunk_count})
+        EXTRACTIONS.inc(path='chunked')
+        result = {"fields": local_fields + chunk_fields, "chunks": chunk_count}
+        cache_result(key, result)
+        return {**result, "cached": False}
+
+    # Form 1003 specific prompt with comprehensive examples, asking only for missing fields
+    fields = local_fields + ask_model(transcript, requested_fields, match_index)
+    EXTRACTIONS.inc(path='model')
+    result = {"fields": fields}
+    cache_result(key, result)
+    return {**result, "cached": False}
+
+def extract_fields_bulk(transcript, fields=None):
+    """extract_fields with model calls in the scheduler's bulk lane, behind interactive requests"""
+    with model_lane(BULK):
+        return extract_fields(transcript, fields)
+
+def update_session(session, text, flush=False):
+    """Append ``text`` to a live session and bring its fields up to date.
+
+    The rule-based fast path reads the whole transcript through the session's incremental
+    match index. Fields it doesn't settle go to the model once SESSION_MODEL_MIN_CHARS of
+    new text are pending, or on ``flush``: the prompt holds only that text, a little context
+    before it and the values known so far. Every field is then rescored. Returns how the
+    fields were updated: 'rules', 'model', or 'deferred' while new text is still pending.
+    """
+    session.append(text)
+    missing_fields = session.fields or list(FORM_1003_FIELDS)
+    if FAST_PATH_ENABLED:
+        with STAGE_LATENCY.time(stage='fast_path'):
+            local_fields = [field for field in session.local_fields()
+                            if field['confidence_score'] >= FAST_PATH_MIN_CONFIDENCE]
+        session.merge(local_fields)
+        found = {field['field_name'] for field in local_fields}
+        missing_fields = [field_name for field_name in missing_fields if field_name not in found]
+
+    path = 'rules'
+    if missing_fields and session.pending_chars:
+        path = 'model' if flush or session.pending_chars >= SESSION_MODEL_MIN_CHARS else 'deferred'
+    if path == 'model':
+        requested_fields = fields_for_model(missing_fields)
+        prompt = prompt_builder.session_prompt(session.pending_text(SESSION_CONTEXT_CHARS),
+                                               session.known_values(), requested_fields)
+        session.merge(generate_parsed(
+            prompt, lambda answer: session.score_pairs(parse_answer_pairs(answer, requested_fields)),
+            response_schema(requested_fields)))
+    if path != 'deferred':
+        session.processed = len(session.transcript)
+    with STAGE_LATENCY.time(stage='scoring'):
+        session.rescore()
+    return path
+
+class ExtractionFailed(Exception):
+    """The model failed to answer for a transcript; ``status`` is the HTTP status to report.
+
+    504 when the request deadline passed, 503 for errors worth retrying later (5xx and
+    timeouts), 502 for the rest, such as answers that can't be parsed.
+    """
+
+    def __init__(self, error):
+        super().__init__(f"Extraction failed: {error}")
+        if isinstance(error, DeadlineExceeded):
+            self.status = 504
+        elif is_retryable(error):
+            self.status = 503
+        else:
+            self.status = 502
+
+def _extraction_failed(error, transcript):
+    """Record a failed extraction and return the ExtractionFailed to raise for it"""
+    EXTRACTIONS.inc(path='error')
+    record_error('extraction', error)
+    logger.error("Extraction failed", extra={"transcript_chars": len(transcript), "error": str(error)})
+    return ExtractionFailed(error)
+
+def extract_fields_with_gemini(transcript, fields=None):
+    """extract_fields, with model errors recorded and raised as ExtractionFailed.
+
+    ModelOverloaded propagates as it is, so callers can answer 429. Either way a failure is
+    an error response, never an empty field list a client would take for "nothing found".
+    """
     try:
-        # Form 1003 specific prompt with comprehensive examples
-        prompt = f"""You are a mortgage loan processor expert. Extract information from the transcript that matches fields from the Uniform Residential Loan Application (Form 1003).
-
-# POSITIVE EXAMPLES (Clear, straightforward cases)
-
-Example 1 (Standard Case):
-Transcript: "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston. I make $85,000 a year working as a software engineer at Tech Corp."
-Output:
-Borrower Name: John Smith
-Loan Amount: $300,000
-Property Address: 123 Main St, Boston
-Annual Income: $85,000
-Employment Info: Software Engineer at Tech Corp
-Property Type: Not specified
-Loan Purpose: Purchase
-
-Example 2 (Refinance Case):
-Transcript: "I'd like to refinance my condo at 456 Park Ave, NYC. My name is Sarah Johnson, I earn $120,000 annually as a marketing director."
-Output:
-Borrower Name: Sarah Johnson
-Loan Amount: Not specified
-Property Address: 456 Park Ave, NYC
-Annual Income: $120,000
-Employment Info: Marketing Director
-Property Type: Condo
-Loan Purpose: Refinance
-
-Example 3 (Complete Information):
-Transcript: "Hello, Dr. Maria Garcia-Rodriguez here. I want to purchase a single-family home at 789 Oak Drive, Austin, TX. The loan amount would be $450,000, and I'm currently making $175,000 per year as a senior physician at Central Hospital."
-Output:
-Borrower Name: Dr. Maria Garcia-Rodriguez
-Loan Amount: $450,000
-Property Address: 789 Oak Drive, Austin, TX
-Annual Income: $175,000
-Employment Info: Senior Physician at Central Hospital
-Property Type: Single-family
-Loan Purpose: Purchase
-
-# COMPLEX EXAMPLES (Multiple or indirect mentions)
-
-Example 4 (Multiple Amounts):
-Transcript: "I'm Robert Chen, earning about $95,000 base salary plus $30,000 bonus. Looking at a $425,000 loan for a townhouse at 321 Pine Street, Seattle."
-Output:
-Borrower Name: Robert Chen
-Loan Amount: $425,000
-Property Address: 321 Pine Street, Seattle
-Annual Income: $125,000
-Employment Info: Not specified
-Property Type: Townhouse
-Loan Purpose: Not specified
-
-Example 5 (Indirect References):
-Transcript: "The property we discussed last time, you know, that manufactured home on 567 Lake Road, Miami? I'm ready to move forward. As discussed, my yearly take-home is one-fifty thousand, and we'll need financing for three-twenty-five thousand."
-Output:
-Borrower Name: Not specified
-Loan Amount: $325,000
-Property Address: 567 Lake Road, Miami
-Annual Income: $150,000
-Employment Info: Not specified
-Property Type: Manufactured
-Loan Purpose: Not specified
-
-# EDGE CASES (Unusual formats or partial information)
-
-Example 6 (Hyphenated/Special Characters):
-Transcript: "Jean-Pierre O'Connor speaking. Looking at 42-B West 73rd St., Apt. 5C, New York, NY. Currently at Deutsche-Bank making $225K/year."
-Output:
-Borrower Name: Jean-Pierre O'Connor
-Loan Amount: Not specified
-Property Address: 42-B West 73rd St., Apt. 5C, New York, NY
-Annual Income: $225,000
-Employment Info: Deutsche-Bank
-Property Type: Not specified
-Loan Purpose: Not specified
-
-Example 7 (Informal Language):
-Transcript: "Hey there! Name's Mike - Michael Thompson officially. Making around 6 figures - about 100k actually, working remote for Apple. Wanna buy this sweet multi-family unit at 888 Beach Blvd."
-Output:
-Borrower Name: Michael Thompson
-Loan Amount: Not specified
-Property Address: 888 Beach Blvd
-Annual Income: $100,000
-Employment Info: Apple
-Property Type: Multi-family
-Loan Purpose: Purchase
-
-Example 8 (Minimal Information):
-Transcript: "James Wilson. Need 275k for the condo."
-Output:
-Borrower Name: James Wilson
-Loan Amount: $275,000
-Property Address: Not specified
-Annual Income: Not specified
-Employment Info: Not specified
-Property Type: Condo
-Loan Purpose: Not specified
-
-# NEGATIVE EXAMPLES (Invalid or unclear cases)
-
-Example 9 (Ambiguous Information):
-Transcript: "Someone mentioned a property on Oak Street, might be interested in that or the one on Pine Avenue. Income varies, sometimes 80k, sometimes more."
-Output:
-Borrower Name: Not specified
-Loan Amount: Not specified
-Property Address: Not specified
-Annual Income: Not specified
-Employment Info: Not specified
-Property Type: Not specified
-Loan Purpose: Not specified
-
-Example 10 (Conflicting Information):
-Transcript: "John Smith - no wait, it's James Smith. The loan would be 400k - actually, make that 450k. Located at 123 Main St - sorry, 321 Main St."
-Output:
-Borrower Name: Not specified
-Loan Amount: Not specified
-Property Address: Not specified
-Annual Income: Not specified
-Employment Info: Not specified
-Property Type: Not specified
-Loan Purpose: Not specified
-
-Now extract information from this transcript, following Form 1003 sections:
-{transcript}
-
-Format each field exactly as:
-Field: Value
-Use 'Not specified' if:
-1. The field is not mentioned in the transcript
-2. The information is ambiguous or conflicting
-3. The format doesn't match expected patterns
-
-Remember:
-- Extract only clearly stated information
-- Maintain original formatting for numbers and addresses
-- Do not interpret or assume information not explicitly stated
-- For conflicting information, mark as 'Not specified'
-"""
-
-        print("Sending Form 1003 specific prompt to Gemini...")
-        response = model.generate_content(prompt)
-        print(f"Received response: {response.text}")
-
-        # Process the response and calculate confidence scores
-        fields = []
-        for line in response.text.split('\n'):
-            line = line.strip()
-            if ':' in line:
-                try:
-                    field_name, value = [x.strip() for x in line.split(':', 1)]
-                    
-                    # Only include fields with actual values
-                    if value and value.lower() != 'not specified':
-                        confidence = calculate_confidence(field_name, value, transcript)
-                        fields.append({
-                            "field_name": field_name,
-                            "field_value": value,
-                            "confidence_score": confidence
-                        })
-                except Exception as e:
-                    print(f"Error processing line '{line}': {str(e)}")
-
-        print(f"Processed Form 1003 fields with confidence scores: {fields}")
-        return {"fields": fields}
+        return extract_fields(transcript, fields)
+    except ModelOverloaded:
+        EXTRACTIONS.inc(path='overloaded')
+        raise
+    except Exception as e:
+        raise _extraction_failed(e, transcript) from e
 
+def _local_extraction(transcript, fields=None):
+    """The steps of extract_fields before the model: cache lookup, match index and fast path.
+
+    Returns (cache key, cached result or None, match index, local fields, fields left for
+    the model); on a cache hit the last three are None.
+    """
+    key = cache_key(transcript, MODEL_NAME, CACHE_VERSION, fields)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        return key, cached, None, None, None
+    match_index = index_transcript(transcript, fields)
+    local_fields, missing_fields = run_fast_path(transcript, match_index, fields)
+    return key, None, match_index, local_fields, missing_fields
+
+async def extract_fields_async(transcript, fields=None):
+    """Async variant of extract_fields_with_gemini for the ASGI serving path.
+
+    Raises ModelOverloaded when the async model client queue is full, so the caller can
+    answer 429, and ExtractionFailed for other model errors like the sync path. The cache
+    (sqlite), the match index and the rule-based fast path are blocking work, so they run
+    in a worker thread and only the model calls stay on the event loop.
+    """
+    key, cached, match_index, local_fields, missing_fields = await asyncio.to_thread(
+        _local_extraction, transcript, fields)
+    if cached is not None:
+        EXTRACTIONS.inc(path='cache')
+        return {**cached, "cached": True}
+    if not missing_fields:
+        EXTRACTIONS.inc(path='rules')
+        result = {"fields": local_fields}
+        await asyncio.to_thread(extraction_cache.set, key, result)
+        return {**result, "cached": False}
+
+    requested_fields = fields_for_model(missing_fields)
+    result = {}
+    try:
+        if len(transcript) > LONG_TRANSCRIPT_CHARS:
+            chunk_fields, result["chunks"] = await extract_chunked_async(transcript, requested_fields)
+            fields = local_fields + chunk_fields
+            EXTRACTIONS.inc(path='chunked')
+        else:
+            fields = local_fields + await ask_model_async(transcript, requested_fields, match_index)
+            EXTRACTIONS.inc(path='model')
+    except ModelOverloaded:
+        EXTRACTIONS.inc(path='overloaded')
+        raise
     except Exception as e:
-        print(f"Extraction error: {str(e)}")
-        return {"fields": []}
+        raise _extraction_failed(e, transcript) from e
+
+    result = {"fields": fields, **result}
+    await asyncio.to_thread(cache_result, key, result)
+    return {**result, "cached": False}
+
+def store_result(transcript, fields, result, started):
+    """Record a fresh extraction result in the result store, when one is configured.
+
+    Cached and empty results aren't recorded. Storage errors are logged, never raised, so
+    they can't fail the request.
+    """
+    if result_store is None or result['cached'] or not result['fields']:
+        return
+    try:
+        result_store.record(transcript_hash(transcript), result['fields'], MODEL_NAME, PROMPT_VERSION,
+                            requested_fields=fields, duration_seconds=time.perf_counter() - started,
+                            chunks=result.get('chunks'))
+    except sqlite3.Error as e:
+        record_error('result_store', e)
+        logger.error("Could not store extraction result", extra={"error": str(e)})
+
+def extraction_error_event(error, transcript):
+    """Record a failed streaming extraction and return its error event.
+
+    Overload is flagged with "overloaded" and "retry_after" so clients can retry later.
+    """
+    event = {"type": "error", "error": str(error)}
+    if isinstance(error, ModelOverloaded):
+        EXTRACTIONS.inc(path='overloaded')
+        event.update(overloaded=True, retry_after=error.retry_after)
+        return event
+    EXTRACTIONS.inc(path='error')
+    record_error('extraction', error)
+    logger.error("Streaming extraction failed", extra={"transcript_chars": len(transcript), "error": str(error)})
+    return event
+
+def stream_fields(transcript, fields=None):
+    """Yield extraction events as soon as each field is known.
+
+    Events are dicts: {"type": "field", ...field} per field, then {"type": "done",
+    "cached": bool}, or {"type": "error", "error": message} if the model call fails
+    (see extraction_error_event).
+    Rule-based fields go out first; model fields follow line by line as they stream in.
+    """
+    key = cache_key(transcript, MODEL_NAME, CACHE_VERSION, fields)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        EXTRACTIONS.inc(path='cache')
+        for field in cached['fields']:
+            yield {"type": "field", **field}
+        yield {"type": "done", "cached": True}
+        return
+
+    match_index = index_transcript(transcript, fields)
+    local_fields, missing_fields = run_fast_path(transcript, match_index, fields)
+    for field in local_fields:
+        yield {"type": "field", **field}
+    fields = list(local_fields)
+
+    if missing_fields and len(transcript) > LONG_TRANSCRIPT_CHARS:
+        # Chunk results only make sense once merged, so long transcripts stream per field after the merge
+        try:
+            chunk_fields, _ = extract_chunked(transcript, fields_for_model(missing_fields))
+        except Exception as e:
+            yield extraction_error_event(e, transcript)
+            return
+        EXTRACTIONS.inc(path='chunked')
+        for field in chunk_fields:
+            fields.append(field)
+            yield {"type": "field", **field}
+    elif missing_fields and model_tiers:
+        # A cascade's fields are final only once every tier it needs has answered, so they go out together
+        try:
+            tier_fields = cascade_fields(transcript, fields_for_model(missing_fields), match_index)
+        except Exception as e:
+            yield extraction_error_event(e, transcript)
+            return
+        EXTRACTIONS.inc(path='model')
+        for field in tier_fields:
+            fields.append(field)
+            yield {"type": "field", **field}
+    elif missing_fields:
+        requested_fields = fields_for_model(missing_fields)
+        # Always lines: each one is a complete field, where partial JSON can't be parsed yet
+        prompt = prompt_builder.extraction_prompt(transcript, requested_fields, output_format='text')
+        buffer = ''
+        try:
+            for chunk in stream_model(prompt):
+                buffer += chunk.text
+                *lines, buffer = buffer.split('\n')
+                for line in lines:
+                    field = parse_field_line(line, transcript, match_index, requested_fields)
+                    if field:
+                        fields.append(field)
+                        yield {"type": "field", **field}
+            field = parse_field_line(buffer, transcript, match_index, requested_fields)
+            if field:
+                fields.append(field)
+                yield {"type": "field", **field}
+        except Exception as e:
+            yield extraction_error_event(e, transcript)
+            return
+        EXTRACTIONS.inc(path='model')
+    else:
+        EXTRACTIONS.inc(path='rules')
+
+    cache_result(key, {"fields": fields})
+    yield {"type": "done", "cached": False}
+
+def extract_fields_batch(transcripts, fields=None):
+    """Extract fields from many transcripts, packing BATCH_PACK_SIZE of them per model call.
+
+    ``fields`` limits every transcript's extraction to a subset of FORM_1003_FIELDS.
+
+    Returns one result per transcript, in input order: {"index", "fields", "cached"} on success or
+    {"index", "error"} when that transcript could not be processed, plus "overloaded" and
+    "retry_after" when the model was overloaded.
+    """
+    results = [None] * len(transcripts)
+    pending = []
+    for index, transcript in enumerate(transcripts):
+        if not isinstance(transcript, str):
+            results[index] = {"index": index, "error": "Transcript must be a string"}
+            continue
+        key = cache_key(transcript, MODEL_NAME, CACHE_VERSION, fields)
+        cached = extraction_cache.get(key)
+        if cached is not None:
+            EXTRACTIONS.inc(path='cache')
+            results[index] = {"index": index, **cached, "cached": True}
+            continue
+        local_fields, missing_fields = run_fast_path(transcript, index_transcript(transcript, fields), fields)
+        if not missing_fields:
+            EXTRACTIONS.inc(path='rules')
+            extraction_cache.set(key, {"fields": local_fields})
+            results[index] = {"index": index, "fields": local_fields, "cached": False}
+        else:
+            pending.append(index)
+
+    for offset in range(0, len(pending), BATCH_PACK_SIZE):
+        group = pending[offset:offset + BATCH_PACK_SIZE]
+        group_transcripts = [transcripts[index] for index in group]
+        try:
+            prompt = prompt_builder.batch_prompt(group_transcripts, fields)
+            answers = generate_parsed(prompt, lambda text: parse_batch_response(text, len(group), fields),
+                                      batch_response_schema(fields))
+        except ModelOverloaded as e:
+            EXTRACTIONS.inc(len(group), path='overloaded')
+            for index in group:
+                results[index] = {"index": index, "error": str(e), "overloaded": True, "retry_after": e.retry_after}
+            continue
+        except Exception as e:
+            record_error('extraction', e)
+            logger.error("Batch extraction failed", extra={"transcripts": len(group), "error": str(e)})
+            EXTRACTIONS.inc(len(group), path='error')
+            for index in group:
+                results[index] = {"index": index, "error": f"Extraction failed: {str(e)}"}
+            continue
+
+        for index, transcript, answer in zip(group, group_transcripts, answers):
+            if answer is None:
+                EXTRACTIONS.inc(path='error')
+                results[index] = {"index": index, "error": "No result returned for this transcript"}
+            else:
+                EXTRACTIONS.inc(path='model')
+                result = {"fields": score_fields(answer, transcript, fields)}
+                extraction_cache.set(cache_key(transcript, MODEL_NAME, CACHE_VERSION, fields), result)
+                results[index] = {"index": index, **result, "cached": False}
+
+    return results
+
+def endpoint_label():
+    """Route template for metric labels, so path parameters don't explode label cardinality"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    request.environ['formsiq.started'] = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def count_request(response):
+    REQUESTS.inc(endpoint=endpoint_label(), method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # Runs once a streamed body is fully sent, so streaming latency covers the whole stream
+    started = request.environ.pop('formsiq.started', None)
+    if started is not None:
+        IN_FLIGHT.dec()
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint_label())
+
+def overloaded_response(error):
+    """429 with Retry-After, as the ASGI app answers ModelOverloaded"""
+    response = jsonify({'error': str(error), 'overloaded': True})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 @app.route('/extract-fields', methods=['POST'])
 def extract_form_fields():
     try:
-        print("Received request")
         data = request.get_json()
         
         if not data or 'transcript' not in data:
-            print("Invalid input format")
             return jsonify({'error': 'Invalid input format'}), 400
+        try:
+            fields = parse_fields_param(data.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        print(f"Processing transcript: {data['transcript']}")
-        result = extract_fields_with_gemini(data['transcript'])
-        
-        print(f"Returning result: {result}")
+        started = time.perf_counter()
+        with request_deadline(REQUEST_TIMEOUT):
+            result = extract_fields_with_gemini(data['transcript'], fields)
+        store_result(data['transcript'], fields, result, started)
+        logger.info("Extracted fields", extra={
+            "transcript_chars": len(data['transcript']),
+            "fields": len(result['fields']),
+            "cached": result['cached']
+        })
         return jsonify(result)
-        
+
+    except ModelOverloaded as e:
+        return overloaded_response(e)
+    except ExtractionFailed as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        record_error('request', e)
+        logger.exception("Request failed")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/extract-fields/stream', methods=['POST'])
+def extract_form_fields_stream():
+    """Stream extracted fields as newline-delimited JSON events"""
+    data = request.get_json(silent=True)
+    if not data or 'transcript' not in data:
+        return jsonify({'error': 'Invalid input format'}), 400
+    try:
+        fields = parse_fields_param(data.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def events():
+        with request_deadline(REQUEST_TIMEOUT):
+            yield from stream_fields(data['transcript'], fields)
+
+    return Response(stream_with_context(json.dumps(event) + '\n' for event in events()),
+                    mimetype='application/x-ndjson')
+
+@app.route('/extract-fields/batch', methods=['POST'])
+def extract_form_fields_batch():
+    try:
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('transcripts'), list):
+            return jsonify({'error': 'Invalid input format'}), 400
+        if len(data['transcripts']) > BATCH_MAX_TRANSCRIPTS:
+            return jsonify({'error': f'At most {BATCH_MAX_TRANSCRIPTS} transcripts per batch'}), 400
+        try:
+            fields = parse_fields_param(data.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with request_deadline(REQUEST_TIMEOUT):
+            results = extract_fields_batch(data['transcripts'], fields)
+        logger.info("Extracted batch", extra={
+            "transcripts": len(results),
+            "failed": sum(1 for result in results if 'error' in result)
+        })
+        return jsonify({'results': results})
+
+    except Exception as e:
+        record_error('request', e)
+        logger.exception("Batch request failed")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue transcripts for background extraction.
+
+    Accepts {"transcripts": [...]} as JSON, a JSONL body (application/x-ndjson or
+    application/jsonl), or a JSONL file uploaded as the multipart field "file".
+    """
+    try:
+        if 'file' in request.files:
+            items = parse_jsonl(request.files['file'].read().decode('utf-8'))
+        elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            items = parse_jsonl(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get('transcripts'), list):
+                return jsonify({'error': 'Invalid input format'}), 400
+            items = parse_transcripts(data['transcripts'])
+    except (InvalidJobInput, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not items:
+        return jsonify({'error': 'No transcripts in job'}), 400
+    if len(items) > JOB_MAX_TRANSCRIPTS:
+        return jsonify({'error': f'At most {JOB_MAX_TRANSCRIPTS} transcripts per job'}), 400
+
+    job_id = job_store.create_job(items)
+    start_job_workers()
+    job_queue.notify()
+    logger.info("Queued job", extra={"job_id": job_id, "transcripts": len(items)})
+    return jsonify(job_store.get_job(job_id)), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_store.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    start_job_workers()
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """Stream the job's finished items as NDJSON, in input order"""
+    if job_store.get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    results = job_store.results(job_id)
+    return Response(stream_with_context(json.dumps(result) + '\n' for result in results),
+                    mimetype='application/x-ndjson')
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Open a live call session; text is then appended with POST /sessions/<id>/transcript"""
+    data = request.get_json(silent=True) or {}
+    try:
+        fields = parse_fields_param(data.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        session = session_store.create(fields)
+    except SessionLimitExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    logger.info("Opened session", extra={"session_id": session.id})
+    return jsonify(session_store.describe(session)), 201
+
+@app.route('/sessions/<session_id>/transcript', methods=['POST'])
+def append_session_transcript(session_id):
+    """Append a transcript delta ({"text": ..., "flush": false}) and return the session's fields.
+
+    An append that fails is not stored, so the client can send the same delta again.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('text'), str):
+        return jsonify({'error': 'Invalid input format'}), 400
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    if len(session.transcript) + len(data['text']) > session_store.max_chars:
+        return jsonify({'error': f'Session transcripts are limited to {session_store.max_chars} characters'}), 413
+    if not session.lock.acquire(blocking=False):
+        return jsonify({'error': 'Session is being updated by another request'}), 409
+    try:
+        with request_deadline(REQUEST_TIMEOUT):
+            path = update_session(session, data['text'], bool(data.get('flush')))
+        session_store.save(session)
+    except SessionConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except ModelOverloaded as e:
+        session_store.discard(session_id)
+        return overloaded_response(e)
     except Exception as e:
-        print(f"Error: {str(e)}")
+        session_store.discard(session_id)
+        record_error('request', e)
+        logger.exception("Session update failed", extra={"session_id": session_id})
         return jsonify({'error': str(e)}), 500
+    finally:
+        session.lock.release()
+
+    SESSION_UPDATES.inc(path=path)
+    logger.info("Updated session", extra={
+        "session_id": session_id,
+        "delta_chars": len(data['text']),
+        "path": path
+    })
+    return jsonify(session_store.describe(session))
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(session_store.describe(session))
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not session_store.delete(session_id):
+        return jsonify({'error': 'Session not found'}), 404
+    logger.info("Closed session", extra={"session_id": session_id})
+    return '', 204
+
+@app.route('/results', methods=['GET'])
+def query_results():
+    """Stored extraction results, filtered by borrower, address, transcript hash and time range"""
+    if result_store is None:
+        return jsonify({'error': 'Result store is not enabled (set RESULT_DB)'}), 404
+    try:
+        since, until = (parse_timestamp(request.args.get(name)) for name in ('since', 'until'))
+        limit = int(request.args.get('limit', '100'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not 0 < limit <= RESULT_QUERY_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {RESULT_QUERY_MAX_LIMIT}'}), 400
+    results = result_store.query(borrower=request.args.get('borrower'), address=request.args.get('address'),
+                                 since=since, until=until, transcript_hash=request.args.get('transcript_hash'),
+                                 limit=limit)
+    return jsonify({'results': results})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(extraction_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics for this process, or for every worker when they share them"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once this process has warmed up, 503 (with the reason) until then"""
+    if not warm_up():
+        return jsonify({'status': 'not ready', 'error': warm_up_error}), 503
+    return jsonify({
+        'status': 'ready',
+        'startup_seconds': {phase: STARTUP_SECONDS.value(phase=phase) for phase in ('import', 'warm_up')}
+    })
+
+STARTUP_SECONDS.set(time.perf_counter() - IMPORT_STARTED, phase='import')
 
 if __name__ == '__main__':
-    print("Starting server...")
-    app.run(debug=True, port=8000)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    logger.info("Starting development server")
+    start_job_workers()
+    start_warm_up()
+    app.run(debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true', port=8000)
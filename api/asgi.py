@@ -0,0 +1,110 @@
+"""ASGI entry point: serves /extract-fields on asyncio, everything else through Flask.
+
+Run with:
+    uvicorn api.asgi:app --host 0.0.0.0 --port 8000
+
+Model calls on /extract-fields go through the shared AsyncModelClient, so a slow model
+response no longer pins a worker thread. When the client's queue is full the request is
+answered with 429 and a Retry-After header.
+"""
+import asyncio
+import json
+import time
+from asgiref.wsgi import WsgiToAsgi
+from api.app import (REQUEST_TIMEOUT, ExtractionFailed, app as flask_app, extract_fields_async,
+                     parse_fields_param, start_warm_up, store_result)
+from api.deadline import request_deadline
+from api.async_client import ModelOverloaded
+from api.metrics import IN_FLIGHT, REQUEST_LATENCY, REQUESTS, record_error
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError('Request body too large')
+        if not message.get('more_body', False):
+            return body
+
+async def _send_json(send, status, payload, headers=()):
+    REQUESTS.inc(endpoint='/extract-fields', method='POST', status=status)
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'access-control-allow-origin', b'*'),
+                    *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_warm_up()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def extract_form_fields(receive, send):
+    try:
+        data = json.loads(await _read_body(receive) or b'null')
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or not isinstance(data.get('transcript'), str):
+        await _send_json(send, 400, {'error': 'Invalid input format'})
+        return
+    try:
+        fields = parse_fields_param(data.get('fields'))
+    except ValueError as e:
+        await _send_json(send, 400, {'error': str(e)})
+        return
+
+    started = time.perf_counter()
+    try:
+        with request_deadline(REQUEST_TIMEOUT):
+            result = await extract_fields_async(data['transcript'], fields)
+    except ModelOverloaded as e:
+        await _send_json(send, 429, {'error': str(e), 'overloaded': True},
+                         headers=[(b'retry-after', str(e.retry_after).encode())])
+        return
+    except ExtractionFailed as e:
+        await _send_json(send, e.status, {'error': str(e)})
+        return
+    except Exception as e:
+        record_error('request', e)
+        await _send_json(send, 500, {'error': str(e)})
+        return
+
+    # A sqlite write: off the event loop, like the cache and fast path in extract_fields_async
+    await asyncio.to_thread(store_result, data['transcript'], fields, result, started)
+    await _send_json(send, 200, result)
+
+class AsyncExtractionApp:
+    """Routes POST /extract-fields to the async path and delegates the rest to a WSGI app"""
+
+    def __init__(self, wsgi_app):
+        self.fallback = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await _lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == '/extract-fields' and scope['method'] == 'POST':
+            started = time.perf_counter()
+            IN_FLIGHT.inc()
+            try:
+                await extract_form_fields(receive, send)
+            finally:
+                IN_FLIGHT.dec()
+                REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint='/extract-fields')
+        else:
+            await self.fallback(scope, receive, send)
+
+app = AsyncExtractionApp(flask_app)
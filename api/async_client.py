@@ -0,0 +1,56 @@
+"""Asyncio model client with bounded concurrency and queue backpressure"""
+import asyncio
+from api.deadline import within_deadline
+
+class ModelOverloaded(Exception):
+    """Raised when the model client cannot accept more work right now"""
+
+    def __init__(self, message="Model client is overloaded", retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AsyncModelClient:
+    """Wraps a model exposing ``generate_content_async`` behind a concurrency semaphore.
+
+    At most ``max_concurrency`` calls run at once and at most ``max_queue`` more wait for a
+    slot; anything beyond that is rejected immediately with ModelOverloaded so callers can
+    answer 429 instead of piling up requests. The wrapped model object is reused for
+    every call, so its underlying connection pool is shared.
+    """
+
+    def __init__(self, model, max_concurrency=8, max_queue=32, retry_after=1):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.pending = 0
+        self.running = 0
+        self._semaphore = None
+
+    @property
+    def queued(self):
+        """Calls waiting for a concurrency slot"""
+        return self.pending - self.running
+
+    async def generate_content(self, prompt, **kwargs):
+        if self.pending >= self.max_concurrency + self.max_queue:
+            raise ModelOverloaded(retry_after=self.retry_after)
+
+        # Created on first use so it binds to the serving event loop, not the importing one
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.pending += 1
+        try:
+            # Waiting for a slot counts against the request deadline like the call itself
+            await within_deadline(self._semaphore.acquire())
+            try:
+                self.running += 1
+                try:
+                    return await self.model.generate_content_async(prompt, **kwargs)
+                finally:
+                    self.running -= 1
+            finally:
+                self._semaphore.release()
+        finally:
+            self.pending -= 1
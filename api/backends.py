@@ -0,0 +1,228 @@
+"""Model backends for field extraction.
+
+Every backend exposes ``generate_content(prompt)`` and ``generate_content_async(prompt)``
+returning an object with a ``.text`` attribute, the same surface as
+``genai.GenerativeModel``. Pick one with the MODEL_BACKEND environment variable:
+
+- ``gemini`` (default): Google Gemini, needs GOOGLE_API_KEY. The SDK is imported and the
+  client built on first use or by ``warm_up()``, not when the backend is created.
+- ``fake``: deterministic local stub that answers from regexes over the transcript, with
+  configurable latency and error rate, for offline tests and load testing.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from api.deadline import bounded_timeout
+from api.prompts import RESULT_DELIMITER, fields_in_prompt, transcripts_in_prompt
+from api.structured import wants_json
+
+class ModelResponse:
+    """Minimal response object mirroring the parts of a Gemini response we use"""
+
+    def __init__(self, text, prompt_tokens=0, output_tokens=0):
+        self.text = text
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+class ModelBackend:
+    """Base class for model backends"""
+    name = 'base'
+    model_name = None
+
+    def generate_content(self, prompt, **kwargs):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Do the one-time setup a first call would otherwise pay for; raises if the backend can't serve"""
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.generate_content(prompt, **kwargs)
+        )
+
+class GeminiBackend(ModelBackend):
+    name = 'gemini'
+
+    def __init__(self, model_name='gemini-1.5-pro', api_key=None, timeout=None):
+        self.model_name = model_name
+        self.timeout = timeout
+        self._api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The genai.GenerativeModel, built on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    api_key = self._api_key or os.getenv('GOOGLE_API_KEY')
+                    if not api_key:
+                        raise ValueError("No API key found in .env file")
+                    # Imported here rather than at module load: the SDK is most of the API's import time
+                    import google.generativeai as genai
+                    genai.configure(api_key=api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def warm_up(self):
+        self.model
+
+    def _with_timeout(self, kwargs):
+        # A per-call deadline, so one hung call can't hold a worker thread indefinitely, cut
+        # short when the request's own deadline (api/deadline.py) comes sooner
+        timeout = bounded_timeout(self.timeout)
+        if timeout:
+            kwargs.setdefault('request_options', {'timeout': timeout})
+        return kwargs
+
+    def generate_content(self, prompt, **kwargs):
+        return self.model.generate_content(prompt, **self._with_timeout(kwargs))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return await self.model.generate_content_async(prompt, **self._with_timeout(kwargs))
+
+class FakeBackendError(Exception):
+    """Injected failure from the fake backend, standing in for a transient model error"""
+
+# Cues the fake backend uses to pull 'Field: Value' answers out of a transcript
+NAME = r"([A-Z][a-z]+(?:[ \-][A-Z][a-z'\-]+)+)"
+MONEY = r"(\$\d{1,3}(?:,\d{3})+(?:\.\d{2})?)"
+FAKE_FIELD_RULES = {
+    "Borrower Name": re.compile(
+        r"(?:name(?:'s| is)|name:|I'm|I am|this is|speaking with|talking to|borrower)\s+" + NAME),
+    "Loan Amount": re.compile(
+        MONEY + r"\s+(?:loan|mortgage)\b|(?:loan|mortgage|borrow|amount)\b[^$\n]{0,40}?" + MONEY, re.IGNORECASE),
+    "Property Address": re.compile(
+        r"\b(\d+\s+(?:[A-Z][A-Za-z]*\s+)+(?:Street|St|Avenue|Ave|Boulevard|Blvd|Road|Rd|Lane|Ln|"
+        r"Drive|Dr|Court|Ct|Circle|Way|Place|Pl)\b\.?(?:,\s*[A-Z][A-Za-z ]*)*)"),
+    "Annual Income": re.compile(
+        r"(?:income|make|making|earn(?:ing)?|salary)\b[^$\n]{0,40}?" + MONEY, re.IGNORECASE),
+    "Employment Info": re.compile(r"(?:work(?:s|ing)?|employed)\s+(?:at|for|with)\s+([A-Z][\w&\-]*(?: [A-Z][\w&\-]*)*)"),
+    "Property Type": re.compile(r"\b(single[- ]family|condo|townhouse|multi[- ]family|manufactured)\b", re.IGNORECASE),
+    "Loan Purpose": re.compile(r"\b(refinanc|purchas|buy)", re.IGNORECASE),
+}
+LOAN_PURPOSES = {"refinanc": "Refinance", "purchas": "Purchase", "buy": "Purchase"}
+
+class FakeBackend(ModelBackend):
+    """Deterministic offline stand-in for the model.
+
+    Args:
+        latency: Seconds each call sleeps, simulating model latency.
+        jitter: Extra uniformly random seconds added to each call.
+        error_rate: Probability in [0, 1] that a call raises FakeBackendError.
+        canned_response: Fixed response text; when None, answers are derived from the
+            transcript(s) embedded in the prompt with FAKE_FIELD_RULES, as JSON when the
+            call's ``generation_config`` asks for it.
+        seed: Seed for the jitter and error draws, so runs are reproducible.
+    """
+    name = 'fake'
+    STREAM_CHUNK_SIZE = 16
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, canned_response=None,
+                 seed=0, model_name='fake'):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.canned_response = canned_response
+        self.model_name = model_name
+        self._random = random.Random(seed)
+
+    def _draw(self):
+        """Pick this call's delay and whether it fails"""
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        return delay, failed
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        delay, failed = self._draw()
+        if stream:
+            return self._stream(prompt, delay, failed, kwargs.get('generation_config'))
+        if delay:
+            time.sleep(delay)
+        return self._respond(prompt, failed, kwargs.get('generation_config'))
+
+    def _stream(self, prompt, delay, failed, generation_config=None):
+        """Yield the response in STREAM_CHUNK_SIZE pieces, spreading the delay across them"""
+        text = self._respond(prompt, failed, generation_config).text
+        chunks = [text[i:i + self.STREAM_CHUNK_SIZE] for i in range(0, len(text), self.STREAM_CHUNK_SIZE)]
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay / len(chunks))
+            yield ModelResponse(chunk)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        delay, failed = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(prompt, failed, kwargs.get('generation_config'))
+
+    def _respond(self, prompt, failed, generation_config=None):
+        if failed:
+            raise FakeBackendError("503 Fake backend injected failure")
+        if self.canned_response is not None:
+            text = self.canned_response
+        else:
+            transcripts = transcripts_in_prompt(prompt)
+            if wants_json(generation_config):
+                fields = fields_in_prompt(prompt)
+                if isinstance(transcripts, str):
+                    text = json.dumps(find_fields(transcripts, fields))
+                else:
+                    text = json.dumps([find_fields(transcript, fields) for transcript in transcripts])
+            elif isinstance(transcripts, str):
+                text = answer_fields(transcripts, fields_in_prompt(prompt))
+            else:
+                fields = fields_in_prompt(prompt)
+                text = "\n".join(f"{RESULT_DELIMITER.format(number=number)}\n{answer_fields(transcript, fields)}"
+                                 for number, transcript in enumerate(transcripts, start=1))
+        return ModelResponse(text, prompt_tokens=len(prompt) // 4, output_tokens=len(text) // 4)
+
+def find_fields(transcript, fields=None):
+    """Map the requested (default: all) Form 1003 fields to the value found, or None"""
+    found_fields = {}
+    for field_name, rule in FAKE_FIELD_RULES.items():
+        if fields is not None and field_name not in fields:
+            continue
+        match = rule.search(transcript)
+        found = next((group for group in match.groups() if group), None) if match else None
+        if not found:
+            value = None
+        elif field_name == "Loan Purpose":
+            value = LOAN_PURPOSES[found.lower()]
+        elif field_name == "Property Type":
+            value = found.replace(' ', '-').title()
+        else:
+            value = found.strip().rstrip('.,')
+        found_fields[field_name] = value
+    return found_fields
+
+def answer_fields(transcript, fields=None):
+    """Render 'Field: Value' lines for the requested (default: all) Form 1003 fields"""
+    return "".join(f"{field_name}: {value or 'Not specified'}\n"
+                   for field_name, value in find_fields(transcript, fields).items())
+
+def create_backend(name=None, model_name=None):
+    """Build the backend selected by ``name`` or the MODEL_BACKEND environment variable"""
+    name = (name or os.getenv('MODEL_BACKEND', 'gemini')).lower()
+    if name == 'gemini':
+        return GeminiBackend(model_name or os.getenv('GEMINI_MODEL', 'gemini-1.5-pro'),
+                             timeout=float(os.getenv('MODEL_TIMEOUT', '60')) or None)
+    if name == 'fake':
+        canned_response = None
+        if os.getenv('FAKE_MODEL_RESPONSE_FILE'):
+            with open(os.getenv('FAKE_MODEL_RESPONSE_FILE')) as f:
+                canned_response = f.read()
+        return FakeBackend(
+            latency=float(os.getenv('FAKE_MODEL_LATENCY', '0')),
+            jitter=float(os.getenv('FAKE_MODEL_JITTER', '0')),
+            error_rate=float(os.getenv('FAKE_MODEL_ERROR_RATE', '0')),
+            canned_response=canned_response,
+            seed=int(os.getenv('FAKE_MODEL_SEED', '0')),
+            model_name=model_name or 'fake'
+        )
+    raise ValueError(f"Unknown model backend: {name}")
@@ -0,0 +1,205 @@
+"""Bulk extraction from the command line, without going through HTTP.
+
+    python -m api.bulk calls.jsonl --output results.jsonl --workers 16
+    python -m api.bulk calls.csv --output results.jsonl --processes 4
+
+Input is JSONL (one {"transcript": ..., "id": ...} object or bare string per line) or CSV
+with a transcript column, read as a stream. Results are appended to the output JSONL as
+they complete, in the /extract-fields/batch result format plus the record's "id".
+
+Progress is checkpointed next to the output file. Rerunning the same command after an
+interruption truncates the output back to the last checkpoint and skips every record
+already written, so a large run resumes where it stopped.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from api.logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+def read_records(path, transcript_column='transcript', id_column='id'):
+    """Yield (index, transcript, id, error) for every record of a JSONL or CSV file.
+
+    ``transcript`` is None and ``error`` is set for records that can't be read.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from iter_records(f, path.lower().endswith('.csv'), transcript_column, id_column)
+
+def iter_records(lines, is_csv=False, transcript_column='transcript', id_column='id'):
+    """read_records over an open text file (or any iterable of lines)"""
+    if is_csv:
+        reader = csv.DictReader(lines)
+        if transcript_column not in (reader.fieldnames or []):
+            raise ValueError(f"CSV has no '{transcript_column}' column")
+        for index, row in enumerate(reader):
+            yield index, row[transcript_column], row.get(id_column) or None, None
+        return
+
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield index, None, None, "Record is not valid JSON"
+        else:
+            if isinstance(record, str):
+                yield index, record, None, None
+            elif isinstance(record, dict) and isinstance(record.get(transcript_column), str):
+                item_id = record.get(id_column)
+                yield index, record[transcript_column], None if item_id is None else str(item_id), None
+            else:
+                yield index, None, None, "Record has no transcript string"
+        index += 1
+
+class Checkpoint:
+    """Which records are already in the output file, and how many output bytes they cover.
+
+    Stored as JSON: every index below ``next_index`` is done, plus the ``done`` indexes
+    above it (results complete out of order). Saved atomically with os.replace.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.next_index = 0
+        self.done = set()
+        self.output_bytes = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.next_index = state['next_index']
+            self.done = set(state['done'])
+            self.output_bytes = state['output_bytes']
+
+    def is_done(self, index):
+        return index < self.next_index or index in self.done
+
+    def mark(self, index):
+        self.done.add(index)
+        while self.next_index in self.done:
+            self.done.remove(self.next_index)
+            self.next_index += 1
+
+    def save(self, output_bytes):
+        self.output_bytes = output_bytes
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'next_index': self.next_index, 'done': sorted(self.done),
+                       'output_bytes': output_bytes}, f)
+        os.replace(temporary, self.path)
+
+    @property
+    def completed(self):
+        return self.next_index + len(self.done)
+
+def extract_record(transcript, max_attempts=3, base_delay=1.0, max_delay=30.0):
+    """Run extract_fields_bulk on one transcript, retrying failures with exponential backoff and jitter"""
+    # Imported here so process-pool workers build their own model client and cache
+    from api.app import extract_fields_bulk
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return extract_fields_bulk(transcript)
+        except Exception as e:
+            if attempt == max_attempts:
+                return {"error": f"{type(e).__name__}: {e}", "attempts": attempt}
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1))))
+
+def run(input_path, output_path, checkpoint_path=None, workers=8, processes=0, max_attempts=3,
+        base_delay=1.0, checkpoint_every=100, transcript_column='transcript', id_column='id'):
+    """Extract every record of ``input_path`` not yet in the checkpoint. Returns the number processed."""
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+    if not os.path.exists(checkpoint_path) and os.path.exists(output_path) and os.path.getsize(output_path):
+        raise FileExistsError(f"{output_path} already has results but no checkpoint at {checkpoint_path}")
+    checkpoint = Checkpoint(checkpoint_path)
+    executor = ProcessPoolExecutor(processes) if processes else ThreadPoolExecutor(workers)
+    max_pending = (processes or workers) * 4
+    pending, processed, started = {}, 0, time.perf_counter()
+
+    with open(output_path, 'a+b') as output:
+        # Anything written after the last checkpoint is redone, so drop it
+        output.truncate(checkpoint.output_bytes)
+        output.seek(checkpoint.output_bytes)
+
+        def write(index, item_id, result):
+            nonlocal processed
+            entry = {"index": index, **({"id": item_id} if item_id is not None else {}), **result}
+            output.write((json.dumps(entry) + '\n').encode('utf-8'))
+            checkpoint.mark(index)
+            processed += 1
+            if processed % checkpoint_every == 0:
+                output.flush()
+                checkpoint.save(output.tell())
+                logger.info("Bulk extraction progress", extra={
+                    "completed": checkpoint.completed,
+                    "per_second": round(processed / (time.perf_counter() - started), 2)
+                })
+
+        def drain(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                index, item_id = pending.pop(future)
+                write(index, item_id, future.result())
+
+        try:
+            for index, transcript, item_id, error in read_records(input_path, transcript_column, id_column):
+                if checkpoint.is_done(index):
+                    continue
+                if error:
+                    write(index, item_id, {"error": error})
+                    continue
+                future = executor.submit(extract_record, transcript, max_attempts, base_delay)
+                pending[future] = (index, item_id)
+                if len(pending) >= max_pending:
+                    drain(FIRST_COMPLETED)
+            if pending:
+                drain(ALL_COMPLETED)
+        finally:
+            # On interruption keep what finished; unfinished records are redone on the next run
+            executor.shutdown(wait=False, cancel_futures=True)
+            output.flush()
+            checkpoint.save(output.tell())
+    return processed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('input', help='JSONL or CSV file of transcripts')
+    parser.add_argument('--output', required=True, help='JSONL file results are appended to')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: <output>.checkpoint)')
+    parser.add_argument('--workers', type=int, default=8, help='extraction threads')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='use this many worker processes instead of threads')
+    parser.add_argument('--max-attempts', type=int, default=3, help='attempts per transcript on model errors')
+    parser.add_argument('--retry-delay', type=float, default=1.0, help='backoff before the first retry, in seconds')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='records between checkpoints')
+    parser.add_argument('--transcript-column', default='transcript', help='transcript key or CSV column')
+    parser.add_argument('--id-column', default='id', help='record id key or CSV column')
+    args = parser.parse_args(argv)
+    # With --processes this process never imports api.app, which is what configures logging
+    # for the API, so progress and errors logged here would otherwise be dropped
+    load_dotenv()
+    configure_logging()
+
+    try:
+        processed = run(args.input, args.output, args.checkpoint, args.workers, args.processes,
+                        args.max_attempts, args.retry_delay, args.checkpoint_every,
+                        args.transcript_column, args.id_column)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Processed {processed} transcripts into {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Content-addressed cache for extraction results.
+
+Entries are keyed by a hash of the normalized transcript, the model name and the prompt
+version, so a new prompt version never serves results produced by an older prompt. The
+API's prompt version also covers the settings that change its prompts or answer format
+(see CACHE_VERSION in api/app.py).
+The in-process LRU tier is always on; an sqlite tier can be added to share results
+across restarts and workers.
+
+Writes to the sqlite tier stay cheap as it fills up. Rows over the size bound are
+deleted in batches, oldest first along the accessed_at index, and only once a cached row
+count says the bound was crossed. Disk hits only refresh accessed_at once it is more than
+ACCESS_REFRESH_SECONDS old.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+WHITESPACE = re.compile(r'\s+')
+# A disk hit leaves a row's accessed_at alone if it was refreshed more recently than this
+ACCESS_REFRESH_SECONDS = 60
+# Share of max_db_entries deleted at once when the disk tier is over its bound
+TRIM_FRACTION = 0.01
+
+def normalize_transcript(transcript):
+    """Collapse whitespace so formatting-only differences hit the same entry"""
+    return WHITESPACE.sub(' ', transcript).strip()
+
+def cache_key(transcript, model_name, prompt_version, fields=None):
+    """Hash of the normalized transcript plus everything that changes the model output.
+
+    ``fields`` is the requested field subset, if any; None means every field.
+    """
+    parts = [normalize_transcript(transcript), model_name, prompt_version]
+    if fields:
+        parts.append(sorted(fields))
+    payload = json.dumps(parts)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ExtractionCache:
+    """Two-tier LRU/TTL cache for extraction results.
+
+    Args:
+        max_entries: Size of the in-process LRU tier; 0 disables caching entirely.
+        ttl_seconds: Age after which an entry is treated as missing in both tiers.
+        db_path: Optional sqlite file for the on-disk tier.
+        max_db_entries: Size bound of the on-disk tier; least recently used rows go first.
+            Rows written by other processes are counted every ``max_db_entries *
+            TRIM_FRACTION`` writes, so with several writers the tier can briefly exceed it
+            by that much per process.
+        prompt_version: Rows stored under any other prompt version are purged on open.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400, db_path=None,
+                 max_db_entries=100000, prompt_version=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.trim_batch = max(1, int(max_db_entries * TRIM_FRACTION))
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path and max_entries > 0:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                " key TEXT PRIMARY KEY, prompt_version TEXT, value TEXT,"
+                " created_at REAL, accessed_at REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS extraction_cache_accessed ON extraction_cache (accessed_at)"
+            )
+            self._db.execute(
+                "DELETE FROM extraction_cache WHERE prompt_version IS NOT ?", (str(prompt_version),)
+            )
+            self._db.commit()
+            self._count_rows()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None, counting the hit or miss"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at, accessed_at FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        if now - row[2] > ACCESS_REFRESH_SECONDS:
+                            self._db.execute(
+                                "UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                            )
+                            self._db.commit()
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self.hits += 1
+                        return value
+                    self._db.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._db_rows -= 1
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store a JSON-serializable ``value`` in both tiers"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                replaced = self._db.execute(
+                    "SELECT 1 FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extraction_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, str(self.prompt_version), json.dumps(value), now, now)
+                )
+                self._db.commit()
+                if not replaced:
+                    self._db_rows += 1
+                    self._unchecked_rows += 1
+                    if self._db_rows > self.max_db_entries or self._unchecked_rows >= self.trim_batch:
+                        self._trim()
+
+    def _count_rows(self):
+        """Read the disk tier's row count (callers hold _lock, or own the cache)"""
+        self._db_rows = self._db.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+        self._unchecked_rows = 0
+
+    def _trim(self):
+        """Recount the disk tier, which other processes may have written to, and delete the
+        least recently used rows if it is over max_db_entries, so that it next goes over
+        ``trim_batch`` writes later (callers hold _lock)"""
+        self._count_rows()
+        if self._db_rows <= self.max_db_entries:
+            return
+        excess = self._db_rows - (self.max_db_entries - self.trim_batch + 1)
+        self._db.execute(
+            "DELETE FROM extraction_cache WHERE key IN ("
+            " SELECT key FROM extraction_cache ORDER BY accessed_at LIMIT ?)",
+            (excess,)
+        )
+        self._db.commit()
+        self._db_rows -= excess
+
+    def _remember(self, key, created_at, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM extraction_cache")
+                self._db.commit()
+                self._count_rows()
+
+    def close(self):
+        """Close the sqlite tier; the in-process tier keeps working"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "prompt_version": self.prompt_version,
+            }
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute(
+                    "SELECT COUNT(*) FROM extraction_cache"
+                ).fetchone()[0]
+            return stats
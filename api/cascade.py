@@ -0,0 +1,69 @@
+"""Multi-model cascade: ask a fast model first, and a stronger one only where needed.
+
+Tiers are tried in order, cheapest first. Every tier's answers are scored with
+calculate_confidence; a field whose score is below its threshold is asked again of the next
+tier, and only those fields are. Fields a tier doesn't find at all aren't escalated: most
+transcripts don't mention every field, and asking the next tier for all of them would cost
+a call on nearly every transcript.
+
+The merged result records the tier that produced each field under "tier". A later tier's
+answer replaces the earlier one; when the later tier finds nothing, the earlier answer is
+kept with its (low) score, so the caller can still see and judge it. When the last tier
+fails, the fields it was asked for keep the earlier answers and are marked "degraded":
+they weren't checked by the tier meant to check them, so they aren't cached either.
+"""
+from api.fields import FORM_1003_FIELDS
+
+class ModelTier:
+    """One model of the cascade.
+
+    Args:
+        name: Reported in each field's "tier".
+        model: Sync model client (a ModelScheduler or anything with its surface).
+        async_client: AsyncModelClient over ``model``, for the asyncio serving path.
+    """
+
+    def __init__(self, name, model, async_client=None):
+        self.name = name
+        self.model = model
+        self.async_client = async_client
+
+    @property
+    def model_name(self):
+        return self.model.model_name
+
+def parse_thresholds(text):
+    """Per-field thresholds from "Field Name=0.9;Other Field=0.7"; raises ValueError for bad entries"""
+    thresholds = {}
+    for entry in filter(None, (part.strip() for part in (text or '').split(';'))):
+        field_name, sep, value = entry.partition('=')
+        field_name = field_name.strip()
+        if not sep or field_name not in FORM_1003_FIELDS:
+            raise ValueError(f"Invalid cascade threshold: {entry}")
+        thresholds[field_name] = float(value)
+    return thresholds
+
+def cascade_model_name(tiers):
+    """Name of the cascade as a whole, for cache keys and stored results"""
+    return '>'.join(tier.model_name for tier in tiers)
+
+def fields_to_escalate(fields, thresholds, default_threshold):
+    """Names of the scored ``fields`` below their threshold, in form order"""
+    low = {field['field_name'] for field in fields
+           if field['confidence_score'] < thresholds.get(field['field_name'], default_threshold)}
+    return [field_name for field_name in FORM_1003_FIELDS if field_name in low]
+
+def merge_tier_fields(merged, fields, tier_name):
+    """Fold one tier's scored ``fields`` into ``merged`` (a dict by field name), tagging their tier"""
+    for field in fields:
+        merged[field['field_name']] = {**field, "tier": tier_name}
+    return merged
+
+def mark_degraded(merged, field_names):
+    """Flag the ``merged`` fields among ``field_names`` (None for all) as degraded"""
+    for field_name in field_names or FORM_1003_FIELDS:
+        if field_name in merged:
+            merged[field_name] = {**merged[field_name], "degraded": True}
+
+def ordered_fields(merged):
+    return [merged[field_name] for field_name in FORM_1003_FIELDS if field_name in merged]
@@ -0,0 +1,104 @@
+"""Splitting long transcripts into chunks and merging per-chunk extractions.
+
+Chunks follow speaker turns (one turn per line) and are packed up to a character budget,
+with the last turns of each chunk repeated at the start of the next so a field mentioned
+across a boundary is still seen whole by one chunk.
+"""
+import re
+
+# Rough characters-per-token ratio for English transcripts
+CHARS_PER_TOKEN = 4
+# Candidates this far below the best confidence for a field are not considered
+CONFIDENCE_MARGIN = 0.2
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+def _split_long_turn(turn, max_chars):
+    """Break a turn longer than the budget at sentence ends, or hard-split as a last resort"""
+    pieces, current = [], ''
+    for sentence in SENTENCE_BREAK.split(turn):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_transcript(transcript, max_tokens=2000, overlap_tokens=200):
+    """Split a transcript into chunks of at most ``max_tokens`` (estimated) each.
+
+    Consecutive chunks share up to ``overlap_tokens`` worth of whole turns.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+    turns = [piece for line in transcript.split('\n') if line.strip()
+             for piece in _split_long_turn(line.strip(), max_chars)]
+
+    chunks, current, size = [], [], 0
+    for turn in turns:
+        if current and size + len(turn) + 1 > max_chars:
+            chunks.append(current)
+            # Carry trailing turns over as context for the next chunk
+            carried, size = [], 0
+            for previous in reversed(current):
+                if (size + len(previous) + 1 > overlap_chars
+                        or size + len(previous) + len(turn) + 2 > max_chars):
+                    break
+                carried.insert(0, previous)
+                size += len(previous) + 1
+            current = carried
+        current.append(turn)
+        size += len(turn) + 1
+    if current:
+        chunks.append(current)
+    return ['\n'.join(chunk) for chunk in chunks]
+
+def normalize_value(value):
+    """Comparison key for field values: case, spacing and punctuation are ignored"""
+    return NON_ALPHANUMERIC.sub('', value.lower())
+
+def merge_chunk_fields(chunk_fields):
+    """Merge per-chunk field lists into one field per name.
+
+    ``chunk_fields`` holds one field list per chunk, in transcript order. Candidates within
+    CONFIDENCE_MARGIN of the best confidence compete; the one from the latest chunk wins, so
+    corrections late in a call override earlier values. Recency is judged by chunk rather
+    than by searching the transcript for the value, which misses values the model reworded
+    or that were normalized ("four fifty thousand" answered as "$450,000"). Fields whose
+    candidates disagree are marked with "conflict": True and list the alternatives.
+    """
+    candidates = {}
+    for chunk_index, fields in enumerate(chunk_fields):
+        for field in fields:
+            candidates.setdefault(field['field_name'], []).append((chunk_index, field))
+
+    merged = []
+    for field_name, found in candidates.items():
+        best_confidence = max(field['confidence_score'] for _, field in found)
+        contenders = [(chunk_index, field) for chunk_index, field in found
+                      if field['confidence_score'] >= best_confidence - CONFIDENCE_MARGIN]
+
+        winner = dict(max(contenders, key=lambda entry: (entry[0], entry[1]['confidence_score']))[1])
+
+        # Distinct values in order of first appearance, with the best confidence of each
+        values = {}
+        for _, field in found:
+            key = normalize_value(field['field_value'])
+            if key not in values or field['confidence_score'] > values[key]['confidence_score']:
+                values.setdefault(key, {'field_value': field['field_value']})
+                values[key]['confidence_score'] = field['confidence_score']
+        winner['confidence_score'] = values[normalize_value(winner['field_value'])]['confidence_score']
+        if len(values) > 1:
+            winner['conflict'] = True
+            winner['candidates'] = [value['field_value'] for value in values.values()]
+        merged.append(winner)
+    return merged
@@ -0,0 +1,70 @@
+"""Request deadlines shared by every model call a request makes.
+
+A request's model work can be much more than one model call: scheduler retries, JSON
+repair retries, cascade tiers and transcript chunks each make their own. MODEL_TIMEOUT
+bounds a single call; ``request_deadline`` bounds all of them together. Code running in
+the ``with`` block (including threads and tasks started from a copy of its context)
+checks ``time_left()`` before waiting for quota, before each attempt and before sleeping
+between retries, and raises DeadlineExceeded once the deadline has passed.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_deadline = ContextVar('request_deadline', default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before its model calls finished"""
+
+@contextmanager
+def request_deadline(seconds):
+    """Give model calls made in the ``with`` block ``seconds`` from now to finish.
+
+    A falsy ``seconds`` adds no deadline. A nested deadline can shorten the one around it,
+    never extend it.
+    """
+    if not seconds:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_left():
+    """Seconds until the current deadline (0 once it has passed), or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed; returns the time left, or None"""
+    left = time_left()
+    if left == 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left
+
+def bounded_timeout(timeout):
+    """``timeout`` (None for no limit) shortened to the time left before the deadline"""
+    left = check_deadline()
+    if left is None:
+        return timeout
+    return left if not timeout else min(timeout, left)
+
+async def within_deadline(awaitable):
+    """Await ``awaitable``, raising DeadlineExceeded if the deadline passes first"""
+    left = check_deadline()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        if time_left():
+            # The awaitable's own timeout, with time still left to retry it
+            raise
+        raise DeadlineExceeded("Request deadline exceeded") from None
@@ -0,0 +1,258 @@
+"""Form 1003 field definitions and confidence scoring"""
+import re
+from bisect import bisect_left
+
+# Form 1003 specific fields and their patterns
+FORM_1003_FIELDS = {
+    "Borrower Name": {
+        'patterns': [
+            r"borrower(?:'s)?\s+name\s+is\b",
+            r"speaking\s+with\b",
+            r"\b(?:mr|mrs|ms|dr)\.\s+",
+            r"(?:I am|I'm|this is)\s+",
+            r"name\s*:",
+        ],
+        'format': r'^[A-Za-z\s\.-]+$',
+        'section': 'Section I: Borrower Information'
+    },
+    "Loan Amount": {
+        'patterns': [
+            r"loan\s+(?:amount|of|for)\s+",
+            r"requesting\s+(?:a\s+)?(?:loan\s+)?(?:of\s+)?\$?",
+            r"borrow(?:ing)?\s+",
+            r"mortgage\s+(?:of|for)\s+",
+            r"amount\s*:",
+        ],
+        'format': r'^\$?\d{1,3}(?:,\d{3})*(?:\.\d{2})?$',
+        'section': 'Section L: Loan and Property Information'
+    },
+    "Property Address": {
+        'patterns': [
+            r"(?:property|address|located)\s+(?:at|is)\s+",
+            r"looking\s+at\s+",
+            r"buying\s+(?:at|in)\s+",
+            r"address\s*:",
+        ],
+        'format': r'^\d+\s+[A-Za-z0-9\s,\.]+$',
+        'section': 'Section L: Loan and Property Information'
+    },
+    "Annual Income": {
+        'patterns': [
+            r"(?:annual|yearly|base)\s+income\s+(?:is|of)\s+",
+            r"makes\s+",
+            r"earning\s+",
+            r"salary\s+(?:is|of)\s+",
+            r"income\s*:",
+        ],
+        'format': r'^\$?\d{1,3}(?:,\d{3})*(?:\.\d{2})?$',
+        'section': 'Section 1a: Employment Information'
+    },
+    "Employment Info": {
+        'patterns': [
+            r"(?:work(?:s|ing)?|employed)\s+(?:at|with|for)\s+",
+            r"(?:job|position|role)\s+(?:is|as)\s+",
+            r"(?:employer|employment|occupation)\s*:",
+        ],
+        'format': r'^.+$',
+        'section': 'Section 1a: Employment Information'
+    },
+    "Property Type": {
+        'patterns': [
+            r"(?:property|home)\s+(?:is|type)\s+(?:a)?\s+",
+            r"(?:buying|looking at)\s+(?:a)?\s+",
+            r"property\s+type\s*:",
+        ],
+        'format': r'^[A-Za-z\s\-]+$',
+        'section': 'Section L: Loan and Property Information'
+    },
+    "Loan Purpose": {
+        'patterns': [
+            r"(?:looking to|want to|planning to)\s+",
+            r"(?:refinance|purchase|buying)\b",
+            r"purpose\s*:",
+        ],
+        'format': r'^(?:Purchase|Refinance)$',
+        'section': 'Section L: Loan and Property Information'
+    }
+}
+
+# Field pattern index, compiled once at import.
+# Each cue is scanned on its own over the lowercased transcript: without IGNORECASE and
+# with a leading literal, the regex engine can jump between occurrences of that literal,
+# which is several times faster than one merged alternation tried at every position.
+UPPERCASE_ESCAPE = re.compile(r'\\[A-Z]')
+# Characters that IGNORECASE matches to a cue letter but that lowercase to something else
+CASEFOLD_ONLY = re.compile('[\u0131\u017f]')  # dotless i, long s
+
+def _compile_cue(pattern):
+    """Compile a cue as (pattern for lowercased text or None, case-insensitive pattern).
+
+    Lowercasing the source is only equivalent when it has no uppercase escapes like \\S.
+    """
+    lowered = None if UPPERCASE_ESCAPE.search(pattern) else re.compile(pattern.lower())
+    return lowered, re.compile(pattern, re.IGNORECASE)
+
+FIELD_CUES = {
+    field_name: [_compile_cue(p) for p in info['patterns']]
+    for field_name, info in FORM_1003_FIELDS.items()
+}
+FIELD_FORMATS = {
+    field_name: re.compile(info['format'])
+    for field_name, info in FORM_1003_FIELDS.items()
+    if info.get('format')
+}
+DOLLAR_AMOUNT_FORMAT = re.compile(r'^\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?$')
+VALID_PROPERTY_TYPES = ['Single Family', 'Condo', 'Townhouse', 'Multi-Family', 'Manufactured']
+CONTEXT_WINDOW = 50
+# Longest text a cue is expected to match. Appended text is scanned together with this much
+# of the text before it, so cues split across appends are still found.
+RESCAN_CHARS = 256
+
+def _lowered(transcript):
+    """The transcript lowercased, or None when cues can't be matched against it lowercased"""
+    lowered = transcript.lower()
+    if len(lowered) != len(transcript):
+        # Some characters lowercase to several, which would shift positions
+        return None
+    if CASEFOLD_ONLY.search(lowered):
+        return None
+    return lowered
+
+def build_match_index(transcript, fields=None):
+    """Record the (start, end) span of every field pattern hit in the transcript.
+
+    Returns a dict mapping each Form 1003 field name (or each of ``fields``) to a list of
+    spans sorted by start.
+    """
+    lowered = _lowered(transcript)
+    match_index = {}
+    for field_name in (fields or FIELD_CUES):
+        spans = []
+        cues = FIELD_CUES[field_name]
+        for lowered_pattern, pattern in cues:
+            if lowered is not None and lowered_pattern is not None:
+                spans.extend(match.span() for match in lowered_pattern.finditer(lowered))
+            else:
+                spans.extend(match.span() for match in pattern.finditer(transcript))
+        spans.sort()
+        match_index[field_name] = spans
+    return match_index
+
+class IncrementalMatchIndex:
+    """A build_match_index result kept current while text is appended to a transcript.
+
+    ``append`` rescans only the new text plus the last RESCAN_CHARS characters before it,
+    instead of the whole transcript. ``spans`` then equals
+    ``build_match_index(self.transcript, fields)`` as long as no cue matches more than
+    RESCAN_CHARS characters.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or FIELD_CUES)
+        self.transcript = ''
+        self.spans = {field_name: [] for field_name in self.fields}
+        # Spans per cue, each list in finditer order (sorted, non-overlapping)
+        self._cue_spans = {field_name: [[] for _ in FIELD_CUES[field_name]] for field_name in self.fields}
+        self._lowered = ''
+
+    def append(self, text):
+        """Append ``text`` to the transcript and update ``spans``"""
+        resume = max(0, len(self.transcript) - RESCAN_CHARS)
+        self.transcript += text
+        lowered = _lowered(self.transcript)
+        if (lowered is None) != (self._lowered is None):
+            # Spans found in the other text are no use; start over
+            resume = 0
+        self._lowered = lowered
+
+        for field_name in self.fields:
+            for cue_spans, (lowered_pattern, pattern) in zip(self._cue_spans[field_name], FIELD_CUES[field_name]):
+                # Matches reaching into the rescanned tail may change with the new text
+                start = resume
+                while cue_spans and cue_spans[-1][1] > resume:
+                    start = cue_spans.pop()[0]
+                start = max(min(start, resume), cue_spans[-1][1] if cue_spans else 0)
+                if lowered is not None and lowered_pattern is not None:
+                    cue_spans.extend(match.span() for match in lowered_pattern.finditer(lowered, start))
+                else:
+                    cue_spans.extend(match.span() for match in pattern.finditer(self.transcript, start))
+            self.spans[field_name] = sorted(span for cue_spans in self._cue_spans[field_name] for span in cue_spans)
+        return self.spans
+
+def _has_span_within(spans, start, end, count=1):
+    """Check whether at least ``count`` spans lie fully inside [start, end)"""
+    i = bisect_left(spans, (start, -1))
+    while i < len(spans) and spans[i][0] < end:
+        if spans[i][1] <= end:
+            count -= 1
+            if not count:
+                return True
+        i += 1
+    return False
+
+def value_checks(field_name, value):
+    """Checks that depend on the value alone: (matches the field's format, earns the field-specific bonus)"""
+    format_pattern = FIELD_FORMATS.get(field_name)
+    format_hit = bool(format_pattern and format_pattern.match(value.strip()))
+    if field_name == "Borrower Name":
+        bonus = len(value.split()) >= 2  # Full name is more likely correct
+    elif field_name == "Loan Amount":
+        bonus = bool(DOLLAR_AMOUNT_FORMAT.match(value))
+    elif field_name == "Property Type":
+        bonus = any(t.lower() in value.lower() for t in VALID_PROPERTY_TYPES)
+    else:
+        bonus = False
+    return format_hit, bonus
+
+def context_hit(field_name, spans, transcript, value_pos, value_chars, cues=1):
+    """Whether ``cues`` field cues lie within CONTEXT_WINDOW characters of the value at ``value_pos``
+
+    For one cue this is a search of the field's patterns in the text around the value, as
+    the scores have always been computed. A cue span inside the window settles it; otherwise
+    the window is searched on its own, where a cue cut off at its edge can still match
+    shorter and ``\\b`` holds at the window's first character. More than one cue is counted
+    by the spans that lie fully inside the window.
+    """
+    if value_pos == -1:
+        return False
+    context_start = max(0, value_pos - CONTEXT_WINDOW)
+    context_end = min(len(transcript), value_pos + value_chars + CONTEXT_WINDOW)
+    if _has_span_within(spans, context_start, context_end, cues):
+        return True
+    if cues > 1:
+        return False
+    context = transcript[context_start:context_end]
+    return any(pattern.search(context) for _, pattern in FIELD_CUES.get(field_name, ()))
+
+def combine_confidence(pattern_hit, format_hit, context_hit, bonus):
+    """The confidence score for the outcome of each check"""
+    confidence = 0.5  # Base confidence
+    if pattern_hit:
+        confidence += 0.2
+    if format_hit:
+        confidence += 0.15
+    if context_hit:
+        confidence += 0.15
+    if bonus:
+        confidence += 0.1
+    return round(min(max(confidence, 0.0), 1.0), 2)
+
+def calculate_confidence(field_name, value, transcript, match_index=None, value_pos=None, context_cues=1):
+    """Calculate confidence score based on Form 1003 specific patterns and context
+
+    Pass a ``match_index`` from ``build_match_index`` when scoring several fields of the
+    same transcript so the transcript is only scanned once. ``value_pos`` is where the
+    value first occurs in the transcript (-1 if it doesn't), for callers that already
+    know; by default the transcript is searched for it. ``context_cues`` is how many cues
+    must surround the value for the context bonus: values read off a cue by the rules
+    pass 2, so their own cue doesn't count as corroboration.
+    """
+    if match_index is None:
+        match_index = build_match_index(transcript)
+    spans = match_index.get(field_name, [])
+    if value_pos is None:
+        value_pos = transcript.find(value)
+    format_hit, bonus = value_checks(field_name, value)
+    return combine_confidence(bool(spans), format_hit,
+                              context_hit(field_name, spans, transcript, value_pos, len(value), context_cues),
+                              bonus)
@@ -0,0 +1,331 @@
+"""Persistent job queue for bulk, non-interactive extraction.
+
+A job is a list of transcripts stored in sqlite, one row per item. A pool of worker
+threads claims ready items, extracts them and records the result. Failed items are
+retried with exponential backoff and jitter; after ``max_attempts`` they are marked
+failed with the last error.
+
+The database is opened on first use, so creating a JobStore (at import of api.app) has
+no side effects. Claims take a lease instead of a lock: an item whose worker died (process restart,
+crash) becomes claimable again once its lease runs out. Claims run in an IMMEDIATE
+transaction, so several server processes can share one job database.
+
+Every claim counts as an attempt, so the attempt number a claim returns identifies that
+lease. Results are only recorded while the item is still running under the same attempt:
+a worker that ran past its lease finds the item reclaimed (and maybe finished) by another
+worker, and its result is discarded.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from api.async_client import ModelOverloaded
+from api.metrics import JOB_ITEMS
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+class InvalidJobInput(ValueError):
+    """The submitted transcripts or JSONL could not be turned into job items"""
+
+def parse_jsonl(text):
+    """Read job items from JSONL: one JSON object with a "transcript" (and optional "id") per line.
+
+    Bare JSON strings are accepted as transcripts. Returns a list of (transcript, id) pairs.
+    """
+    items = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise InvalidJobInput(f"Line {number} is not valid JSON")
+        items.append(_job_item(record, f"Line {number}"))
+    return items
+
+def parse_transcripts(transcripts):
+    """Read job items from a JSON list of transcript strings or {"transcript", "id"} objects"""
+    return [_job_item(record, f"Item {index}") for index, record in enumerate(transcripts)]
+
+def _job_item(record, where):
+    if isinstance(record, str):
+        return record, None
+    if isinstance(record, dict) and isinstance(record.get('transcript'), str):
+        item_id = record.get('id')
+        return record['transcript'], None if item_id is None else str(item_id)
+    raise InvalidJobInput(f"{where} has no transcript string")
+
+class JobStore:
+    """sqlite-backed job and item state.
+
+    Args:
+        db_path: sqlite file shared by every process serving the jobs API.
+        lease_seconds: How long a claimed item stays reserved before it can be claimed again.
+    """
+
+    def __init__(self, db_path, lease_seconds=300):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def _db(self):
+        """The sqlite connection, opened with the schema on first use (callers hold _lock)"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, total INTEGER, created_at REAL, updated_at REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                " job_id TEXT, idx INTEGER, item_id TEXT, transcript TEXT, status TEXT,"
+                " attempts INTEGER DEFAULT 0, available_at REAL, result TEXT, error TEXT,"
+                " PRIMARY KEY (job_id, idx))"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS job_items_ready ON job_items (status, available_at)"
+            )
+            self._connection = db
+        return self._connection
+
+    def create_job(self, items):
+        """Store a job for ``items`` ((transcript, id) pairs) and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?)", (job_id, len(items), now, now))
+                self._db.executemany(
+                    "INSERT INTO job_items (job_id, idx, item_id, transcript, status, available_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(job_id, index, item_id, transcript, PENDING, now)
+                     for index, (transcript, item_id) in enumerate(items)]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def get_job(self, job_id):
+        """Job progress as a dict, or None for an unknown id"""
+        with self._lock:
+            job = self._db.execute(
+                "SELECT total, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        total, created_at, updated_at = job
+        finished = counts.get(DONE, 0) + counts.get(FAILED, 0)
+        if finished == total:
+            status = 'completed'
+        elif finished or counts.get(RUNNING):
+            status = 'running'
+        else:
+            status = 'queued'
+        return {
+            "id": job_id,
+            "status": status,
+            "total": total,
+            "succeeded": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "pending": total - finished,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def claim(self):
+        """Reserve the next ready item for this worker; returns (job_id, index, transcript, attempt) or None
+
+        ``attempt`` is the lease token to pass to complete, retry or fail.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Pending items whose backoff has passed, or running items whose lease expired
+                row = self._db.execute(
+                    "SELECT job_id, idx, transcript, attempts FROM job_items"
+                    " WHERE status IN (?, ?) AND available_at <= ?"
+                    " ORDER BY available_at LIMIT 1",
+                    (PENDING, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE job_items SET status = ?, attempts = attempts + 1, available_at = ?"
+                        " WHERE job_id = ? AND idx = ?",
+                        (RUNNING, now + self.lease_seconds, row[0], row[1])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, index, transcript, attempts = row
+        return job_id, index, transcript, attempts + 1
+
+    def _finish(self, job_id, index, attempt, **columns):
+        """Update a running item if ``attempt`` still holds its lease; returns whether it did"""
+        assignments = ', '.join(f"{column} = ?" for column in columns)
+        with self._lock:
+            updated = self._db.execute(
+                f"UPDATE job_items SET {assignments}"
+                " WHERE job_id = ? AND idx = ? AND status = ? AND attempts = ?",
+                (*columns.values(), job_id, index, RUNNING, attempt)
+            ).rowcount
+            if updated:
+                self._db.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+        return bool(updated)
+
+    def complete(self, job_id, index, attempt, result):
+        return self._finish(job_id, index, attempt, status=DONE, result=json.dumps(result), error=None)
+
+    def retry(self, job_id, index, attempt, error, delay):
+        """Put an item back in the queue, claimable again after ``delay`` seconds"""
+        return self._finish(job_id, index, attempt, status=PENDING, available_at=time.time() + delay, error=error)
+
+    def fail(self, job_id, index, attempt, error):
+        return self._finish(job_id, index, attempt, status=FAILED, error=error)
+
+    def results(self, job_id):
+        """Yield finished items in input order, in the batch endpoint's result format"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, item_id, status, attempts, result, error FROM job_items"
+                " WHERE job_id = ? AND status IN (?, ?) ORDER BY idx",
+                (job_id, DONE, FAILED)
+            ).fetchall()
+        for index, item_id, status, attempts, result, error in rows:
+            entry = {"index": index}
+            if item_id is not None:
+                entry["id"] = item_id
+            if status == DONE:
+                entry.update(json.loads(result))
+            else:
+                entry.update({"error": error, "attempts": attempts})
+            yield entry
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+class JobQueue:
+    """Worker threads that drain a JobStore with ``process(transcript)``.
+
+    Args:
+        store: The JobStore to claim items from.
+        process: Callable returning the JSON-serializable result for one transcript; any
+            exception counts as a failed attempt.
+        workers: Number of worker threads.
+        max_attempts: Attempts per item before it is marked failed.
+        base_delay: Backoff before the first retry, in seconds; doubles with every attempt.
+        max_delay: Cap on the backoff, in seconds.
+        poll_interval: How long idle workers wait before checking for ready items again.
+    """
+
+    def __init__(self, store, process, workers=4, max_attempts=5, base_delay=1.0,
+                 max_delay=60.0, poll_interval=0.5):
+        self.store = store
+        self.process = process
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+        self._work_added = threading.Condition()
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._threads = [threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stop claiming new items and wait for the current ones to finish"""
+        self._stopping.set()
+        self.notify()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def notify(self):
+        """Wake idle workers, e.g. after a job was submitted"""
+        with self._work_added:
+            self._work_added.notify_all()
+
+    def backoff(self, attempt):
+        """Delay before retrying after ``attempt`` failed attempts: exponential, capped, with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = self.store.claim()
+            except sqlite3.Error as e:
+                logger.error("Could not claim job item", extra={"error": str(e)})
+                claimed = None
+            if claimed is None:
+                with self._work_added:
+                    self._work_added.wait(self.poll_interval)
+                continue
+            self._handle(*claimed)
+
+    def _handle(self, job_id, index, transcript, attempt):
+        try:
+            result = self.process(transcript)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempt >= self.max_attempts:
+                if self.store.fail(job_id, index, attempt, error):
+                    logger.error("Job item failed", extra={"job_id": job_id, "index": index,
+                                                           "attempts": attempt, "error": error})
+                    JOB_ITEMS.inc(outcome='failed')
+                else:
+                    self._lease_lost(job_id, index, attempt)
+            else:
+                delay = self.backoff(attempt)
+                if isinstance(e, ModelOverloaded):
+                    # No point coming back before the quota has room again
+                    delay = max(delay, e.retry_after)
+                if self.store.retry(job_id, index, attempt, error, delay):
+                    logger.warning("Retrying job item", extra={"job_id": job_id, "index": index,
+                                                               "attempts": attempt, "delay": round(delay, 3),
+                                                               "error": error})
+                    JOB_ITEMS.inc(outcome='retried')
+                else:
+                    self._lease_lost(job_id, index, attempt)
+            return
+        if self.store.complete(job_id, index, attempt, result):
+            JOB_ITEMS.inc(outcome='done')
+        else:
+            self._lease_lost(job_id, index, attempt)
+
+    def _lease_lost(self, job_id, index, attempt):
+        logger.warning("Job item lease expired; discarding the result",
+                       extra={"job_id": job_id, "index": index, "attempts": attempt})
+        JOB_ITEMS.inc(outcome='discarded')
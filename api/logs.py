@@ -0,0 +1,44 @@
+"""Logging setup for the API.
+
+LOG_LEVEL picks the level (default INFO) and LOG_FORMAT the output: ``json`` (default) for
+one JSON object per line, or ``text`` for local development. Anything passed via
+``extra=`` is emitted as structured fields. Never log transcripts or extracted values:
+they contain borrower PII. Log sizes, counts, field names and timings instead.
+"""
+import json
+import logging
+import os
+
+# Attributes every LogRecord has; anything else on a record came in through ``extra=``
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update((key, value) for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES)
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        extras = ' '.join(f'{key}={value}' for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES)
+        return f'{line} {extras}' if extras else line
+
+def configure_logging(level=None, fmt=None):
+    """Install a single stderr handler on the root logger, replacing any earlier one from here"""
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'json')).lower()
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json'
+                         else TextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler._formsiq = True
+    root = logging.getLogger()
+    root.handlers = [h for h in root.handlers if not getattr(h, '_formsiq', False)] + [handler]
+    root.setLevel(level)
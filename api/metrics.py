@@ -0,0 +1,428 @@
+"""In-process metrics exposed in the Prometheus text format at /metrics.
+
+Counters, gauges and histograms are thread-safe and keyed by label values. Values are kept
+per process. Behind one port served by several gunicorn workers, a scrape reaches just one
+of them, so with METRICS_DIR set every worker shares its metrics (MetricsRegistry.share):
+it writes a snapshot of its values to a file there every METRICS_FLUSH_SECONDS, and
+/metrics renders the sum over all of them. Counters and histograms of workers that have
+exited are folded into an archive file, so totals don't drop when a worker is replaced;
+gauges only count live workers and are combined by each gauge's ``multiprocess_mode``.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans cache hits and rule-only requests up to slow long-transcript model calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Estimated prompt tokens; from a few-field prompt for a short call up to packed batches
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+# Directory the server's worker processes share metrics through; unset keeps them per process
+METRICS_DIR = os.getenv('METRICS_DIR')
+# How often a sharing process writes its snapshot, in seconds; /metrics is at most this stale
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+ARCHIVE_FILE = 'archive.json'
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base class: a named family of samples keyed by label values"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def snapshot(self):
+        """A copy of the values, by label values"""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values, other):
+        """Add ``other`` values into ``values`` (both by label values), as when combining processes"""
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+        return values
+
+    def samples(self, values=None):
+        """(name suffix, label values, extra label pairs, value) tuples for rendering"""
+        values = self.snapshot() if values is None else values
+        return [('', key, (), value) for key, value in sorted(values.items())]
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, key, extra, value in self.samples(values):
+            lines.append(f'{self.name}{suffix}{_format_labels(self.label_names, key, extra)} {_format_value(value)}')
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from ``callback`` at scrape time.
+
+    ``multiprocess_mode`` is how the values of several processes are combined: 'sum'
+    (in-flight counts and queue sizes), 'max' or 'min'.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None, multiprocess_mode='sum'):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+        if multiprocess_mode not in ('sum', 'max', 'min'):
+            raise ValueError(f"Unknown multiprocess mode: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self.callback is not None:
+            return self.callback()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def snapshot(self):
+        if self.callback is not None:
+            return {(): self.callback()}
+        return super().snapshot()
+
+    def combine(self, values, other):
+        """Combine ``other`` process's values into ``values`` by ``multiprocess_mode``"""
+        if self.multiprocess_mode == 'sum':
+            return self.merge(values, other)
+        pick = max if self.multiprocess_mode == 'max' else min
+        for key, value in other.items():
+            values[key] = pick(values[key], value) if key in values else value
+        return values
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            buckets, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[i] += 1
+            self._values[key] = (buckets, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in the ``with`` block, even when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), (None, 0.0, 0))[2]
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(buckets), total, count) for key, (buckets, total, count) in self._values.items()}
+
+    @staticmethod
+    def merge(values, other):
+        for key, (buckets, total, count) in other.items():
+            if key in values:
+                merged_buckets, merged_total, merged_count = values[key]
+                values[key] = ([a + b for a, b in zip(merged_buckets, buckets)], merged_total + total,
+                               merged_count + count)
+            else:
+                values[key] = (list(buckets), total, count)
+        return values
+
+    def samples(self, values=None):
+        values = self.snapshot() if values is None else values
+        samples = []
+        for key, (buckets, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, buckets):
+                samples.append(('_bucket', key, (('le', _format_value(float(bound))),), bucket_count))
+            samples.append(('_bucket', key, (('le', '+Inf'),), count))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+def _encode(values):
+    return [[list(key), value] for key, value in values.items()]
+
+def _decode(entries):
+    return {tuple(key): tuple(value) if isinstance(value, list) else value for key, value in entries}
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        # Set by share(): the directory shared with the other server processes
+        self.directory = None
+        self._share_lock = threading.Lock()
+        self._stop_flushing = threading.Event()
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None, multiprocess_mode='sum'):
+        return self.register(Gauge(name, documentation, labels, callback, multiprocess_mode))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format (version 0.0.4).
+
+        While sharing, the values are those of every server process combined.
+        """
+        combined = self.combined() if self.directory else {}
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(combined.get(metric.name)))
+        return '\n'.join(lines) + '\n'
+
+    def share(self, directory, interval=METRICS_FLUSH_SECONDS):
+        """Share this process's metrics through ``directory``, writing them every ``interval`` seconds.
+
+        Call it in each server worker after the fork (gunicorn.conf.py post_fork). Counters and
+        histograms start again from zero: anything they hold was inherited from the parent.
+        """
+        for metric in self._metrics.values():
+            if not isinstance(metric, Gauge):
+                with metric._lock:
+                    metric._values.clear()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._stop_flushing.clear()
+        self.flush()
+        threading.Thread(target=self._flush_periodically, args=(interval,), name='metrics-flush',
+                         daemon=True).start()
+
+    def _flush_periodically(self, interval):
+        while not self._stop_flushing.wait(interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning("Could not write metrics snapshot", extra={"error": type(e).__name__})
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    @contextmanager
+    def _locked(self):
+        """Hold the lock on the shared directory, across threads and processes"""
+        with self._share_lock, open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def flush(self):
+        """Write this process's snapshot to the shared directory"""
+        snapshot = {name: _encode(metric.snapshot()) for name, metric in self._metrics.items()}
+        path = self._path(os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return {name: _decode(entries) for name, entries in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def _add(self, combined, snapshot, gauges=True):
+        """Combine one process's ``snapshot`` into ``combined``; gauges only if ``gauges``"""
+        for name, values in snapshot.items():
+            metric = self._metrics.get(name)
+            if metric is None or (isinstance(metric, Gauge) and not gauges):
+                continue
+            merged = combined.setdefault(name, {})
+            if isinstance(metric, Gauge):
+                metric.combine(merged, values)
+            else:
+                metric.merge(merged, values)
+
+    def _fold(self, pid):
+        """Add the counters and histograms of process ``pid`` to the archive and remove its file"""
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        archive = self._read(archive_path)
+        self._add(archive, self._read(self._path(pid)), gauges=False)
+        with open(archive_path + '.tmp', 'w') as f:
+            json.dump({name: _encode(values) for name, values in archive.items()}, f)
+        os.replace(archive_path + '.tmp', archive_path)
+        os.remove(self._path(pid))
+
+    def combined(self):
+        """Values of every server process, by metric name; this process's are current"""
+        self.flush()
+        with self._locked():
+            pids = [int(name[:-len('.json')]) for name in os.listdir(self.directory)
+                    if name.endswith('.json') and name[:-len('.json')].isdigit()]
+            for pid in pids:
+                if pid != os.getpid() and not _is_alive(pid):
+                    self._fold(pid)
+            combined = self._read(os.path.join(self.directory, ARCHIVE_FILE))
+            for pid in pids:
+                # Files of exited processes were just folded into the archive and read as empty
+                self._add(combined, self._read(self._path(pid)))
+        return combined
+
+    def retire(self):
+        """Stop sharing before the process exits, keeping its counters and histograms in the archive"""
+        if not self.directory:
+            return
+        self._stop_flushing.set()
+        self.flush()
+        with self._locked():
+            self._fold(os.getpid())
+        self.directory = None
+
+def clear_shared_metrics(directory):
+    """Remove the files of an earlier server run, before its workers start sharing"""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    'formsiq_requests_total', 'HTTP requests handled, by endpoint, method and status', ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = REGISTRY.histogram(
+    'formsiq_request_duration_seconds', 'HTTP request latency in seconds, by endpoint', ('endpoint',))
+IN_FLIGHT = REGISTRY.gauge(
+    'formsiq_requests_in_flight', 'HTTP requests currently being handled')
+IN_FLIGHT.set(0)
+STAGE_LATENCY = REGISTRY.histogram(
+    'formsiq_stage_duration_seconds',
+    'Extraction pipeline latency in seconds, by stage (fast_path, model_call, parse, scoring)', ('stage',))
+MODEL_TOKENS = REGISTRY.counter(
+    'formsiq_model_tokens_total', 'Model tokens used, by kind (prompt or output)', ('kind',))
+PROMPT_TOKENS = REGISTRY.histogram(
+    'formsiq_prompt_tokens', 'Estimated size of the prompts built, in tokens, by kind (single, batch or session)',
+    ('kind',), buckets=TOKEN_BUCKETS)
+PROMPT_EXAMPLES_DROPPED = REGISTRY.counter(
+    'formsiq_prompt_examples_dropped_total', 'Few-shot examples left out of prompts to fit the token budget')
+STRUCTURED_OUTPUT = REGISTRY.counter(
+    'formsiq_structured_output_total',
+    'JSON model answers, by outcome (valid, repaired, invalid, or retried after an invalid answer)', ('outcome',))
+MODEL_CALLS = REGISTRY.counter(
+    'formsiq_model_calls_total', 'Model calls made, by outcome (ok or error)', ('outcome',))
+MODEL_IN_FLIGHT = REGISTRY.gauge(
+    'formsiq_model_calls_in_flight', 'Model calls currently running')
+MODEL_IN_FLIGHT.set(0)
+SCHEDULER_WAITING = REGISTRY.gauge(
+    'formsiq_scheduler_waiting', 'Model calls waiting for rate-limit quota, by lane', ('lane',))
+SCHEDULER_WAIT = REGISTRY.histogram(
+    'formsiq_scheduler_wait_seconds', 'Time model calls waited for rate-limit quota, by lane', ('lane',))
+SCHEDULER_REJECTED = REGISTRY.counter(
+    'formsiq_scheduler_rejected_total',
+    'Model calls rejected as overloaded, by lane and reason (queue_full, quota_wait or quota_error)',
+    ('lane', 'reason'))
+MODEL_RETRIES = REGISTRY.counter(
+    'formsiq_model_retries_total', 'Model calls retried after a transient error, by status code', ('status',))
+MODEL_COALESCED = REGISTRY.counter(
+    'formsiq_model_calls_coalesced_total', 'Model calls answered by an identical call already in flight')
+ERRORS = REGISTRY.counter(
+    'formsiq_errors_total', 'Errors by where they happened and exception type', ('source', 'type'))
+JOB_ITEMS = REGISTRY.counter(
+    'formsiq_job_items_total', 'Job item attempts, by outcome (done, retried, failed or discarded)', ('outcome',))
+SESSION_UPDATES = REGISTRY.counter(
+    'formsiq_session_updates_total',
+    'Transcript appends to live sessions, by how fields were updated (rules, model or deferred)', ('path',))
+SESSIONS_EXPIRED = REGISTRY.counter(
+    'formsiq_sessions_expired_total', 'Live sessions removed after being idle too long')
+EXTRACTIONS = REGISTRY.counter(
+    'formsiq_extractions_total', 'Transcripts extracted, by how the result was produced', ('path',))
+CASCADE_ESCALATIONS = REGISTRY.counter(
+    'formsiq_cascade_escalations_total',
+    'Fields asked again of the next model tier after a low-confidence answer, by the tier that answered',
+    ('tier',))
+STARTUP_SECONDS = REGISTRY.gauge(
+    'formsiq_startup_seconds', 'Seconds the slowest process spent starting up, by phase (import or warm_up)',
+    ('phase',), multiprocess_mode='max')
+READY = REGISTRY.gauge(
+    'formsiq_ready', 'Whether every process has warmed up and is ready to serve (1) or not (0)',
+    multiprocess_mode='min')
+READY.set(0)
+
+def record_token_usage(response):
+    """Add a model response's token counts (Gemini usage_metadata or our ModelResponse) to MODEL_TOKENS"""
+    usage = getattr(response, 'usage_metadata', None) or response
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    if prompt_tokens:
+        MODEL_TOKENS.inc(prompt_tokens, kind='prompt')
+    if output_tokens:
+        MODEL_TOKENS.inc(output_tokens, kind='output')
+
+def record_error(source, error):
+    ERRORS.inc(source=source, type=type(error).__name__)
@@ -0,0 +1,263 @@
+"""Local normalization of extracted values into the canonical forms of FORM_1003_FIELDS.
+
+Model answers and rule matches are normalized here before they are scored, so the model
+no longer has to be taught to rewrite values and the output doesn't depend on how it
+chose to write them:
+
+- money: spoken and abbreviated amounts ("225K/year", "three-twenty-five thousand",
+  "1.2 million") become "$225,000", "$325,000", "$1,200,000";
+- addresses: street suffixes and unit designators are abbreviated ("Street" -> "St",
+  "Apartment" -> "Apt"), lowercase words capitalized and state codes uppercased;
+- property types: matched (with typo tolerance) against VALID_PROPERTY_TYPES;
+- loan purposes: "refi", "buying" and the like become "Refinance" or "Purchase";
+- names: whitespace collapsed and all-lowercase or all-uppercase names capitalized.
+
+Values are parsed by splitting them into words and looking the words up in the tables
+below. A value that can't be normalized (two amounts in one answer, say) is returned with
+only its whitespace collapsed, and is then scored as before. Ranges ("$400K - $450K") and
+corrections ("400K, 450K") are two amounts: adding them up would make one up.
+"""
+import difflib
+from decimal import Decimal, InvalidOperation
+
+# Money: number words, scale words and the sizes of the scales
+NUMBER_WORDS = {
+    word: value for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+        "fifteen sixteen seventeen eighteen nineteen".split())
+}
+NUMBER_WORDS.update({word: 10 * tens for tens, word in enumerate(
+    "twenty thirty forty fifty sixty seventy eighty ninety".split(), start=2)})
+SCALE_WORDS = {
+    'hundred': 100,
+    'thousand': 1000, 'grand': 1000, 'k': 1000,
+    'million': 10 ** 6, 'millions': 10 ** 6, 'mil': 10 ** 6, 'm': 10 ** 6, 'mm': 10 ** 6,
+    'billion': 10 ** 9, 'b': 10 ** 9,
+}
+# Words that may sit inside a spoken amount without ending it
+AMOUNT_FILLERS = {'and', 'a'}
+# Characters between two amounts ("400K-450K", "$400K/$450K"): hyphen, slash, en and em dash.
+# A hyphen between number words joins them instead ("twenty-five", "three-twenty-five").
+AMOUNT_SEPARATORS = '-/\u2013\u2014'
+CENTS = Decimal('0.01')
+
+# Addresses: suffixes, unit designators and directionals, by lowercase spelling
+STREET_SUFFIXES = {
+    'street': 'St', 'st': 'St', 'str': 'St', 'avenue': 'Ave', 'ave': 'Ave', 'av': 'Ave',
+    'road': 'Rd', 'rd': 'Rd', 'drive': 'Dr', 'dr': 'Dr', 'boulevard': 'Blvd', 'blvd': 'Blvd',
+    'lane': 'Ln', 'ln': 'Ln', 'court': 'Ct', 'ct': 'Ct', 'circle': 'Cir', 'cir': 'Cir',
+    'place': 'Pl', 'pl': 'Pl', 'terrace': 'Ter', 'ter': 'Ter', 'parkway': 'Pkwy', 'pkwy': 'Pkwy',
+    'highway': 'Hwy', 'hwy': 'Hwy', 'square': 'Sq', 'sq': 'Sq', 'way': 'Way', 'trail': 'Trl', 'trl': 'Trl',
+}
+UNIT_DESIGNATORS = {
+    'apartment': 'Apt', 'apt': 'Apt', 'suite': 'Ste', 'ste': 'Ste', 'unit': 'Unit',
+    'floor': 'Fl', 'fl': 'Fl', 'building': 'Bldg', 'bldg': 'Bldg',
+}
+DIRECTIONALS = {
+    'north': 'N', 'south': 'S', 'east': 'E', 'west': 'W',
+    'northeast': 'NE', 'northwest': 'NW', 'southeast': 'SE', 'southwest': 'SW',
+}
+# Every abbreviation used in canonical addresses, for building lookup keys
+ADDRESS_ABBREVIATIONS = {**STREET_SUFFIXES, **UNIT_DESIGNATORS, **DIRECTIONALS}
+STATE_CODES = set(
+    "AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ NM "
+    "NY NC ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY PR".split()
+)
+
+# Property types: spellings of each of api.fields.VALID_PROPERTY_TYPES, hyphens written as spaces
+PROPERTY_TYPE_NAMES = {
+    'single family': 'Single Family', 'single family home': 'Single Family',
+    'single family house': 'Single Family', 'detached': 'Single Family', 'sfh': 'Single Family',
+    'condo': 'Condo', 'condominium': 'Condo', 'condo unit': 'Condo',
+    'townhouse': 'Townhouse', 'town house': 'Townhouse', 'townhome': 'Townhouse', 'town home': 'Townhouse',
+    'rowhouse': 'Townhouse', 'row house': 'Townhouse',
+    'multi family': 'Multi-Family', 'multifamily': 'Multi-Family', 'multi unit': 'Multi-Family',
+    'duplex': 'Multi-Family', 'triplex': 'Multi-Family', 'fourplex': 'Multi-Family', 'quadplex': 'Multi-Family',
+    'manufactured': 'Manufactured', 'manufactured home': 'Manufactured', 'mobile home': 'Manufactured',
+}
+# Longest spelling in words, to bound the phrases looked up
+PROPERTY_TYPE_WORDS = max(len(name.split()) for name in PROPERTY_TYPE_NAMES)
+# How close a misspelling must be to a known spelling (difflib ratio)
+FUZZY_CUTOFF = 0.85
+
+LOAN_PURPOSES = {
+    'refinance': 'Refinance', 'refinancing': 'Refinance', 'refinanced': 'Refinance', 'refi': 'Refinance',
+    'purchase': 'Purchase', 'purchasing': 'Purchase', 'buy': 'Purchase', 'buying': 'Purchase',
+}
+
+def _words(text, keep=''):
+    """Lowercase words of ``text``: runs of letters or digits, plus any characters in ``keep``"""
+    words, word = [], []
+    for char in text.lower():
+        if char.isalnum() or char in keep:
+            word.append(char)
+        elif word:
+            words.append(''.join(word))
+            word = []
+    if word:
+        words.append(''.join(word))
+    return words
+
+def _amount_tokens(text):
+    """Number and word tokens of a money value; digits keep their ',' and '.' separators"""
+    for separator in AMOUNT_SEPARATORS:
+        text = text.replace(separator, f' {separator} ')
+    tokens = []
+    for word in _words(text, keep=',.' + AMOUNT_SEPARATORS):
+        if word in AMOUNT_SEPARATORS:
+            tokens.append('-')
+            continue
+        word = word.strip(',.')
+        # "225k" and "1.2m" are a number and a scale word
+        split = len(word)
+        while split and word[split - 1].isalpha():
+            split -= 1
+        if split and split < len(word) and word[split:] in SCALE_WORDS:
+            tokens.extend([word[:split], word[split:]])
+        elif word:
+            tokens.append(word)
+    return tokens
+
+def _is_amount_token(token):
+    return token[0].isdigit() or token in NUMBER_WORDS or token in SCALE_WORDS
+
+def _group_value(tokens):
+    """The value of one run of amount tokens, or None if the words don't form a number"""
+    total = current = Decimal(0)
+    previous = last_scale = None
+    for token in tokens:
+        if token[0].isdigit():
+            if previous not in (None, 'scale'):
+                return None
+            try:
+                current += Decimal(token.replace(',', ''))
+            except InvalidOperation:
+                return None
+            previous = 'digits'
+        elif token in NUMBER_WORDS or token == 'a':
+            number = NUMBER_WORDS.get(token, 1)
+            if previous == 'ones' and number >= 10 and current < 10:
+                # Spoken hundreds: "three-twenty-five" is 325, "one-fifty" is 150
+                current = current * 100 + number
+            elif previous == 'tens' and number < 10 or previous in (None, 'hundred', 'scale'):
+                current += number
+            else:
+                return None
+            previous = 'ones' if number < 10 else 'tens' if number % 10 == 0 else 'teen'
+        elif token in SCALE_WORDS:
+            scale = SCALE_WORDS[token]
+            if scale == 100:
+                current = (current or 1) * 100
+                previous = 'hundred'
+            else:
+                if last_scale is not None and scale >= last_scale:
+                    return None  # "four hundred thousand four fifty thousand" is two amounts
+                total += (current or 1) * scale
+                current = Decimal(0)
+                previous = 'scale'
+                last_scale = scale
+    return total + current
+
+def parse_amount(text):
+    """The amount of money ``text`` states, as a Decimal, or None unless it states exactly one"""
+    tokens = _amount_tokens(text)
+    groups, group = [], []
+    for index, token in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token == '-' and group and group[-1] in NUMBER_WORDS and following in NUMBER_WORDS:
+            continue  # "twenty-five"
+        if token[0].isdigit() and group and SCALE_WORDS.get(group[-1], 0) > 100:
+            # Digits after "400K" start another amount: "$400K $450K"
+            groups.append(group)
+            group = []
+        if _is_amount_token(token):
+            group.append(token)
+        elif token in AMOUNT_FILLERS and group and following and _is_amount_token(following):
+            continue  # "one hundred and five"
+        elif token == 'a' and following in SCALE_WORDS:
+            group.append(token)  # "a hundred thousand"
+        elif group:
+            groups.append(group)
+            group = []
+    if group:
+        groups.append(group)
+    if len(groups) != 1:
+        return None
+    amount = _group_value(groups[0])
+    return amount if amount else None
+
+def normalize_money(value):
+    """'$225,000' for '225K/year' and the like; '$1,234.50' when there are cents"""
+    amount = parse_amount(value)
+    if amount is None:
+        return value
+    amount = amount.quantize(CENTS)
+    return f"${amount:,.2f}" if amount % 1 else f"${int(amount):,}"
+
+def _capitalized(word):
+    return word[:1].upper() + word[1:] if word.islower() else word
+
+def normalize_address(value):
+    """Abbreviate the street suffix and unit designators, capitalize lowercase words, uppercase state codes"""
+    parts = []
+    for index, part in enumerate(value.split(',')):
+        words = part.split()
+        if not words:
+            continue
+        canonical = []
+        for position, word in enumerate(words):
+            key = word.lower().rstrip('.')
+            next_key = words[position + 1].lower().rstrip('.') if position + 1 < len(words) else None
+            if key in UNIT_DESIGNATORS:
+                canonical.append(UNIT_DESIGNATORS[key])
+            elif index == 0 and position > 0 and key in STREET_SUFFIXES and (
+                    next_key is None or next_key in UNIT_DESIGNATORS or next_key in DIRECTIONALS):
+                # Only the street type ending the street line: "Court Street" is "Court St"
+                canonical.append(STREET_SUFFIXES[key])
+            elif len(words) == 1 and word.upper().rstrip('.') in STATE_CODES and index > 0:
+                canonical.append(word.upper().rstrip('.'))
+            else:
+                canonical.append(_capitalized(word))
+        parts.append(' '.join(canonical))
+    return ', '.join(parts)
+
+def normalize_property_type(value):
+    """The VALID_PROPERTY_TYPES entry ``value`` names, or ``value`` when it names none"""
+    words = _words(value)
+    for size in range(min(PROPERTY_TYPE_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            name = PROPERTY_TYPE_NAMES.get(' '.join(words[start:start + size]))
+            if name:
+                return name
+    close = difflib.get_close_matches(' '.join(words), PROPERTY_TYPE_NAMES, n=1, cutoff=FUZZY_CUTOFF)
+    return PROPERTY_TYPE_NAMES[close[0]] if close else value
+
+def normalize_loan_purpose(value):
+    """'Refinance' or 'Purchase' when ``value`` says which, else ``value``"""
+    purposes = {LOAN_PURPOSES[word] for word in _words(value) if word in LOAN_PURPOSES}
+    return purposes.pop() if len(purposes) == 1 else value
+
+def normalize_name(value):
+    """Capitalize names written all in lowercase or uppercase ("o'connor" -> "O'Connor")"""
+    if value.islower() or value.isupper():
+        chars, start = [], True
+        for char in value.lower():
+            chars.append(char.upper() if start else char)
+            start = not char.isalpha()
+        value = ''.join(chars)
+    return value.rstrip(',;')
+
+NORMALIZERS = {
+    "Borrower Name": normalize_name,
+    "Loan Amount": normalize_money,
+    "Annual Income": normalize_money,
+    "Property Address": normalize_address,
+    "Property Type": normalize_property_type,
+    "Loan Purpose": normalize_loan_purpose,
+}
+
+def canonical_value(field_name, value):
+    """``value`` in its field's canonical form; values that can't be normalized keep their text"""
+    value = ' '.join(value.split())
+    normalize = NORMALIZERS.get(field_name)
+    return normalize(value) if normalize and value else value
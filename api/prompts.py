@@ -0,0 +1,312 @@
+"""Prompt templates for Form 1003 field extraction"""
+import json
+import re
+from functools import lru_cache
+from api.chunking import CHARS_PER_TOKEN
+from api.fields import FORM_1003_FIELDS
+from api.metrics import PROMPT_EXAMPLES_DROPPED, PROMPT_TOKENS
+
+# Bump whenever the prompt text changes so cached extractions from the old prompt are dropped
+PROMPT_VERSION = "3"
+
+PROMPT_PREAMBLE = "You are a mortgage loan processor expert. Extract information from the transcript that matches fields from the Uniform Residential Loan Application (Form 1003).\n\n"
+
+# Few-shot examples by section. Each output lists the fields the transcript states; every
+# other field is rendered as 'Not specified'.
+NEGATIVE_SECTION = "NEGATIVE EXAMPLES (Invalid or unclear cases)"
+EXAMPLE_SECTIONS = [
+    ("POSITIVE EXAMPLES (Clear, straightforward cases)", [
+        ("Standard Case",
+         "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston. I make $85,000 a year working as a software engineer at Tech Corp.",
+         {"Borrower Name": "John Smith", "Loan Amount": "$300,000", "Property Address": "123 Main St, Boston",
+          "Annual Income": "$85,000", "Employment Info": "Software Engineer at Tech Corp", "Loan Purpose": "Purchase"}),
+        ("Refinance Case",
+         "I'd like to refinance my condo at 456 Park Ave, NYC. My name is Sarah Johnson, I earn $120,000 annually as a marketing director.",
+         {"Borrower Name": "Sarah Johnson", "Property Address": "456 Park Ave, NYC", "Annual Income": "$120,000",
+          "Employment Info": "Marketing Director", "Property Type": "Condo", "Loan Purpose": "Refinance"}),
+        ("Complete Information",
+         "Hello, Dr. Maria Garcia-Rodriguez here. I want to purchase a single-family home at 789 Oak Drive, Austin, TX. The loan amount would be $450,000, and I'm currently making $175,000 per year as a senior physician at Central Hospital.",
+         {"Borrower Name": "Dr. Maria Garcia-Rodriguez", "Loan Amount": "$450,000",
+          "Property Address": "789 Oak Drive, Austin, TX", "Annual Income": "$175,000",
+          "Employment Info": "Senior Physician at Central Hospital", "Property Type": "Single-family",
+          "Loan Purpose": "Purchase"}),
+    ]),
+    ("COMPLEX EXAMPLES (Multiple or indirect mentions)", [
+        ("Multiple Amounts",
+         "I'm Robert Chen, earning about $95,000 base salary plus $30,000 bonus. Looking at a $425,000 loan for a townhouse at 321 Pine Street, Seattle.",
+         {"Borrower Name": "Robert Chen", "Loan Amount": "$425,000", "Property Address": "321 Pine Street, Seattle",
+          "Annual Income": "$125,000", "Property Type": "Townhouse"}),
+    ]),
+    ("EDGE CASES (Unusual formats or partial information)", [
+        ("Hyphenated/Special Characters",
+         "Jean-Pierre O'Connor speaking. Looking at 42-B West 73rd St., Apt. 5C, New York, NY. Currently at Deutsche-Bank making $225K/year.",
+         {"Borrower Name": "Jean-Pierre O'Connor", "Property Address": "42-B West 73rd St., Apt. 5C, New York, NY",
+          "Annual Income": "$225,000", "Employment Info": "Deutsche-Bank"}),
+        ("Minimal Information",
+         "James Wilson. Need 275k for the condo.",
+         {"Borrower Name": "James Wilson", "Loan Amount": "$275,000", "Property Type": "Condo"}),
+    ]),
+    (NEGATIVE_SECTION, [
+        ("Ambiguous Information",
+         "Someone mentioned a property on Oak Street, might be interested in that or the one on Pine Avenue. Income varies, sometimes 80k, sometimes more.",
+         {}),
+        ("Conflicting Information",
+         "John Smith - no wait, it's James Smith. The loan would be 400k - actually, make that 450k. Located at 123 Main St - sorry, 321 Main St.",
+         {}),
+    ]),
+]
+
+# Field-subset prompts keep at most this many examples that show a requested field, plus
+# the negative examples, which teach when to answer 'Not specified'
+MAX_SUBSET_EXAMPLES = 4
+
+@lru_cache(maxsize=128)
+def rank_examples(fields=None):
+    """Titles of the examples to show for ``fields`` (a tuple, default: every field), most useful first.
+
+    The ranking round-robins over the sections so any prefix of it stays varied; prompts
+    over their token budget drop examples from the end. For a field subset only the first
+    MAX_SUBSET_EXAMPLES examples showing a requested field are ranked, then the negatives.
+    """
+    if fields:
+        pools = [[title for title, _, output in examples if any(field in output for field in fields)]
+                 for heading, examples in EXAMPLE_SECTIONS if heading != NEGATIVE_SECTION]
+    else:
+        pools = [[example[0] for example in examples] for _, examples in EXAMPLE_SECTIONS]
+    ranked = []
+    while any(pools):
+        for pool in pools:
+            if pool:
+                ranked.append(pool.pop(0))
+    if fields:
+        negatives = [example[0] for heading, examples in EXAMPLE_SECTIONS
+                     if heading == NEGATIVE_SECTION for example in examples]
+        ranked = ranked[:MAX_SUBSET_EXAMPLES] + negatives
+    return tuple(ranked)
+
+def render_examples(fields=None, count=None, output_format='text'):
+    """Few-shot examples as prompt text, with outputs restricted to ``fields`` when given.
+
+    ``count`` keeps only that many of the highest-ranked examples; they are still shown in
+    section order. Outputs are 'Field: Value' lines, or JSON objects for ``output_format='json'``.
+    """
+    fields = fields or list(FORM_1003_FIELDS)
+    ranked = rank_examples(tuple(fields) if len(fields) < len(FORM_1003_FIELDS) else None)
+    kept = set(ranked if count is None else ranked[:count])
+    parts, number = [], 0
+    for heading, examples in EXAMPLE_SECTIONS:
+        examples = [example for example in examples if example[0] in kept]
+        if not examples:
+            continue
+        parts.append(f"# {heading}\n\n")
+        for title, transcript, output in examples:
+            number += 1
+            if output_format == 'json':
+                lines = json.dumps({field: output.get(field) for field in fields})
+            else:
+                lines = "\n".join(f"{field}: {output.get(field, 'Not specified')}" for field in fields)
+            parts.append(f'Example {number} ({title}):\nTranscript: "{transcript}"\nOutput:\n{lines}\n\n')
+    return "".join(parts)
+
+# Static few-shot prefix shared by single and batch extraction prompts
+FEW_SHOT_PREFIX = PROMPT_PREAMBLE + render_examples()
+
+@lru_cache(maxsize=512)
+def few_shot_prefix(fields=None, count=None, output_format='text'):
+    """The prompt up to the transcript: the examples for ``fields`` (a tuple, default: every
+    field), keeping only the ``count`` highest-ranked ones when given"""
+    if not fields:
+        if count is None and output_format == 'text':
+            return FEW_SHOT_PREFIX
+        return PROMPT_PREAMBLE + render_examples(count=count, output_format=output_format)
+    return (PROMPT_PREAMBLE + render_examples(list(fields), count, output_format)
+            + FIELD_SUBSET_INSTRUCTION.format(fields=', '.join(fields)))
+
+def estimate_tokens(text):
+    """Rough token count for budgeting, without a round trip to the model's tokenizer"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+OUTPUT_FORMAT = """Format each field exactly as:
+Field: Value
+"""
+SUBSET_OUTPUT_FORMAT = "Format your answer as exactly these lines, in this order:\n{lines}\n"
+JSON_OUTPUT_FORMAT = ("Format each answer as a JSON object whose keys are exactly these fields, in this order: "
+                      "{fields}. Each value is the field's text as a string, or null.\n")
+
+OUTPUT_RULES_TEMPLATE = """Use {unspecified} if:
+1. The field is not mentioned in the transcript
+2. The information is ambiguous or conflicting
+3. The format doesn't match expected patterns
+
+Remember:
+- Extract only clearly stated information
+- Maintain original formatting for numbers and addresses
+- Do not interpret or assume information not explicitly stated
+- For conflicting information, mark as {unspecified}
+"""
+OUTPUT_RULES_BODY = OUTPUT_RULES_TEMPLATE.format(unspecified="'Not specified'")
+JSON_OUTPUT_RULES_BODY = OUTPUT_RULES_TEMPLATE.format(unspecified="null")
+OUTPUT_RULES = OUTPUT_FORMAT + OUTPUT_RULES_BODY
+
+def output_rules(fields=None, output_format='text'):
+    """Output instructions; for a field subset they spell out the exact lines expected"""
+    if output_format == 'json':
+        return (JSON_OUTPUT_FORMAT.format(fields=json.dumps(list(fields or FORM_1003_FIELDS)))
+                + JSON_OUTPUT_RULES_BODY)
+    if not fields:
+        return OUTPUT_RULES
+    lines = "\n".join(f"{field}: Value" for field in fields)
+    return SUBSET_OUTPUT_FORMAT.format(lines=lines) + OUTPUT_RULES_BODY
+
+SINGLE_TRANSCRIPT_INTRO = "Now extract information from this transcript, following Form 1003 sections:\n"
+BATCH_RESULT_INSTRUCTION = "For each transcript, in order, "
+# Live call sessions: the model sees the latest part of the call and what is already known
+SESSION_STATE_INTRO = "This is the latest part of a call that is still going on. Fields extracted from earlier in the call:\n"
+SESSION_NO_STATE = "(none yet)\n"
+SESSION_STATE_RULE = ("Answer a field only if this part of the call states it or corrects the value above; "
+                      "otherwise use {unspecified}.\n\n")
+FIELD_SUBSET_INSTRUCTION = "Only extract these fields: {fields}. Leave every other field out of your answer.\n\n"
+FIELD_SUBSET_PATTERN = re.compile(r'^Only extract these fields: (.+)\. Leave every other field out', re.MULTILINE)
+
+# Delimiters used to pack several transcripts into one model call
+TRANSCRIPT_DELIMITER = "### TRANSCRIPT {number}"
+TRANSCRIPT_DELIMITER_PATTERN = re.compile(r'^### TRANSCRIPT (\d+)$', re.MULTILINE)
+RESULT_DELIMITER = "### RESULT {number}"
+RESULT_DELIMITER_PATTERN = re.compile(r'^\s*#{1,6}\s*RESULT\s+(\d+)\s*:?\s*$', re.IGNORECASE | re.MULTILINE)
+DELIMITER_LIKE_LINE = re.compile(r'^(\s*)#+(?=\s*(?:TRANSCRIPT|RESULT)\b)', re.IGNORECASE | re.MULTILINE)
+
+class PromptBuilder:
+    """Assembles extraction prompts from precomputed parts, within an optional token budget.
+
+    The few-shot prefix for each field subset and example count is rendered once and then
+    reused. With a ``token_budget``, examples are dropped, lowest-ranked first, until the
+    whole prompt fits, so long transcripts don't pay for every example on top of their
+    own length. Transcripts themselves are never cut; a prompt with no examples left may
+    still be over budget. Each prompt's estimated size is recorded in PROMPT_TOKENS.
+
+    ``output_format`` asks for 'Field: Value' lines ('text') or JSON objects ('json', see
+    api.structured); single-transcript prompts can override it per call.
+    """
+
+    def __init__(self, token_budget=None, output_format='text'):
+        self.token_budget = token_budget
+        self.output_format = output_format
+
+    def prefix(self, fields=None, reserved_tokens=0, output_format=None):
+        """The few-shot prefix with as many examples as fit beside ``reserved_tokens`` of other prompt text"""
+        fields = tuple(fields) if fields else None
+        output_format = output_format or self.output_format
+        prefix = few_shot_prefix(fields, None, output_format)
+        if not self.token_budget or estimate_tokens(prefix) + reserved_tokens <= self.token_budget:
+            return prefix
+        total = count = len(rank_examples(fields))
+        while count and estimate_tokens(prefix) + reserved_tokens > self.token_budget:
+            count -= 1
+            prefix = few_shot_prefix(fields, count, output_format)
+        PROMPT_EXAMPLES_DROPPED.inc(total - count)
+        return prefix
+
+    def extraction_prompt(self, transcript, fields=None, output_format=None):
+        """Build the few-shot prompt for a single transcript.
+
+        When ``fields`` is given, the model is told to answer only those fields, the examples
+        are trimmed to ones relevant to them and their outputs list only those fields.
+        """
+        output_format = output_format or self.output_format
+        body = SINGLE_TRANSCRIPT_INTRO + transcript + "\n\n" + output_rules(fields, output_format)
+        prompt = self.prefix(fields, estimate_tokens(body), output_format) + body
+        PROMPT_TOKENS.observe(estimate_tokens(prompt), kind='single')
+        return prompt
+
+    def session_prompt(self, text, known_fields, fields=None):
+        """Build the prompt for the newest ``text`` of a live call session.
+
+        ``known_fields`` maps field names to the values extracted from earlier in the call;
+        they are listed as context so the model only reports new or corrected values.
+        """
+        unspecified = "null" if self.output_format == 'json' else "'Not specified'"
+        state = "".join(f"{field_name}: {value}\n" for field_name, value in known_fields.items())
+        body = (SESSION_STATE_INTRO + (state or SESSION_NO_STATE)
+                + SESSION_STATE_RULE.format(unspecified=unspecified)
+                + SINGLE_TRANSCRIPT_INTRO + text + "\n\n" + output_rules(fields, self.output_format))
+        prompt = self.prefix(fields, estimate_tokens(body), self.output_format) + body
+        PROMPT_TOKENS.observe(estimate_tokens(prompt), kind='session')
+        return prompt
+
+    def batch_prompt(self, transcripts, fields=None):
+        """Build one few-shot prompt that asks for fields from several transcripts.
+
+        Transcripts are numbered from 1 and wrapped in TRANSCRIPT_DELIMITER lines; the model is
+        asked to answer each under a matching RESULT_DELIMITER line, or in JSON output format
+        with an array holding one object per transcript.
+        """
+        sections = []
+        for number, transcript in enumerate(transcripts, start=1):
+            # Keep transcript text from being mistaken for one of our delimiters
+            transcript = DELIMITER_LIKE_LINE.sub(r'\1', transcript)
+            sections.append(f"{TRANSCRIPT_DELIMITER.format(number=number)}\n{transcript}")
+
+        if self.output_format == 'json':
+            answer_instruction = f"write one answer object; reply with a JSON array of all {len(transcripts)} objects.\n"
+        else:
+            answer_instruction = (f"first write the line \"{RESULT_DELIMITER.format(number='<n>')}\" "
+                                  "using its number, then list its fields.\n")
+        body = (f"Now extract information from each of the following {len(transcripts)} transcripts, "
+                "following Form 1003 sections. Each transcript starts with a line like "
+                f"\"{TRANSCRIPT_DELIMITER.format(number='<n>')}\".\n\n"
+                + "\n\n".join(sections) + "\n\n"
+                + BATCH_RESULT_INSTRUCTION + answer_instruction
+                + output_rules(fields, self.output_format)
+                + "- Treat each transcript independently; never carry information from one transcript into another\n")
+        prompt = self.prefix(fields, estimate_tokens(body), self.output_format) + body
+        PROMPT_TOKENS.observe(estimate_tokens(prompt), kind='batch')
+        return prompt
+
+# Every example, whatever the transcript length
+_UNBUDGETED = PromptBuilder()
+
+def build_extraction_prompt(transcript, fields=None):
+    """Single-transcript prompt with every relevant example; see PromptBuilder.extraction_prompt"""
+    return _UNBUDGETED.extraction_prompt(transcript, fields)
+
+def build_batch_prompt(transcripts, fields=None):
+    """Batch prompt with every relevant example; see PromptBuilder.batch_prompt"""
+    return _UNBUDGETED.batch_prompt(transcripts, fields)
+
+def split_batch_response(text, count):
+    """Split a batch response into per-transcript sections.
+
+    Returns a list of length ``count`` holding each transcript's response text, or None
+    where the model did not return a section for that transcript.
+    """
+    sections = [None] * count
+    matches = list(RESULT_DELIMITER_PATTERN.finditer(text))
+    for i, match in enumerate(matches):
+        number = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if 1 <= number <= count and sections[number - 1] is None:
+            sections[number - 1] = text[match.end():end]
+    return sections
+
+def transcripts_in_prompt(prompt):
+    """Recover the transcripts embedded in a prompt built by this module.
+
+    Returns a list of transcripts for batch prompts, or a single transcript string for
+    single-transcript prompts. Used by the fake model backend to answer without a model.
+    """
+    if SINGLE_TRANSCRIPT_INTRO in prompt:
+        body = prompt.split(SINGLE_TRANSCRIPT_INTRO, 1)[1]
+        return body[:body.rfind("\n\nFormat ")]
+
+    body = prompt[:prompt.rfind("\n\n" + BATCH_RESULT_INSTRUCTION)]
+    delimiters = list(TRANSCRIPT_DELIMITER_PATTERN.finditer(body))
+    transcripts = []
+    for i, delimiter in enumerate(delimiters):
+        end = delimiters[i + 1].start() - 2 if i + 1 < len(delimiters) else len(body)
+        transcripts.append(body[delimiter.end() + 1:end])
+    return transcripts
+
+def fields_in_prompt(prompt):
+    """Return the field subset a prompt asks for, or None when it asks for every field"""
+    match = FIELD_SUBSET_PATTERN.search(prompt)
+    return match.group(1).split(', ') if match else None
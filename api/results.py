@@ -0,0 +1,130 @@
+"""Persistent store of extraction results, for lookups without a new model call.
+
+Every fresh /extract-fields result can be recorded in sqlite with the transcript's hash (the
+transcript itself is not stored), its fields and confidence scores, the model and prompt
+version that produced it, and how long extraction took. Results are indexed by normalized
+borrower name, normalized property address and time, so questions like "what loan amount
+did we capture for this borrower?" are answered from the store.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from api.cache import normalize_transcript
+from api.normalize import ADDRESS_ABBREVIATIONS
+
+NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+NAME_TITLES = {'mr', 'mrs', 'ms', 'miss', 'dr'}
+
+def transcript_hash(transcript):
+    """Hash identifying a transcript, ignoring formatting-only differences"""
+    return hashlib.sha256(normalize_transcript(transcript).encode('utf-8')).hexdigest()
+
+def _words(value):
+    return NON_ALPHANUMERIC.sub(' ', value.lower()).split()
+
+def normalize_name(name):
+    """Lookup key for a borrower name: case, punctuation and titles are ignored"""
+    words = _words(name)
+    while words and words[0] in NAME_TITLES:
+        words.pop(0)
+    return ' '.join(words)
+
+def normalize_address(address):
+    """Lookup key for a property address: case and punctuation are ignored, street types abbreviated"""
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word).lower() for word in _words(address))
+
+class ResultStore:
+    """sqlite-backed extraction results with indexed lookup.
+
+    Args:
+        db_path: sqlite file shared by every process recording results.
+        retention_seconds: Results older than this are deleted when the store is opened;
+            None keeps them forever.
+    """
+
+    def __init__(self, db_path, retention_seconds=None):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_results ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, transcript_hash TEXT, created_at REAL,"
+            " model TEXT, prompt_version TEXT, requested_fields TEXT, fields TEXT,"
+            " borrower_key TEXT, address_key TEXT, duration_ms REAL, chunks INTEGER)"
+        )
+        for name, columns in [('hash', 'transcript_hash, created_at'), ('borrower', 'borrower_key, created_at'),
+                              ('address', 'address_key, created_at'), ('created', 'created_at')]:
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS extraction_results_{name} ON extraction_results ({columns})"
+            )
+        if retention_seconds is not None:
+            self._db.execute("DELETE FROM extraction_results WHERE created_at < ?",
+                             (time.time() - retention_seconds,))
+
+    def record(self, transcript_hash, fields, model, prompt_version, requested_fields=None,
+               duration_seconds=None, chunks=None):
+        """Store one extraction result (its list of field dicts); returns the row id"""
+        values = {field['field_name']: field['field_value'] for field in fields}
+        borrower = values.get("Borrower Name")
+        address = values.get("Property Address")
+        with self._lock:
+            return self._db.execute(
+                "INSERT INTO extraction_results (transcript_hash, created_at, model, prompt_version,"
+                " requested_fields, fields, borrower_key, address_key, duration_ms, chunks)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (transcript_hash, time.time(), model, prompt_version,
+                 None if requested_fields is None else json.dumps(requested_fields), json.dumps(fields),
+                 normalize_name(borrower) if borrower else None,
+                 normalize_address(address) if address else None,
+                 None if duration_seconds is None else round(duration_seconds * 1000, 3), chunks)
+            ).lastrowid
+
+    def query(self, borrower=None, address=None, since=None, until=None, transcript_hash=None, limit=100):
+        """Results matching every given filter, newest first.
+
+        ``borrower`` and ``address`` are normalized like the stored values, so case,
+        punctuation and street-type spelling don't matter. ``since`` and ``until`` are
+        Unix timestamps bounding when the result was recorded.
+        """
+        clauses, params = [], []
+        if borrower is not None:
+            clauses.append("borrower_key = ?")
+            params.append(normalize_name(borrower))
+        if address is not None:
+            clauses.append("address_key = ?")
+            params.append(normalize_address(address))
+        if transcript_hash is not None:
+            clauses.append("transcript_hash = ?")
+            params.append(transcript_hash)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, transcript_hash, created_at, model, prompt_version, requested_fields, fields,"
+                f" duration_ms, chunks FROM extraction_results{where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [{
+            "id": row_id,
+            "transcript_hash": row_hash,
+            "created_at": created_at,
+            "model": model,
+            "prompt_version": prompt_version,
+            "requested_fields": None if requested_fields is None else json.loads(requested_fields),
+            "fields": json.loads(fields),
+            "duration_ms": duration_ms,
+            "chunks": chunks,
+        } for row_id, row_hash, created_at, model, prompt_version, requested_fields, fields, duration_ms, chunks
+            in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,262 @@
+"""Deterministic rule-based extractor used as a fast path before the model.
+
+Values are read right after the field cues in FORM_1003_FIELDS (the spans recorded by
+build_match_index), checked against the field's format regex and scored with
+calculate_confidence. A field is treated as ambiguous and left for the model when its cues
+lead to more than one distinct value, or when another value of the same format follows
+in the sentence (or, for addresses, anywhere in the transcript).
+
+A rule value is always next to the cue it was read from, so that cue says nothing about
+whether the value is right: rule values only earn the context bonus when a second cue
+lies near them.
+"""
+import re
+from api.fields import FIELD_FORMATS, RESCAN_CHARS, build_match_index, calculate_confidence
+from api.normalize import canonical_value, normalize_property_type
+
+# How far past the end of a cue a value may start, and how long a value may run
+VALUE_WINDOW = 30
+MAX_VALUE_CHARS = 120
+SENTENCE_END = re.compile(r'[.!?]\s')
+# Cues that must lie near a rule value for the context bonus: the one it was read from and another
+RULE_CONTEXT_CUES = 2
+# Self-corrections right after a value make it ambiguous ("123 Main St - sorry, 321 Main St")
+CORRECTION = re.compile(r"[^.!?\n]{0,20}?\b(?:sorry|actually|no wait|i mean|make that|or rather)\b", re.IGNORECASE)
+
+MONEY_VALUE = re.compile(r'\$?\d{1,3}(?:,\d{3})+(?:\.\d{2})?\b')
+NAME_VALUE = re.compile(r"[A-Z][a-z'\-]+(?:[ \t]+[A-Z][a-z'\-]+){1,3}")
+ADDRESS_VALUE = re.compile(
+    r"\d+[A-Za-z]?[ \t]+(?:[A-Z0-9][A-Za-z0-9]*[ \t]+){1,4}?"
+    r"(?:Street|St|Avenue|Ave|Boulevard|Blvd|Road|Rd|Lane|Ln|Drive|Dr|Court|Ct|Circle|Cir|"
+    r"Way|Place|Pl|Terrace|Ter|Parkway|Pkwy|Highway|Hwy)\b\.?"
+    r"(?:,[ \t]*[A-Z][A-Za-z]*(?:[ \t]+[A-Z][A-Za-z]*)*)*"
+)
+EMPLOYER_VALUE = re.compile(r"[A-Z][\w&\-]*(?:[ \t]+[A-Z][\w&\-]*){0,3}")
+PROPERTY_TYPE_VALUE = re.compile(
+    r"\b(single[- ]family|condo(?:minium)?|town[- ]?(?:house|home)|multi[- ]family|manufactured)\b",
+    re.IGNORECASE
+)
+LOAN_PURPOSE_VALUE = re.compile(r"\b(refinanc\w*|purchas\w*|buy\w*)", re.IGNORECASE)
+
+# Words that can't be part of a borrower's name: lenders and other organisations, and the
+# words that start common phrases after "I'm" or "this is" ("I'm not sure", "this is Chase calling")
+NAME_STOP_WORDS = {
+    'bank', 'banking', 'capital', 'chase', 'company', 'corp', 'credit', 'fargo', 'financial', 'funding',
+    'group', 'home', 'inc', 'insurance', 'lending', 'llc', 'loans', 'mortgage', 'realty', 'rocket',
+    'services', 'union', 'wells',
+    'also', 'calling', 'currently', 'definitely', 'glad', 'going', 'happy', 'here', 'hoping', 'interested',
+    'just', 'looking', 'not', 'only', 'pretty', 'ready', 'really', 'so', 'sorry', 'still', 'sure',
+    'thinking', 'trying', 'very', 'wondering',
+}
+
+# Fields whose second value of the same format anywhere in the transcript makes the first
+# one ambiguous; for the others only the rest of the value's sentence is checked
+TRANSCRIPT_WIDE_VALUES = {"Property Address"}
+
+# What _value_after returns for a cue followed by competing values
+AMBIGUOUS = object()
+
+def _money(match):
+    value = match.group(0)
+    return value if value.startswith('$') else '$' + value
+
+def _loan_purpose(match):
+    return 'Refinance' if match.group(1).lower().startswith('refinanc') else 'Purchase'
+
+# Cues that are too ambiguous to read a value from ("working with <a colleague>")
+CUE_EXCLUSIONS = {
+    "Employment Info": re.compile(r"\bwith\s*$", re.IGNORECASE),
+}
+
+# Per field: value regex, whether the value must start right at the cue end, and how to
+# render the matched text
+VALUE_RULES = {
+    "Borrower Name": (NAME_VALUE, True, lambda m: m.group(0)),
+    "Loan Amount": (MONEY_VALUE, False, _money),
+    "Property Address": (ADDRESS_VALUE, False, lambda m: m.group(0).rstrip('.')),
+    "Annual Income": (MONEY_VALUE, False, _money),
+    "Employment Info": (EMPLOYER_VALUE, True, lambda m: m.group(0)),
+    "Property Type": (PROPERTY_TYPE_VALUE, False, lambda m: normalize_property_type(m.group(1))),
+    "Loan Purpose": (LOAN_PURPOSE_VALUE, False, _loan_purpose),
+}
+
+def _format_values(transcript, field_name):
+    """Every value in ``field_name``'s value format in the transcript, for TRANSCRIPT_WIDE_VALUES"""
+    return {match.group(0).rstrip('.') for match in VALUE_RULES[field_name][0].finditer(transcript)}
+
+def _has_other_value(transcript, field_name, match):
+    """Whether another value in the format of ``match`` follows it in its sentence"""
+    pattern = VALUE_RULES[field_name][0]
+    end = transcript.find('\n', match.end())
+    if end == -1:
+        end = len(transcript)
+    sentence_end = SENTENCE_END.search(transcript, match.end(), end)
+    return bool(pattern.search(transcript, match.end(), sentence_end.start() if sentence_end else end))
+
+def _read_value(transcript, field_name, start, end):
+    """Read the value following a cue spanning [start, end), short of the transcript-wide check.
+
+    Returns (value, matched, reach). ``value`` is None, AMBIGUOUS or the value, as for
+    _value_after; ``matched`` is the text the value was read from (None when nothing
+    matched), to check against the field's other values for TRANSCRIPT_WIDE_VALUES. Text
+    beyond the first sentence or line end after ``reach`` doesn't change the result.
+    """
+    pattern, anchored, render = VALUE_RULES[field_name]
+    exclusion = CUE_EXCLUSIONS.get(field_name)
+    if exclusion and exclusion.search(transcript, start, end):
+        return None, None, end
+    if anchored:
+        while end < len(transcript) and transcript[end] in ' \t':
+            end += 1
+        match = pattern.match(transcript, end)
+    else:
+        # Loan purpose cues can be the value itself ("refinance"), so search from the cue start
+        match = pattern.search(transcript, start if field_name == "Loan Purpose" else end,
+                               end + VALUE_WINDOW + MAX_VALUE_CHARS)
+        # The value must start near the cue, on the same line and in the same sentence
+        if match and match.start() > end:
+            gap = transcript[end:match.start()]
+            if len(gap) > VALUE_WINDOW or '\n' in gap or SENTENCE_END.search(gap):
+                match = None
+    if not match:
+        return None, None, end
+    matched, reach = match.group(0).rstrip('.'), max(end, match.end())
+    if CORRECTION.match(transcript, match.end()) or (
+            field_name not in TRANSCRIPT_WIDE_VALUES and _has_other_value(transcript, field_name, match)):
+        return AMBIGUOUS, matched, reach
+    value = render(match).strip()
+    if field_name == "Borrower Name" and any(word.lower() in NAME_STOP_WORDS for word in value.split()):
+        return None, matched, reach
+    format_pattern = FIELD_FORMATS.get(field_name)
+    if format_pattern and not format_pattern.match(value):
+        return None, matched, reach
+    return value, matched, reach
+
+def _with_other_values(value, matched, field_values):
+    """A cue's value once ``field_values`` (every value of its format) are known: AMBIGUOUS if others exist"""
+    if matched is not None and field_values - {matched}:
+        return AMBIGUOUS
+    return value
+
+def _value_after(transcript, field_name, start, end, field_values=None):
+    """Read the value for ``field_name`` following a cue spanning [start, end).
+
+    Returns None when there is no value, and AMBIGUOUS when the value is corrected or
+    competes with another one. ``field_values`` are the _format_values of a
+    TRANSCRIPT_WIDE_VALUES field, when the caller already has them.
+    """
+    value, matched, _ = _read_value(transcript, field_name, start, end)
+    if field_name in TRANSCRIPT_WIDE_VALUES and matched is not None:
+        if field_values is None:
+            field_values = _format_values(transcript, field_name)
+        value = _with_other_values(value, matched, field_values)
+    return value
+
+def _single_value(candidates):
+    """The value of a field whose cues gave ``candidates``, if they agree on exactly one"""
+    candidates = {value for value in candidates if value}
+    if len(candidates) == 1 and AMBIGUOUS not in candidates:
+        return candidates.pop()
+    return None
+
+def local_values(transcript, fields=None, match_index=None):
+    """The rule-read value of every requested field that had exactly one candidate value, by field name"""
+    if match_index is None:
+        match_index = build_match_index(transcript)
+    values = {}
+    for field_name in (fields or VALUE_RULES):
+        if field_name not in VALUE_RULES:
+            continue
+        spans = match_index.get(field_name, [])
+        field_values = None
+        if spans and field_name in TRANSCRIPT_WIDE_VALUES:
+            # Found once for all of the field's cues
+            field_values = _format_values(transcript, field_name)
+        value = _single_value(_value_after(transcript, field_name, start, end, field_values)
+                              for start, end in spans)
+        if value:
+            values[field_name] = value
+    return values
+
+def _closed(transcript, reach):
+    """Whether a sentence or line ends after ``reach``, so later text can't change what was read there"""
+    return transcript.find('\n', reach) != -1 or SENTENCE_END.search(transcript, reach) is not None
+
+class IncrementalLocalValues:
+    """local_values for a transcript that only grows, as in a live session.
+
+    What a cue reads is kept once a sentence or line has ended after it: later text can't
+    change it. Only cues whose sentence is still open, which are those near the end, are
+    read again, so an update doesn't grow with the length of the call. The values of fields
+    in TRANSCRIPT_WIDE_VALUES are found by scanning the new text (and the RESCAN_CHARS before
+    it) instead of the whole transcript. ``update`` returns
+    ``local_values(transcript, fields, match_index)``, as long as no value runs longer than
+    RESCAN_CHARS.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = [field_name for field_name in (fields or VALUE_RULES) if field_name in VALUE_RULES]
+        # Per field: (start, end) of a cue -> (value, matched text, closed)
+        self._cues = {field_name: {} for field_name in self.fields}
+        # Per transcript-wide field: the value matches found so far, as (start, end, text)
+        self._matches = {field_name: [] for field_name in self.fields if field_name in TRANSCRIPT_WIDE_VALUES}
+        self._scanned = 0
+
+    def update(self, transcript, match_index):
+        """The rule-read values of ``transcript``, which extends the one of the last update"""
+        self._scan(transcript)
+        values = {}
+        for field_name in self.fields:
+            cues = self._cues[field_name]
+            current = {}
+            for span in match_index.get(field_name, []):
+                read = cues.get(span)
+                if read is None or not read[2]:
+                    value, matched, reach = _read_value(transcript, field_name, *span)
+                    read = (value, matched, _closed(transcript, reach))
+                current[span] = read
+            self._cues[field_name] = current
+            if field_name in self._matches:
+                field_values = {text for _, _, text in self._matches[field_name]}
+                candidates = (_with_other_values(value, matched, field_values)
+                              for value, matched, _ in current.values())
+            else:
+                candidates = (value for value, _, _ in current.values())
+            value = _single_value(candidates)
+            if value:
+                values[field_name] = value
+        return values
+
+    def _scan(self, transcript):
+        """Find the transcript-wide fields' values in the new text"""
+        resume = max(0, self._scanned - RESCAN_CHARS)
+        for field_name, matches in self._matches.items():
+            # Values reaching into the rescanned tail may change with the new text
+            start = resume
+            while matches and matches[-1][1] > resume:
+                start = matches.pop()[0]
+            start = max(min(start, resume), matches[-1][1] if matches else 0)
+            matches.extend((match.start(), match.end(), match.group(0).rstrip('.'))
+                           for match in VALUE_RULES[field_name][0].finditer(transcript, start))
+        self._scanned = len(transcript)
+
+def extract_fields_locally(transcript, fields=None, match_index=None):
+    """Extract the requested Form 1003 fields with deterministic rules.
+
+    Returns scored field dicts (same shape as the model path, with "source": "rules")
+    for every field that had exactly one candidate value, normalized like model answers
+    and scored without the bonus for the cue they were read from.
+    """
+    if match_index is None:
+        match_index = build_match_index(transcript)
+    results = []
+    for field_name, value in local_values(transcript, fields, match_index).items():
+        canonical = canonical_value(field_name, value)
+        results.append({
+            "field_name": field_name,
+            "field_value": canonical,
+            "confidence_score": calculate_confidence(field_name, canonical, transcript, match_index,
+                                                     transcript.find(value), RULE_CONTEXT_CUES),
+            "source": "rules"
+        })
+    return results
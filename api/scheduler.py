@@ -0,0 +1,370 @@
+"""Rate-limit-aware scheduling of model calls.
+
+ModelScheduler sits between the extraction code and a model backend and has the
+backend's surface. Every call:
+
+- waits for quota from two token buckets, sized to the requests-per-minute and
+  tokens-per-minute quotas of the model API;
+- waits in a priority lane: while an interactive call is waiting, bulk calls don't take
+  quota ahead of it;
+- shares the result of an identical call that is already in flight instead of making
+  its own;
+- is retried with exponential backoff and full jitter on 429 and 5xx errors;
+- stops waiting, retrying or sharing another call's result once the request deadline
+  (see api/deadline.py) has passed, raising DeadlineExceeded.
+
+A call that would wait longer than its lane allows, finds its lane's queue full, or keeps
+hitting the quota raises ModelOverloaded, so callers can answer 429 instead of an empty
+result.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from api.async_client import ModelOverloaded
+from api.deadline import DeadlineExceeded, check_deadline, time_left, within_deadline
+from api.metrics import MODEL_COALESCED, MODEL_RETRIES, SCHEDULER_REJECTED, SCHEDULER_WAIT, SCHEDULER_WAITING
+from api.prompts import estimate_tokens
+
+# Lanes, highest priority first
+INTERACTIVE, BULK = 'interactive', 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+QUOTA_STATUS = 429
+# google.api_core errors (and our fake backend's) start their message with the HTTP status
+STATUS_PREFIX = re.compile(r'^\s*(\d{3})\b')
+
+_lane = ContextVar('model_lane', default=INTERACTIVE)
+
+@contextmanager
+def model_lane(lane):
+    """Run model calls made in the ``with`` block (in this thread or task) in ``lane``"""
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane: {lane}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def current_lane():
+    return _lane.get()
+
+def error_status(error):
+    """The HTTP status of a model error, or None when it has none"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return int(code)
+    match = STATUS_PREFIX.match(str(error))
+    return int(match.group(1)) if match else None
+
+def _past_deadline(wait):
+    """Whether waiting ``wait`` seconds would run past the request deadline"""
+    left = time_left()
+    return left is not None and wait >= left
+
+def is_retryable(error):
+    return isinstance(error, TimeoutError) or error_status(error) in RETRYABLE_STATUSES
+
+class TokenBucket:
+    """Holds up to ``capacity`` tokens, refilled continuously at ``per_minute`` tokens a minute.
+
+    Not thread-safe on its own; ModelScheduler only uses it under its lock. The level
+    can go negative when actual usage turns out higher than estimated, which pushes
+    later calls back until the difference has been refilled.
+    """
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.clock = clock
+        self.level = float(self.capacity)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` tokens are available (0 if they are now)"""
+        self._refill()
+        # A call bigger than the whole bucket waits for a full bucket, then overdraws it
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def drain(self):
+        """Empty the bucket, e.g. after the API reported the quota exhausted"""
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+class ModelScheduler:
+    """Admission control, priority lanes, coalescing and retries in front of a model backend.
+
+    Args:
+        model: The backend to call (see api/backends.py).
+        requests_per_minute: Request quota; 0 means unlimited.
+        tokens_per_minute: Token quota (prompt plus output); 0 means unlimited.
+        max_waiting: Calls allowed to wait for quota per lane before new ones are rejected.
+        max_wait: Longest wait for quota per lane, in seconds, as a dict keyed by lane.
+        max_retries: Retries after a 429, 5xx or timeout error.
+        base_delay: Backoff before the first retry, in seconds; doubles with every retry.
+        max_delay: Cap on the backoff, in seconds.
+        output_tokens: Output tokens assumed per call when reserving token quota; the
+            reservation is corrected from the response's reported usage.
+    """
+
+    def __init__(self, model, requests_per_minute=0, tokens_per_minute=0, max_waiting=64, max_wait=None,
+                 max_retries=2, base_delay=0.5, max_delay=8.0, output_tokens=256, poll_interval=0.05):
+        self.model = model
+        self.name = getattr(model, 'name', None)
+        self.model_name = model.model_name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_waiting = max_waiting
+        self.max_wait = {INTERACTIVE: 10.0, BULK: 300.0, **(max_wait or {})}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.output_tokens = output_tokens
+        self.poll_interval = poll_interval
+        self._lock = threading.Condition()
+        self._waiting = {lane: 0 for lane in LANES}
+        self._in_flight = {}
+        # Calls sent to the backend and not yet answered
+        self._running = 0
+
+    def warm_up(self):
+        """Set up the backend ahead of its first call"""
+        warm_up = getattr(self.model, 'warm_up', None)
+        if warm_up is not None:
+            warm_up()
+
+    def waiting(self, lane):
+        return self._waiting[lane]
+
+    def queued(self):
+        """Calls waiting for quota in any lane plus calls running at the backend"""
+        with self._lock:
+            return sum(self._waiting.values()) + self._running
+
+    @contextmanager
+    def _running_call(self):
+        with self._lock:
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _stream(self, prompt, kwargs):
+        """The backend's stream, counted as running until it ends or is closed"""
+        with self._running_call():
+            yield from self.model.generate_content(prompt, stream=True, **kwargs)
+
+    def _cost(self, prompt):
+        return estimate_tokens(prompt if isinstance(prompt, str) else str(prompt)) + self.output_tokens
+
+    def _reject(self, lane, reason, retry_after):
+        SCHEDULER_REJECTED.inc(lane=lane, reason=reason)
+        return ModelOverloaded("Model quota exhausted, try again later" if reason != 'queue_full'
+                               else "Too many model calls waiting, try again later",
+                               retry_after=max(1, int(retry_after + 0.999)))
+
+    def _try_admit(self, cost, lane):
+        """Take quota for one call if ``lane`` may go now; returns 0, or seconds to wait. Hold the lock."""
+        if any(self._waiting[higher] for higher in LANES[:LANES.index(lane)]):
+            return self.poll_interval
+        waits = [bucket.wait_time(amount) for bucket, amount in ((self.requests, 1), (self.tokens, cost)) if bucket]
+        wait = max(waits, default=0.0)
+        if wait:
+            return wait
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(cost)
+        return 0.0
+
+    def _enter(self, lane):
+        if self._waiting[lane] >= self.max_waiting:
+            raise self._reject(lane, 'queue_full', self.max_wait[lane])
+        self._waiting[lane] += 1
+        SCHEDULER_WAITING.inc(lane=lane)
+
+    def _leave(self, lane):
+        self._waiting[lane] -= 1
+        SCHEDULER_WAITING.dec(lane=lane)
+        # Lower lanes may go now
+        self._lock.notify_all()
+
+    def _admit(self, cost, lane):
+        """Block until quota for one call is taken, or raise ModelOverloaded"""
+        started = time.monotonic()
+        check_deadline()
+        with self._lock:
+            wait = self._try_admit(cost, lane) if not any(self._waiting.values()) else None
+            if wait == 0:
+                SCHEDULER_WAIT.observe(0.0, lane=lane)
+                return
+            self._enter(lane)
+            try:
+                while True:
+                    wait = self._try_admit(cost, lane)
+                    if not wait:
+                        break
+                    if time.monotonic() + wait - started > self.max_wait[lane]:
+                        raise self._reject(lane, 'quota_wait', wait)
+                    if _past_deadline(wait):
+                        raise DeadlineExceeded("Request deadline exceeded waiting for model quota")
+                    self._lock.wait(wait)
+            finally:
+                self._leave(lane)
+        SCHEDULER_WAIT.observe(time.monotonic() - started, lane=lane)
+
+    async def _admit_async(self, cost, lane):
+        """Async variant of _admit; sleeps on the event loop instead of blocking it"""
+        started = time.monotonic()
+        check_deadline()
+        with self._lock:
+            self._enter(lane)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_admit(cost, lane)
+                if not wait:
+                    break
+                if time.monotonic() + wait - started > self.max_wait[lane]:
+                    raise self._reject(lane, 'quota_wait', wait)
+                if _past_deadline(wait):
+                    raise DeadlineExceeded("Request deadline exceeded waiting for model quota")
+                await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                self._leave(lane)
+        SCHEDULER_WAIT.observe(time.monotonic() - started, lane=lane)
+
+    def _settle(self, cost, response):
+        """Correct the token reservation with the usage the response reports"""
+        usage = getattr(response, 'usage_metadata', None) or response
+        used = (getattr(usage, 'prompt_token_count', 0) or 0) + (getattr(usage, 'candidates_token_count', 0) or 0)
+        if used and self.tokens:
+            with self._lock:
+                self.tokens.take(used - cost)
+
+    def _retry_delay(self, error, attempt, lane):
+        """Backoff before retrying after ``error``, or raise the error to give up"""
+        status = error_status(error)
+        if status == QUOTA_STATUS:
+            # Everyone sharing this quota should slow down, not just this call
+            with self._lock:
+                if self.requests:
+                    self.requests.drain()
+        if not is_retryable(error) or attempt >= self.max_retries:
+            if status == QUOTA_STATUS:
+                raise self._reject(lane, 'quota_error', self.max_delay) from error
+            raise error
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if _past_deadline(delay):
+            raise DeadlineExceeded("Request deadline exceeded retrying the model call") from error
+        MODEL_RETRIES.inc(status=status or 'timeout')
+        return delay
+
+    def _call(self, prompt, lane, kwargs):
+        cost = self._cost(prompt)
+        for attempt in range(self.max_retries + 1):
+            self._admit(cost, lane)
+            try:
+                with self._running_call():
+                    response = self.model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt, lane))
+                continue
+            self._settle(cost, response)
+            return response
+
+    async def _call_async(self, prompt, lane, kwargs):
+        cost = self._cost(prompt)
+        for attempt in range(self.max_retries + 1):
+            await self._admit_async(cost, lane)
+            try:
+                with self._running_call():
+                    response = await within_deadline(self.model.generate_content_async(prompt, **kwargs))
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, lane))
+                continue
+            self._settle(cost, response)
+            return response
+
+    def _join(self, prompt, kwargs):
+        """The key for this call and the in-flight Future to share, or a new one this call must resolve"""
+        key = (prompt, json.dumps(kwargs, sort_keys=True, default=repr))
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                MODEL_COALESCED.inc()
+                return key, future, False
+            future = self._in_flight[key] = Future()
+            return key, future, True
+
+    def _resolve(self, key, future, response=None, error=None):
+        with self._lock:
+            del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        lane = current_lane()
+        if stream:
+            # Streams are neither shared nor retried: their chunks go straight to one caller
+            self._admit(self._cost(prompt), lane)
+            return self._stream(prompt, kwargs)
+        key, future, leader = self._join(prompt, kwargs)
+        if not leader:
+            try:
+                return future.result(timeout=time_left())
+            except DeadlineExceeded:
+                # The shared call ran out of its own request's time; this request may have more
+                check_deadline()
+                return self.generate_content(prompt, **kwargs)
+            except TimeoutError:
+                if future.done():
+                    raise
+                raise DeadlineExceeded("Request deadline exceeded waiting for a shared model call") from None
+        try:
+            response = self._call(prompt, lane, kwargs)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, response)
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        lane = current_lane()
+        key, future, leader = self._join(prompt, kwargs)
+        if not leader:
+            # Shielded: giving up at this call's deadline mustn't cancel the leader's call
+            try:
+                return await within_deadline(asyncio.shield(asyncio.wrap_future(future)))
+            except DeadlineExceeded:
+                check_deadline()
+                return await self.generate_content_async(prompt, **kwargs)
+        try:
+            response = await self._call_async(prompt, lane, kwargs)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, response)
+        return response
@@ -0,0 +1,64 @@
+"""Bulk confidence scoring of stored (field, value, transcript) triples, without the model.
+
+score_batch gives the same scores as calculate_confidence for every triple, without
+repeating work across rows. Rows are grouped by transcript, so each transcript is scanned
+for field cues once, and only for the fields its rows need. Value checks (format and
+field-specific bonus) run once per distinct (field, value). The context window is checked
+once per distinct (transcript, field, value). The four check outcomes then index a table
+of the 16 possible scores, built with combine_confidence, so the arithmetic and rounding
+are those of the scalar function.
+
+Input is columnar: three equal-length sequences, or a table with named columns (a pandas
+DataFrame, a pyarrow Table, or a dict of lists) through score_table. Neither pandas nor
+pyarrow is needed unless the caller uses them.
+"""
+from array import array
+from itertools import product
+from api.fields import FIELD_CUES, build_match_index, combine_confidence, context_hit, value_checks
+
+# Every score by (pattern hit, format hit, context hit, bonus)
+SCORES = {checks: combine_confidence(*checks) for checks in product((False, True), repeat=4)}
+
+def score_batch(field_names, values, transcripts):
+    """Confidence scores for parallel columns of field names, values and transcripts.
+
+    Returns an ``array('d')`` whose i-th entry equals
+    ``calculate_confidence(field_names[i], values[i], transcripts[i])``.
+    """
+    field_names, values, transcripts = list(field_names), list(values), list(transcripts)
+    if not len(field_names) == len(values) == len(transcripts):
+        raise ValueError("field_names, values and transcripts must have the same length")
+
+    rows_by_transcript = {}
+    for row, transcript in enumerate(transcripts):
+        rows_by_transcript.setdefault(transcript, []).append(row)
+
+    checks_by_value = {}
+    scores = array('d', [0.0]) * len(field_names)
+    for transcript, rows in rows_by_transcript.items():
+        # Cues of unknown field names never match, so they aren't scanned for
+        wanted = [field for field in {field_names[row] for row in rows} if field in FIELD_CUES]
+        match_index = build_match_index(transcript, wanted) if wanted else {}
+        context = {}
+        for row in rows:
+            field_name, value = field_names[row], values[row]
+            checks = checks_by_value.get((field_name, value))
+            if checks is None:
+                checks = checks_by_value[(field_name, value)] = value_checks(field_name, value)
+            spans = match_index.get(field_name, [])
+            hit = context.get((field_name, value))
+            if hit is None:
+                hit = context[(field_name, value)] = context_hit(field_name, spans, transcript,
+                                                                 transcript.find(value), len(value))
+            scores[row] = SCORES[(bool(spans), checks[0], hit, checks[1])]
+    return scores
+
+def score_table(table, field_column='field_name', value_column='field_value', transcript_column='transcript'):
+    """score_batch over named columns of a pandas DataFrame, pyarrow Table or dict of lists"""
+    return score_batch(_column(table, field_column), _column(table, value_column),
+                       _column(table, transcript_column))
+
+def _column(table, name):
+    # pyarrow tables have .column(); DataFrames and dicts are indexed by column name
+    column = table.column(name) if hasattr(table, 'column') else table[name]
+    return column.to_pylist() if hasattr(column, 'to_pylist') else list(column)
@@ -0,0 +1,361 @@
+"""Live call sessions: incremental extraction while a call is still going on.
+
+A session holds the transcript received so far, an IncrementalMatchIndex over it and the
+current state of every extracted field. Appending a transcript delta updates the match
+index from the new text only, and confidence is recomputed from that index and cached
+value positions instead of rescanning the transcript for every field. The rules re-read
+only the cues whose sentence is still open (IncrementalLocalValues).
+
+Sessions are stored in sqlite so every worker process can serve them: one row per session
+plus one row per appended delta, so an append writes only the new text. Each process keeps
+recently used sessions in memory (with their match index) and checks the stored version
+before using one, so updates made through another process are picked up and concurrent
+updates of the same session are detected. Sessions idle for longer than ``idle_seconds``
+are removed. The database is opened on first use, not when the store is created.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from api.chunking import CONFIDENCE_MARGIN, normalize_value
+from api.fields import FORM_1003_FIELDS, IncrementalMatchIndex, calculate_confidence
+from api.normalize import canonical_value
+from api.metrics import SESSIONS_EXPIRED
+from api.rules import RULE_CONTEXT_CUES, IncrementalLocalValues
+
+logger = logging.getLogger(__name__)
+
+class SessionConflict(Exception):
+    """The session was updated by another request since it was loaded"""
+
+class SessionLimitExceeded(Exception):
+    """No more sessions can be opened until some are closed or expire"""
+
+class Session:
+    """One live call: its transcript so far, match index and current fields.
+
+    ``fields`` is the requested field subset, or None for every field. ``processed`` is how
+    much of the transcript the model has seen; the rest is pending until enough of it
+    has arrived to be worth a model call.
+    """
+
+    def __init__(self, session_id, fields=None, transcript='', state=None, processed=0, chunks=0,
+                 version=0, created_at=None, updated_at=None, wording=None):
+        self.id = session_id
+        self.fields = fields
+        self.index = IncrementalMatchIndex(fields)
+        # What the rules read at each cue, kept between appends
+        self.rule_values = IncrementalLocalValues(fields)
+        if transcript:
+            self.index.append(transcript)
+        self.state = dict(state or {})
+        self.processed = processed
+        self.chunks = chunks
+        self.version = version
+        self.created_at = created_at
+        self.updated_at = updated_at
+        # Held while a request updates the session, so a concurrent one can be turned away
+        self.lock = threading.Lock()
+        # Deltas appended since the session was last saved
+        self.unsaved = []
+        # First position of each field value in the transcript, -1 while it doesn't occur
+        self._value_pos = {}
+        # How each normalized value was worded in the transcript, by (field_name, value)
+        self._wording = {(field_name, value): text for field_name, value, text in wording or []}
+
+    @property
+    def transcript(self):
+        return self.index.transcript
+
+    @property
+    def pending_chars(self):
+        return len(self.transcript) - self.processed
+
+    def append(self, text):
+        """Append a transcript delta"""
+        start = len(self.transcript)
+        self.index.append(text)
+        self.unsaved.append(text)
+        # Values not seen yet can only start in the new text, or just before it
+        for value, pos in self._value_pos.items():
+            if pos == -1:
+                self._value_pos[value] = self.transcript.find(value, max(0, start - len(value) + 1))
+
+    def value_pos(self, value):
+        pos = self._value_pos.get(value)
+        if pos is None:
+            pos = self._value_pos[value] = self.transcript.find(value)
+        return pos
+
+    def score(self, field_name, value, source):
+        """A field dict for the normalized ``value``, scored against the transcript so far.
+
+        The value is located in the transcript by its original wording, when it was
+        normalized (see score_pairs).
+        """
+        wording = self._wording.get((field_name, value), value)
+        return {
+            "field_name": field_name,
+            "field_value": value,
+            "confidence_score": calculate_confidence(field_name, value, self.transcript, self.index.spans,
+                                                     self.value_pos(wording),
+                                                     RULE_CONTEXT_CUES if source == 'rules' else 1),
+            "source": source
+        }
+
+    def score_pairs(self, pairs, source='model'):
+        """Field dicts for (field_name, value) pairs, with the values normalized"""
+        fields = []
+        for field_name, value in pairs:
+            canonical = canonical_value(field_name, value)
+            if canonical != value:
+                self._wording[(field_name, canonical)] = value
+            fields.append(self.score(field_name, canonical, source))
+        return fields
+
+    def local_fields(self):
+        """Fields the rule-based extractor reads from the whole transcript, scored"""
+        values = self.rule_values.update(self.transcript, self.index.spans)
+        return self.score_pairs(values.items(), 'rules')
+
+    def merge(self, fields):
+        """Fold newly extracted fields into the session's fields.
+
+        As in merge_chunk_fields, a new value within CONFIDENCE_MARGIN of the current one's
+        confidence replaces it, so corrections later in the call win. Fields that have had
+        different values are marked with "conflict": True and list the ``candidates``.
+        """
+        for field in fields:
+            field_name = field['field_name']
+            current = self.state.get(field_name)
+            if current is None:
+                self.state[field_name] = dict(field)
+                continue
+            replace = field['confidence_score'] >= current['confidence_score'] - CONFIDENCE_MARGIN
+            if normalize_value(field['field_value']) == normalize_value(current['field_value']):
+                if replace:
+                    self.state[field_name] = {**current, **field}
+                continue
+            candidates = current.get('candidates') or [current['field_value']]
+            if normalize_value(field['field_value']) not in {normalize_value(value) for value in candidates}:
+                candidates = candidates + [field['field_value']]
+            self.state[field_name] = {**(field if replace else current), "conflict": True, "candidates": candidates}
+
+    def rescore(self):
+        """Recompute every field's confidence against the transcript so far"""
+        for field_name, field in self.state.items():
+            rescored = self.score(field_name, field['field_value'], field['source'])
+            field['confidence_score'] = rescored['confidence_score']
+
+    def saved_wording(self):
+        """(field_name, value, wording) of the current values that were normalized, for storing"""
+        return [[field_name, value, text] for (field_name, value), text in self._wording.items()
+                if self.state.get(field_name, {}).get('field_value') == value]
+
+    def known_values(self):
+        """Current value of every extracted field, in form order"""
+        return {field_name: self.state[field_name]['field_value']
+                for field_name in FORM_1003_FIELDS if field_name in self.state}
+
+    def pending_text(self, context_chars=0):
+        """The text the model hasn't seen, after up to ``context_chars`` of text it has"""
+        start = max(0, self.processed - context_chars)
+        if start:
+            # Start the context at a speaker turn when one begins inside it
+            line = self.transcript.find('\n', start, self.processed - 1)
+            if line != -1:
+                start = line + 1
+        return self.transcript[start:]
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "fields": [self.state[field_name] for field_name in FORM_1003_FIELDS if field_name in self.state],
+            "transcript_chars": len(self.transcript),
+            "pending_chars": self.pending_chars,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class SessionStore:
+    """sqlite-backed live sessions, with the most recently used ones kept in memory.
+
+    Args:
+        db_path: sqlite file shared by every process serving the sessions API.
+        idle_seconds: Sessions not updated for this long expire.
+        max_sessions: Sessions that can be open at once.
+        max_chars: Longest transcript a session may grow to; checked by the caller.
+        cache_size: Sessions kept in memory, with their match index, per process.
+    """
+
+    def __init__(self, db_path, idle_seconds=900, max_sessions=1000, max_chars=200000, cache_size=256):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._connection = None
+
+    @property
+    def _db(self):
+        """The sqlite connection, opened with the schema on first use (callers hold _lock)"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, fields TEXT, state TEXT, processed INTEGER, chunks INTEGER,"
+                " version INTEGER, created_at REAL, updated_at REAL, wording TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS session_text ("
+                " session_id TEXT, seq INTEGER, text TEXT, PRIMARY KEY (session_id, seq))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_idle ON sessions (updated_at)")
+            # Databases created before the wording of normalized values was stored
+            if 'wording' not in {row[1] for row in db.execute("PRAGMA table_info(sessions)")}:
+                db.execute("ALTER TABLE sessions ADD COLUMN wording TEXT")
+            self._connection = db
+        return self._connection
+
+    def _remember(self, session):
+        """Keep ``session`` in the in-memory cache, evicting the least recently used"""
+        self._cache[session.id] = session
+        self._cache.move_to_end(session.id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def create(self, fields=None):
+        """Open a session for ``fields`` (None for every field); raises SessionLimitExceeded when full"""
+        self.expire()
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                (open_sessions,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+                if open_sessions >= self.max_sessions:
+                    raise SessionLimitExceeded(f"At most {self.max_sessions} sessions can be open")
+                self._db.execute(
+                    "INSERT INTO sessions (id, fields, state, processed, chunks, version, created_at, updated_at,"
+                    " wording) VALUES (?, ?, ?, 0, 0, 0, ?, ?, ?)",
+                    (session_id, json.dumps(fields), json.dumps({}), now, now, json.dumps([]))
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            session = Session(session_id, fields, created_at=now, updated_at=now)
+            self._remember(session)
+        return session
+
+    def get(self, session_id):
+        """The session, loaded from sqlite unless this process has its latest version; None if unknown or expired"""
+        with self._lock:
+            row = self._db.execute("SELECT version, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or row[1] < time.time() - self.idle_seconds:
+                self._cache.pop(session_id, None)
+                return None
+            session = self._cache.get(session_id)
+            if session is not None and session.version == row[0]:
+                self._cache.move_to_end(session_id)
+                return session
+
+            fields, state, processed, chunks, version, created_at, updated_at, wording = self._db.execute(
+                "SELECT fields, state, processed, chunks, version, created_at, updated_at, wording"
+                " FROM sessions WHERE id = ?",
+                (session_id,)
+            ).fetchone()
+            text = self._db.execute(
+                "SELECT text FROM session_text WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+            session = Session(session_id, json.loads(fields), ''.join(chunk for (chunk,) in text), json.loads(state),
+                              processed, chunks, version, created_at, updated_at, json.loads(wording or '[]'))
+            self._remember(session)
+        return session
+
+    def save(self, session):
+        """Store the session's new deltas and state; raises SessionConflict if it changed since it was loaded"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._db.execute(
+                    "UPDATE sessions SET state = ?, wording = ?, processed = ?, chunks = ?, version = version + 1,"
+                    " updated_at = ? WHERE id = ? AND version = ?",
+                    (json.dumps(session.state), json.dumps(session.saved_wording()), session.processed,
+                     session.chunks + len(session.unsaved), now, session.id, session.version)
+                ).rowcount
+                if not updated:
+                    raise SessionConflict("Session was updated by another request")
+                self._db.executemany(
+                    "INSERT INTO session_text VALUES (?, ?, ?)",
+                    [(session.id, session.chunks + offset, text) for offset, text in enumerate(session.unsaved)]
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                self._cache.pop(session.id, None)
+                raise
+        session.chunks += len(session.unsaved)
+        session.unsaved = []
+        session.version += 1
+        session.updated_at = now
+
+    def discard(self, session_id):
+        """Forget this process's copy of a session, e.g. after an update failed part way"""
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def delete(self, session_id):
+        """Close a session; returns whether it existed"""
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+                self._db.execute("DELETE FROM session_text WHERE session_id = ?", (session_id,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return bool(deleted)
+
+    def expire(self):
+        """Remove sessions idle for longer than idle_seconds; returns how many"""
+        cutoff = time.time() - self.idle_seconds
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [session_id for (session_id,) in self._db.execute(
+                    "SELECT id FROM sessions WHERE updated_at < ?", (cutoff,)
+                ).fetchall()]
+                self._db.executemany("DELETE FROM session_text WHERE session_id = ?", [(i,) for i in expired])
+                self._db.executemany("DELETE FROM sessions WHERE id = ?", [(i,) for i in expired])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            for session_id in expired:
+                self._cache.pop(session_id, None)
+        if expired:
+            SESSIONS_EXPIRED.inc(len(expired))
+            logger.info("Expired idle sessions", extra={"sessions": len(expired)})
+        return len(expired)
+
+    def describe(self, session):
+        """The session as a response dict, with when it expires if left idle"""
+        return {**session.to_dict(), "expires_at": session.updated_at + self.idle_seconds}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,106 @@
+"""JSON output mode: response schemas for the model and validation of its answers.
+
+In this mode the model is asked for one JSON object per transcript, keyed by field name,
+with a string value or null for each requested field. Gemini constrains its output to
+the schema given in ``generation_config``; answers are still validated here, since other
+backends (and truncated responses) can break it.
+
+Answers that aren't valid JSON get cheap repairs first (markdown fences or chatter around
+the JSON are cut off). MalformedResponse means no repair worked and the call should be
+retried.
+"""
+import json
+import re
+from api.fields import FORM_1003_FIELDS
+from api.metrics import STRUCTURED_OUTPUT
+
+JSON_MIME_TYPE = 'application/json'
+# From the first opening bracket to the last closing one, to cut fences and chatter
+JSON_SPAN = re.compile(r'[\[{].*[\]}]', re.DOTALL)
+
+class MalformedResponse(ValueError):
+    """The model's answer does not match the response schema"""
+
+def response_schema(fields=None):
+    """Schema of a single-transcript answer for ``fields`` (default: every field)"""
+    fields = list(fields or FORM_1003_FIELDS)
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string", "nullable": True} for field in fields},
+        "required": fields,
+    }
+
+def batch_response_schema(fields=None):
+    """Schema of a batch answer: one response_schema object per transcript, in order"""
+    return {"type": "array", "items": response_schema(fields)}
+
+def generation_config(schema):
+    """``generation_config`` for a model call constrained to ``schema``"""
+    return {"response_mime_type": JSON_MIME_TYPE, "response_schema": schema}
+
+def wants_json(generation_config):
+    """Whether a model call's ``generation_config`` asks for JSON output"""
+    if not generation_config:
+        return False
+    if isinstance(generation_config, dict):
+        return generation_config.get('response_mime_type') == JSON_MIME_TYPE
+    return getattr(generation_config, 'response_mime_type', None) == JSON_MIME_TYPE
+
+def load_answer(text):
+    """Parse the model's JSON answer, repairing it if it is wrapped in fences or chatter"""
+    try:
+        answer = json.loads(text)
+    except ValueError:
+        span = JSON_SPAN.search(text)
+        try:
+            answer = json.loads(span.group()) if span else None
+        except ValueError:
+            answer = None
+        if answer is None:
+            STRUCTURED_OUTPUT.inc(outcome='invalid')
+            raise MalformedResponse("Model answer is not valid JSON")
+        STRUCTURED_OUTPUT.inc(outcome='repaired')
+    else:
+        STRUCTURED_OUTPUT.inc(outcome='valid')
+    return answer
+
+def answer_fields(answer, fields=None):
+    """Check one answer object against the schema and return its (field_name, value) pairs.
+
+    Fields answered null, empty or 'Not specified' are left out, as are keys outside
+    ``fields``. Numbers are accepted as their string form.
+    """
+    if not isinstance(answer, dict):
+        raise MalformedResponse("Model answer is not a JSON object")
+    pairs = []
+    for field_name in fields or FORM_1003_FIELDS:
+        value = answer.get(field_name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise MalformedResponse(f"Model answer for {field_name} is not a string")
+        value = str(value).strip()
+        if value and value.lower() != 'not specified':
+            pairs.append((field_name, value))
+    return pairs
+
+def parse_answer(text, fields=None):
+    """(field_name, value) pairs from a single-transcript JSON answer"""
+    return answer_fields(load_answer(text), fields)
+
+def parse_batch_answer(text, count, fields=None):
+    """Per-transcript (field_name, value) pairs from a batch JSON answer.
+
+    Returns a list of length ``count``, with None for transcripts the array has no valid
+    object for. Raises MalformedResponse when the answer is not a JSON array at all.
+    """
+    answers = load_answer(text)
+    if not isinstance(answers, list):
+        raise MalformedResponse("Model answer is not a JSON array")
+    results = [None] * count
+    for index, answer in enumerate(answers[:count]):
+        try:
+            results[index] = answer_fields(answer, fields)
+        except MalformedResponse:
+            pass
+    return results
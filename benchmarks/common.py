@@ -0,0 +1,59 @@
+"""Corpus and statistics helpers shared by the benchmarks.
+
+Kept apart from benchmarks/pipeline.py, which imports the API app: the load test only
+needs these, and against a running server (--url) it shouldn't pay for importing the app
+or build a model client in the process that generates the load.
+"""
+import math
+import random
+from tests.test_scenarios import test_scenarios
+
+FILLER_TURNS = [
+    "Agent: We also went over property taxes and homeowner's insurance requirements.",
+    "Caller: Sure, that makes sense. What about closing costs?",
+    "Agent: Closing costs usually run between two and five percent of the purchase price.",
+    "Caller: Okay. And how long does underwriting take these days?",
+    "Agent: Typically a few weeks, depending on how quickly documents come in.",
+]
+
+def build_corpus(count, length, seed):
+    """Generate ``count`` scenario transcripts, padded with filler turns to ``length`` chars.
+
+    The scenario generators draw from the global ``random``; its state is restored afterwards,
+    so building a corpus doesn't change the random numbers the rest of the process sees.
+    """
+    rng = random.Random(seed)
+    scenarios = [scenario for scenario in test_scenarios if scenario['should_pass']]
+    corpus = []
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        for i in range(count):
+            transcript = scenarios[i % len(scenarios)]['transcript']()
+            turns = [transcript]
+            while sum(len(turn) + 1 for turn in turns) < length:
+                turns.append(rng.choice(FILLER_TURNS))
+            corpus.append('\n'.join(turns))
+    finally:
+        random.setstate(state)
+    return corpus
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'total_s': round(total, 6),
+        'mean_ms': round(1000 * total / len(samples), 4) if samples else 0.0,
+        'p50_ms': round(1000 * percentile(samples, 0.50), 4),
+        'p95_ms': round(1000 * percentile(samples, 0.95), 4),
+        'p99_ms': round(1000 * percentile(samples, 0.99), 4),
+        'throughput_per_s': round(len(samples) / total, 2) if total else None,
+    }
@@ -0,0 +1,224 @@
+"""Open-loop load test of the HTTP API, for capacity planning.
+
+Requests arrive at a fixed offered rate (Poisson or evenly spaced), whether or not earlier
+ones have finished, and are sent by a pool of concurrent clients. Latency is measured
+from each request's scheduled arrival, so time spent waiting for a free client counts:
+an overloaded server shows up as growing latency instead of a quietly lower send rate.
+Each rate in ``--rates`` is run in turn and reported with throughput, p50/p95/p99
+latency and error and timeout rates. The saturation point is the first rate the server
+can't sustain: throughput falls behind the arrival rate, p99 exceeds ``--slo-ms``, or
+errors and timeouts exceed ``--max-error-rate``.
+
+Usage:
+    # In-process Flask app with the fake model (FAKE_MODEL_LATENCY seconds per call)
+    python -m benchmarks.load --serve --latency 1.5 --rates 2,4,8,16 --duration 30
+    # A running server, e.g. gunicorn with MODEL_BACKEND=fake and the pod's worker settings
+    python -m benchmarks.load --url http://localhost:8000 --rates 5,10,20,40 --input calls.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The load test never talks to a real model
+os.environ.setdefault('MODEL_BACKEND', 'fake')
+
+import requests
+from requests.adapters import HTTPAdapter
+from api.bulk import read_records
+from benchmarks.common import build_corpus, percentile
+
+# A rate is sustained while throughput stays within this fraction of the arrival rate
+MIN_THROUGHPUT_RATIO = 0.9
+
+def arrival_times(rate, duration, arrival='poisson', seed=0):
+    """Offsets in seconds, from the start of a step, at which its requests are sent"""
+    rng = random.Random(seed)
+    times, offset = [], 0.0
+    while True:
+        offset += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+        if offset >= duration:
+            return times
+        times.append(offset)
+
+def _send(session, url, transcript, scheduled, timeout):
+    """Send one request; returns (outcome, status, latency from ``scheduled``, finish time)"""
+    try:
+        response = session.post(url, json={"transcript": transcript}, timeout=timeout)
+        status = response.status_code
+        outcome = 'ok' if status == 200 else 'error'
+    except requests.Timeout:
+        outcome, status = 'timeout', None
+    except requests.RequestException:
+        outcome, status = 'error', None
+    finished = time.perf_counter()
+    return outcome, status, finished - scheduled, finished
+
+def run_step(url, transcripts, rate, duration, concurrency=64, timeout=30.0, arrival='poisson', seed=0,
+             unique=True):
+    """Offer ``rate`` requests per second for ``duration`` seconds and summarize the responses.
+
+    With ``unique``, every request's transcript gets a distinct closing line, so repeats of
+    the corpus aren't answered from the extraction cache.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    offsets = arrival_times(rate, duration, arrival, seed)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        start = time.perf_counter()
+        for index, offset in enumerate(offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            transcript = transcripts[index % len(transcripts)]
+            if unique:
+                transcript += f"\nAgent: Thanks, that's everything for call {seed}-{rate}-{index}."
+            futures.append(clients.submit(_send, session, url, transcript, start + offset, timeout))
+        results = [future.result() for future in futures]
+    session.close()
+
+    # Throughput over the whole step, including the time taken to drain the last requests
+    elapsed = max([duration] + [finished - start for _, _, _, finished in results])
+    latencies = sorted(latency for outcome, _, latency, _ in results if outcome == 'ok')
+    statuses = {}
+    for outcome, status, _, _ in results:
+        key = str(status) if status is not None else outcome
+        statuses[key] = statuses.get(key, 0) + 1
+    requests_sent = len(results)
+    errors = sum(1 for outcome, _, _, _ in results if outcome == 'error')
+    timeouts = sum(1 for outcome, _, _, _ in results if outcome == 'timeout')
+    return {
+        'offered_rate': rate,
+        # Rate actually sent; Poisson arrivals drift from the offered rate over short steps
+        'arrival_rate': round(requests_sent / duration, 2),
+        'requests': requests_sent,
+        'ok': len(latencies),
+        'throughput_per_s': round(len(latencies) / elapsed, 2),
+        'error_rate': round(errors / requests_sent, 4) if requests_sent else 0.0,
+        'timeout_rate': round(timeouts / requests_sent, 4) if requests_sent else 0.0,
+        'p50_ms': round(1000 * percentile(latencies, 0.50), 2),
+        'p95_ms': round(1000 * percentile(latencies, 0.95), 2),
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 2),
+        'max_ms': round(1000 * latencies[-1], 2) if latencies else 0.0,
+        'statuses': statuses,
+    }
+
+def step_problems(step, slo_ms, max_error_rate):
+    """Why a step's rate isn't sustainable; empty when it is"""
+    problems = []
+    if step['throughput_per_s'] < MIN_THROUGHPUT_RATIO * step['arrival_rate']:
+        problems.append(f"throughput {step['throughput_per_s']}/s behind arrivals {step['arrival_rate']}/s")
+    if step['p99_ms'] > slo_ms:
+        problems.append(f"p99 {step['p99_ms']}ms over {slo_ms}ms")
+    if step['error_rate'] + step['timeout_rate'] > max_error_rate:
+        problems.append(f"errors {step['error_rate']:.2%}, timeouts {step['timeout_rate']:.2%}")
+    return problems
+
+def find_saturation(steps, slo_ms, max_error_rate):
+    """The highest sustained rate below the first unsustainable one, and why that one failed"""
+    sustained = None
+    for step in sorted(steps, key=lambda step: step['offered_rate']):
+        problems = step_problems(step, slo_ms, max_error_rate)
+        if problems:
+            return {'max_sustained_rate': sustained, 'saturation_rate': step['offered_rate'], 'reasons': problems}
+        sustained = step['offered_rate']
+    return {'max_sustained_rate': sustained, 'saturation_rate': None, 'reasons': []}
+
+def run_load(url, transcripts, rates, duration, concurrency=64, timeout=30.0, arrival='poisson', seed=0,
+             slo_ms=2000.0, max_error_rate=0.01, stop_at_saturation=True, unique=True):
+    """run_step at each rate in increasing order; returns the report with the saturation point"""
+    steps = []
+    for rate in sorted(rates):
+        steps.append(run_step(url, transcripts, rate, duration, concurrency, timeout, arrival, seed, unique))
+        if stop_at_saturation and step_problems(steps[-1], slo_ms, max_error_rate):
+            break
+    return {
+        'config': {'url': url, 'rates': sorted(rates), 'duration_s': duration, 'concurrency': concurrency,
+                   'timeout_s': timeout, 'arrival': arrival, 'seed': seed, 'slo_ms': slo_ms,
+                   'max_error_rate': max_error_rate, 'transcripts': len(transcripts), 'unique': unique},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'steps': steps,
+        'saturation': find_saturation(steps, slo_ms, max_error_rate),
+    }
+
+def serve(latency=0.0):
+    """Serve the Flask app with the fake model on a local port; returns (base URL, stop function)"""
+    from werkzeug.serving import make_server
+    import api.app
+    os.environ['FAKE_MODEL_LATENCY'] = str(latency)
+    # Rebuild the per-process model client and stores with the requested fake latency
+    api.app.shutdown_worker()
+    api.app.init_worker()
+    server = make_server('127.0.0.1', 0, api.app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+def load_transcripts(path):
+    """Transcripts of a JSONL or CSV file in the api.bulk input format; unreadable records are skipped"""
+    return [transcript for _, transcript, _, error in read_records(path) if error is None]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of a running API server')
+    target.add_argument('--serve', action='store_true', help='serve the app in-process with the fake model')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake model latency in seconds (--serve)')
+    parser.add_argument('--endpoint', default='/extract-fields')
+    parser.add_argument('--rates', default='1,2,4,8,16', help='offered request rates per second, comma separated')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds per rate')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent clients')
+    parser.add_argument('--timeout', type=float, default=30.0, help='per-request timeout in seconds')
+    parser.add_argument('--arrival', choices=['poisson', 'uniform'], default='poisson')
+    parser.add_argument('--input', help='JSONL or CSV of transcripts (api.bulk format) instead of the scenarios')
+    parser.add_argument('--transcripts', type=int, default=200, help='scenario corpus size')
+    parser.add_argument('--length', type=int, default=2000, help='minimum scenario transcript length in characters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help='p99 latency a sustained rate must meet')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='errors plus timeouts a sustained rate may have, as a fraction')
+    parser.add_argument('--all-rates', action='store_true', help='keep going past the saturation point')
+    parser.add_argument('--allow-cache-hits', action='store_true',
+                        help='send corpus transcripts verbatim, so repeats can be answered from the cache')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    transcripts = load_transcripts(args.input) if args.input else build_corpus(args.transcripts, args.length, args.seed)
+    if not transcripts:
+        parser.error("no transcripts to send")
+    rates = [float(rate) for rate in args.rates.split(',') if rate.strip()]
+
+    stop = None
+    base_url = args.url
+    if args.serve:
+        base_url, stop = serve(args.latency)
+    try:
+        report = run_load(base_url.rstrip('/') + args.endpoint, transcripts, rates, args.duration,
+                          args.concurrency, args.timeout, args.arrival, args.seed, args.slo_ms,
+                          args.max_error_rate, stop_at_saturation=not args.all_rates,
+                          unique=not args.allow_cache_hits)
+    finally:
+        if stop:
+            stop()
+    if args.serve:
+        report['config']['model_latency_s'] = args.latency
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
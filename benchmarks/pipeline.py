@@ -0,0 +1,106 @@
+"""Benchmark the extraction pipeline stage by stage against the fake model backend.
+
+Synthesizes a reproducible corpus from the scenario generators in tests/test_scenarios.py
+and reports throughput plus p50/p95/p99 latency for each stage as JSON.
+
+Usage:
+    python -m benchmarks.pipeline --transcripts 500 --length 4000 --output bench.json
+    python -m benchmarks.pipeline --baseline bench.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# The benchmark never talks to a real model
+os.environ.setdefault('MODEL_BACKEND', 'fake')
+
+from api import app as pipeline
+from api.backends import FakeBackend
+from api.rules import extract_fields_locally
+from benchmarks.common import build_corpus, summarize
+
+STAGES = ['prompt_build', 'model_call', 'response_parse', 'confidence_scoring', 'rule_fast_path', 'total']
+
+def run_benchmark(count=200, length=2000, seed=0, latency=0.0, warmup=10):
+    """Drive every pipeline stage over a synthetic corpus and return the timing report"""
+    backend = FakeBackend(latency=latency, seed=seed)
+    corpus = build_corpus(count + warmup, length, seed)
+    timings = {stage: [] for stage in STAGES}
+    clock = time.perf_counter
+
+    for i, transcript in enumerate(corpus):
+        started = clock()
+        # The builder the API serves with, under its PROMPT_TOKEN_BUDGET and MODEL_OUTPUT_FORMAT
+        prompt = pipeline.prompt_builder.extraction_prompt(transcript)
+        prompt_built = clock()
+        text = backend.generate_content(prompt).text
+        model_done = clock()
+        parsed = pipeline.parse_answer_pairs(text)
+        parse_done = clock()
+        match_index = pipeline.build_match_index(transcript)
+        for field_name, value in parsed:
+            pipeline.calculate_confidence(field_name, value, transcript, match_index)
+        scoring_done = clock()
+        extract_fields_locally(transcript, match_index=match_index)
+        rules_done = clock()
+
+        if i < warmup:
+            continue
+        timings['prompt_build'].append(prompt_built - started)
+        timings['model_call'].append(model_done - prompt_built)
+        timings['response_parse'].append(parse_done - model_done)
+        timings['confidence_scoring'].append(scoring_done - parse_done)
+        timings['rule_fast_path'].append(rules_done - scoring_done)
+        timings['total'].append(rules_done - started)
+
+    return {
+        'config': {'transcripts': count, 'length': length, 'seed': seed,
+                   'model_latency_s': latency, 'warmup': warmup},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'mean_transcript_chars': round(sum(map(len, corpus[warmup:])) / max(1, count), 1),
+        'stages': {stage: summarize(samples) for stage, samples in timings.items()},
+    }
+
+def find_regressions(report, baseline, max_regression):
+    """List stages whose p95 grew by more than ``max_regression`` (a fraction) over the baseline"""
+    regressions = []
+    for stage, stats in report['stages'].items():
+        before = baseline.get('stages', {}).get(stage, {}).get('p95_ms')
+        if before and stats['p95_ms'] > before * (1 + max_regression):
+            regressions.append(f"{stage}: p95 {before}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--transcripts', type=int, default=200, help='corpus size')
+    parser.add_argument('--length', type=int, default=2000, help='minimum transcript length in characters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='fake model latency in seconds')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed iterations before measuring')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare p95 latencies against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed p95 growth over the baseline, as a fraction')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.transcripts, args.length, args.seed, args.latency, args.warmup)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Production server settings for the API.
+
+    gunicorn -c gunicorn.conf.py api.app:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker api.asgi:app
+
+Every setting can be overridden from the environment. The app is preloaded in the master
+so the prompt text and compiled field patterns are built once and shared with the
+workers; each worker then creates its own model client and cache connection in post_fork.
+Model calls are I/O bound, so the default is a few processes with several threads each:
+a slow model call holds one thread, not the whole server.
+
+Every worker serves /metrics on the same port, so with METRICS_DIR set the workers share
+their metrics through files there and any of them reports the whole server's (see
+api/metrics.py).
+"""
+import logging
+import os
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# Workers silent for longer than this are killed and replaced. With gthread workers the
+# heartbeat comes from the worker's main thread, so a hung request thread doesn't trip it:
+# requests are bounded by REQUEST_TIMEOUT, the deadline every model call and retry of a
+# request checks (MODEL_TIMEOUT only bounds one call). Keep this above REQUEST_TIMEOUT.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# On SIGTERM, workers stop accepting connections and get this long to finish in-flight requests
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers now and then so slow leaks can't build up; jitter avoids restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+def on_starting(server):
+    # Snapshots left by an earlier run would be counted as this one's
+    from api.metrics import METRICS_DIR, clear_shared_metrics
+    if METRICS_DIR:
+        clear_shared_metrics(METRICS_DIR)
+
+def when_ready(server):
+    # The preloaded master never serves requests; drop its cache handle before forking
+    if preload_app:
+        import api.app
+        api.app.shutdown_worker()
+
+def post_fork(server, worker):
+    import api.app
+    from api.metrics import METRICS_DIR, REGISTRY
+    if preload_app:
+        api.app.init_worker()
+    if METRICS_DIR:
+        REGISTRY.share(METRICS_DIR)
+    # Resume queued bulk jobs without waiting for the first /jobs request
+    api.app.start_job_workers()
+    # Load the model client in the background; /readyz answers 200 once it's done
+    api.app.start_warm_up()
+    logging.getLogger('gunicorn.conf').info("Worker ready", extra={"pid": worker.pid})
+
+def worker_exit(server, worker):
+    import api.app
+    from api.metrics import REGISTRY
+    api.app.shutdown_worker()
+    # Keep this worker's counters in the server's totals after it's gone
+    REGISTRY.retire()
@@ -1,7 +1,29 @@
 #!/bin/bash
 
-# Start Flask API in background
-python -m flask run --host=0.0.0.0 --port=8000 &
+# Start the API in background
+# API_SERVER picks how it is served:
+#   gunicorn (default): production server, threaded workers (see gunicorn.conf.py)
+#   asgi: gunicorn with uvicorn workers, /extract-fields on asyncio with bounded model concurrency
+#   flask: single-process development server
+case "${API_SERVER:-gunicorn}" in
+    asgi)
+        gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker api.asgi:app &
+        ;;
+    flask)
+        python -m flask run --host=0.0.0.0 --port=8000 &
+        ;;
+    *)
+        gunicorn -c gunicorn.conf.py api.app:app &
+        ;;
+esac
+API_PID=$!
 
 # Start Streamlit
-streamlit run ui/streamlit_app.py --server.port=8501 --server.address=0.0.0.0 
\ No newline at end of file
+python -m streamlit run ui/streamlit_app.py --server.port=8501 --server.address=0.0.0.0 &
+UI_PID=$!
+
+# Forward stop signals so gunicorn can drain in-flight requests before the container exits
+trap 'kill -TERM $API_PID $UI_PID 2>/dev/null' TERM INT
+wait -n $API_PID $UI_PID
+kill -TERM $API_PID $UI_PID 2>/dev/null
+wait
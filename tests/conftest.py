@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Run the suite offline against the deterministic fake model backend
+os.environ.setdefault('MODEL_BACKEND', 'fake')
+# Keep job and session state out of the working tree
+_state_dir = tempfile.mkdtemp(prefix='formsiq-tests-')
+os.environ.setdefault('JOB_DB', os.path.join(_state_dir, 'jobs.db'))
+os.environ.setdefault('SESSION_DB', os.path.join(_state_dir, 'sessions.db'))
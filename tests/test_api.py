@@ -36,3 +36,199 @@ def test_extract_fields_empty_transcript(client):
                           content_type='application/json')
     assert response.status_code == 200
     assert 'fields' in response.json
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeBatchModel:
+    """Answers only the first transcript of each packed prompt"""
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse("### RESULT 1\nBorrower Name: John Doe\nLoan Amount: $250,000\n")
+
+def test_extract_fields_batch(client, monkeypatch):
+    """Test batch extraction packs transcripts and reports per-item results"""
+    import api.app
+    fake_model = FakeBatchModel()
+    monkeypatch.setattr(api.app, 'model', fake_model)
+    monkeypatch.setattr(api.app, 'BATCH_PACK_SIZE', 2)
+    api.app.extraction_cache.clear()
+    data = {"transcripts": ["The borrower's name is John Doe", "Second call", 42]}
+    response = client.post('/extract-fields/batch', json=data)
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['index'] for r in results] == [0, 1, 2]
+    assert results[0]['fields'][0]['field_name'] == 'Borrower Name'
+    assert 'error' in results[1]
+    assert 'error' in results[2]
+    assert len(fake_model.prompts) == 1
+    assert "### TRANSCRIPT 2\nSecond call" in fake_model.prompts[0]
+
+def test_extract_fields_batch_invalid_input(client):
+    """Test batch extraction without a transcripts list"""
+    response = client.post('/extract-fields/batch', json={"transcript": "x"})
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+def test_extract_fields_cached(client, monkeypatch):
+    """Test repeated transcripts are served from the cache"""
+    import api.app
+    fake_model = FakeBatchModel()
+    monkeypatch.setattr(api.app, 'model', fake_model)
+    api.app.extraction_cache.clear()
+    data = {"transcript": "The borrower's name is John Doe, requesting a loan of $250,000"}
+    first = client.post('/extract-fields', json=data)
+    second = client.post('/extract-fields', json=data)
+    assert first.json['cached'] is False
+    assert second.json['cached'] is True
+    assert second.json['fields'] == first.json['fields']
+    assert len(fake_model.prompts) == 1
+    assert client.get('/cache/stats').json['hits'] >= 1
+
+class RecordingModel:
+    """Records prompts and answers every field as not specified"""
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse("Loan Purpose: Not specified\nEmployment Info: Not specified\n")
+
+def test_fast_path_skips_model(client, monkeypatch):
+    """Test transcripts the rules fully cover never reach the model"""
+    import api.app
+    fake_model = RecordingModel()
+    monkeypatch.setattr(api.app, 'model', fake_model)
+    api.app.extraction_cache.clear()
+    data = {"transcript": "Hi, I'm John Smith. I'm requesting a loan of $300,000 for the property located at "
+                          "123 Main St, Boston. My annual income is $85,000 and I work at Tech Corp. "
+                          "Property type: condo. Loan purpose: purchase."}
+    response = client.post('/extract-fields', json=data)
+    assert len(response.json['fields']) == 7
+    assert {field['source'] for field in response.json['fields']} == {'rules'}
+    assert fake_model.prompts == []
+
+def test_fast_path_asks_model_for_missing_fields(client, monkeypatch):
+    """Test partially covered transcripts only ask the model for the missing fields"""
+    import api.app
+    fake_model = RecordingModel()
+    monkeypatch.setattr(api.app, 'model', fake_model)
+    api.app.extraction_cache.clear()
+    data = {"transcript": "Name: Michael Garcia\nAmount: $661,000\nAddress: 650 Maple Circle, Denver, CO"}
+    response = client.post('/extract-fields', json=data)
+    assert len(response.json['fields']) == 3
+    assert len(fake_model.prompts) == 1
+    assert ("Only extract these fields: Annual Income, Employment Info, Property Type, Loan Purpose."
+            in fake_model.prompts[0])
+
+def test_extract_fields_stream(client, monkeypatch):
+    """Test streamed extraction emits rule fields first, then model fields, then done"""
+    import api.app
+    from api.backends import FakeBackend
+    monkeypatch.setattr(api.app, 'model', FakeBackend())
+    api.app.extraction_cache.clear()
+    data = {"transcript": "Name: Michael Garcia\nAmount: $661,000\nI work at Tech Corp. It's a condo."}
+    response = client.post('/extract-fields/stream', json=data)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [e['source'] for e in events[:2]] == ['rules', 'rules']
+    assert {e['field_name'] for e in events[2:-1]} == {'Employment Info', 'Property Type'}
+    assert events[-1] == {'type': 'done', 'cached': False}
+
+    replay = client.post('/extract-fields/stream', json=data)
+    assert replay.data.decode().splitlines()[-1] == json.dumps({'type': 'done', 'cached': True})
+
+def test_extract_fields_stream_error(client, monkeypatch):
+    """Test a failing model call ends the stream with an error event"""
+    import api.app
+    from api.backends import FakeBackend
+    monkeypatch.setattr(api.app, 'model', FakeBackend(error_rate=1.0))
+    api.app.extraction_cache.clear()
+    response = client.post('/extract-fields/stream', json={"transcript": "Just a call"})
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert events[-1]['type'] == 'error'
+
+def test_extract_fields_model_error_is_not_an_empty_result(client, monkeypatch):
+    """Test a failing model call answers 503 rather than 200 with no fields"""
+    import api.app
+    from api.backends import FakeBackend
+    from api.scheduler import ModelScheduler
+    monkeypatch.setattr(api.app, 'model', ModelScheduler(FakeBackend(error_rate=1.0), base_delay=0.001))
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    api.app.extraction_cache.clear()
+    response = client.post('/extract-fields', json={"transcript": "Just a call"})
+    assert response.status_code == 503
+    assert 'fields' not in response.json
+    assert 'Extraction failed' in response.json['error']
+
+def test_extract_fields_deadline_answers_504(client, monkeypatch):
+    """Test a request whose deadline passes before its model call can be retried answers 504"""
+    import api.app
+    from api.backends import FakeBackend
+    from api.scheduler import ModelScheduler
+    monkeypatch.setattr(api.app, 'model', ModelScheduler(FakeBackend(latency=0.05, error_rate=1.0)))
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    monkeypatch.setattr(api.app, 'REQUEST_TIMEOUT', 0.01)
+    api.app.extraction_cache.clear()
+    response = client.post('/extract-fields', json={"transcript": "Just a call"})
+    assert response.status_code == 504
+
+def test_extract_fields_long_transcript(client, monkeypatch):
+    """Test long transcripts are extracted chunk by chunk and merged"""
+    import api.app
+    from api.backends import FakeBackend
+    monkeypatch.setattr(api.app, 'model', FakeBackend())
+    monkeypatch.setattr(api.app, 'LONG_TRANSCRIPT_CHARS', 500)
+    monkeypatch.setattr(api.app, 'LONG_TRANSCRIPT_CHUNK_TOKENS', 100)
+    monkeypatch.setattr(api.app, 'LONG_TRANSCRIPT_OVERLAP_TOKENS', 0)
+    api.app.extraction_cache.clear()
+    filler = "\n".join("Agent: we discussed rates and closing costs at length." for _ in range(20))
+    transcript = (f"Caller: I'm John Smith and I need a $300,000 mortgage.\n{filler}\n"
+                  f"Caller: Sorry, correction, I need a $350,000 mortgage for the condo.")
+    response = client.post('/extract-fields', json={"transcript": transcript})
+    assert response.json['chunks'] > 1
+    fields = {f['field_name']: f for f in response.json['fields']}
+    assert fields['Loan Amount']['field_value'] == '$350,000'
+    assert fields['Loan Amount']['conflict'] is True
+    assert fields['Borrower Name']['field_value'] == 'John Smith'
+
+def test_extract_selected_fields(client, monkeypatch):
+    """Test a fields list trims the prompt and limits the answer to those fields"""
+    import api.app
+    fake_model = RecordingModel()
+    monkeypatch.setattr(api.app, 'model', fake_model)
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    api.app.extraction_cache.clear()
+    data = {"transcript": "We'd like to refinance. I work at Acme Corp.", "fields": ["Loan Purpose"]}
+    response = client.post('/extract-fields', json=data)
+    assert response.status_code == 200
+    prompt = fake_model.prompts[0]
+    assert "Only extract these fields: Loan Purpose." in prompt
+    assert "Borrower Name:" not in prompt
+    assert len(prompt) < len(api.app.prompt_builder.extraction_prompt(data["transcript"])) * 0.6
+
+    # A different field subset of the same transcript is a separate cache entry
+    client.post('/extract-fields', json={**data, "fields": ["Employment Info"]})
+    assert len(fake_model.prompts) == 2
+
+def test_extract_selected_fields_invalid(client):
+    """Test unknown or malformed field lists are rejected"""
+    response = client.post('/extract-fields', json={"transcript": "x", "fields": ["Favorite Color"]})
+    assert response.status_code == 400
+    assert "Favorite Color" in response.json["error"]
+    assert client.post('/extract-fields', json={"transcript": "x", "fields": "Loan Amount"}).status_code == 400
+
+def test_selected_field_prompt_keeps_relevant_examples():
+    """Test subset prompts keep examples that show the field plus the negative examples"""
+    from api.prompts import MAX_SUBSET_EXAMPLES, build_extraction_prompt
+    prompt = build_extraction_prompt("transcript", ["Property Type"])
+    outputs = prompt.count("Output:\n")
+    assert outputs == MAX_SUBSET_EXAMPLES + 2
+    assert prompt.count("Property Type: Not specified") == 2  # only the negative examples
+    assert "Format your answer as exactly these lines, in this order:\nProperty Type: Value\n" in prompt
+    assert "Annual Income:" not in prompt
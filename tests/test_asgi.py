@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+import pytest
+import api.app
+from api.asgi import app as asgi_app
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeAsyncModel:
+    """Stands in for the Gemini model on the async path"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return FakeResponse("Borrower Name: John Doe\nLoan Amount: $250,000\n")
+
+async def call(method, path, payload=None):
+    """Drive the ASGI app with one request and collect status, headers and JSON body"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(),
+             'query_string': b'', 'headers': [(b'content-type', b'application/json')],
+             'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+             'client': ('127.0.0.1', 1234), 'root_path': ''}
+    await asgi_app(scope, receive, send)
+    start = next(m for m in sent if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return start['status'], dict(start['headers']), json.loads(body)
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeAsyncModel(delay=0.05)
+    monkeypatch.setattr(api.app.async_model_client, 'model', model)
+    api.app.extraction_cache.clear()
+    return model
+
+def test_async_extract_fields(fake_model):
+    status, _, data = asyncio.run(call('POST', '/extract-fields', {"transcript": "I'm John Doe"}))
+    assert status == 200
+    assert data['fields'][0]['field_value'] == 'John Doe'
+    assert fake_model.calls == 1
+
+def test_async_extract_fields_invalid_input(fake_model):
+    status, _, data = asyncio.run(call('POST', '/extract-fields', {}))
+    assert status == 400
+    assert 'error' in data
+
+def test_async_extract_fields_overloaded(fake_model, monkeypatch):
+    """Requests beyond the concurrency and queue bounds get 429 with Retry-After"""
+    monkeypatch.setattr(api.app.async_model_client, 'max_concurrency', 1)
+    monkeypatch.setattr(api.app.async_model_client, 'max_queue', 1)
+    monkeypatch.setattr(api.app.async_model_client, '_semaphore', None)
+
+    async def burst():
+        return await asyncio.gather(*[
+            call('POST', '/extract-fields', {"transcript": f"Transcript {i}"}) for i in range(3)
+        ])
+
+    responses = asyncio.run(burst())
+    assert sorted(status for status, _, _ in responses) == [200, 200, 429]
+    rejected = next(headers for status, headers, _ in responses if status == 429)
+    assert rejected[b'retry-after'] == b'1'
+    assert fake_model.calls == 2
+
+def test_async_extract_fields_model_error(fake_model, monkeypatch):
+    async def broken(prompt):
+        raise ValueError("400 bad request")
+
+    monkeypatch.setattr(fake_model, 'generate_content_async', broken)
+    status, _, data = asyncio.run(call('POST', '/extract-fields', {"transcript": "I'm John Doe"}))
+    assert status == 502
+    assert 'fields' not in data and 'Extraction failed' in data['error']
+
+def test_blocking_work_runs_off_the_event_loop(fake_model, monkeypatch):
+    threads = {}
+
+    def recorded(name, function):
+        def wrapper(*args, **kwargs):
+            threads[name] = threading.current_thread()
+            return function(*args, **kwargs)
+        return wrapper
+
+    for name in ('run_fast_path', 'index_transcript', 'parse_extraction_response'):
+        monkeypatch.setattr(api.app, name, recorded(name, getattr(api.app, name)))
+    monkeypatch.setattr(api.app.extraction_cache, 'set', recorded('cache_set', api.app.extraction_cache.set))
+    monkeypatch.setattr('api.asgi.store_result', recorded('store_result', api.app.store_result))
+
+    status, _, _ = asyncio.run(call('POST', '/extract-fields', {"transcript": "I'm John Doe"}))
+    assert status == 200
+    assert set(threads) == {'run_fast_path', 'index_transcript', 'parse_extraction_response',
+                            'cache_set', 'store_result'}
+    assert threading.main_thread() not in threads.values()
+
+def test_other_routes_fall_through_to_flask(fake_model):
+    status, _, data = asyncio.run(call('GET', '/cache/stats'))
+    assert status == 200
+    assert 'hits' in data
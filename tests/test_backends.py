@@ -0,0 +1,68 @@
+import asyncio
+import time
+import pytest
+from api.backends import FakeBackend, FakeBackendError, GeminiBackend, create_backend
+from api.prompts import build_batch_prompt, build_extraction_prompt, split_batch_response
+
+TRANSCRIPT = ("Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston. "
+              "I make $85,000 a year working at Tech Corp. It's a condo.")
+
+def test_fake_backend_derives_fields_from_transcript():
+    text = FakeBackend().generate_content(build_extraction_prompt(TRANSCRIPT)).text
+    assert "Borrower Name: John Smith" in text
+    assert "Loan Amount: $300,000" in text
+    assert "Property Address: 123 Main St, Boston" in text
+    assert "Annual Income: $85,000" in text
+    assert "Employment Info: Tech Corp" in text
+    assert "Property Type: Condo" in text
+    assert "Loan Purpose: Not specified" in text
+
+def test_fake_backend_answers_batch_prompts():
+    prompt = build_batch_prompt([TRANSCRIPT, "Just Jane Doe calling."])
+    sections = split_batch_response(FakeBackend().generate_content(prompt).text, 2)
+    assert "Borrower Name: John Smith" in sections[0]
+    assert "Borrower Name: Not specified" in sections[1]
+
+def test_fake_backend_is_deterministic():
+    first = FakeBackend(error_rate=0.5, seed=7)
+    second = FakeBackend(error_rate=0.5, seed=7)
+    outcomes = []
+    for backend in (first, second):
+        runs = []
+        for _ in range(20):
+            try:
+                backend.generate_content("prompt")
+                runs.append(True)
+            except FakeBackendError:
+                runs.append(False)
+        outcomes.append(runs)
+    assert outcomes[0] == outcomes[1]
+    assert True in outcomes[0] and False in outcomes[0]
+
+def test_fake_backend_latency_and_canned_response():
+    backend = FakeBackend(latency=0.05, canned_response="Loan Amount: $1,000")
+    start = time.perf_counter()
+    assert asyncio.run(backend.generate_content_async("prompt")).text == "Loan Amount: $1,000"
+    assert time.perf_counter() - start >= 0.05
+
+def test_create_backend_from_environment(monkeypatch):
+    monkeypatch.setenv('MODEL_BACKEND', 'fake')
+    monkeypatch.setenv('FAKE_MODEL_LATENCY', '0.25')
+    backend = create_backend()
+    assert isinstance(backend, FakeBackend)
+    assert backend.latency == 0.25
+    with pytest.raises(ValueError):
+        create_backend('unknown')
+
+def test_gemini_backend_requires_api_key(monkeypatch):
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    backend = GeminiBackend()  # nothing is loaded or checked until first use
+    with pytest.raises(ValueError):
+        backend.warm_up()
+
+def test_fake_backend_streams_chunks():
+    backend = FakeBackend()
+    prompt = build_extraction_prompt(TRANSCRIPT)
+    chunks = [chunk.text for chunk in backend.generate_content(prompt, stream=True)]
+    assert len(chunks) > 1
+    assert "".join(chunks) == backend.generate_content(prompt).text
@@ -0,0 +1,31 @@
+import random
+from benchmarks.common import build_corpus, percentile
+from benchmarks.pipeline import STAGES, find_regressions, run_benchmark
+
+def test_corpus_is_reproducible_and_padded():
+    corpus = build_corpus(4, 1500, seed=3)
+    assert corpus == build_corpus(4, 1500, seed=3)
+    assert all(len(transcript) >= 1500 for transcript in corpus)
+
+def test_corpus_leaves_global_random_state_alone():
+    random.seed(11)
+    expected = random.random()
+    random.seed(11)
+    build_corpus(4, 1500, seed=3)
+    assert random.random() == expected
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile([], 0.5) == 0.0
+
+def test_report_covers_every_stage():
+    report = run_benchmark(count=5, length=500, warmup=1)
+    assert list(report["stages"]) == STAGES
+    assert all(stats["count"] == 5 for stats in report["stages"].values())
+
+def test_find_regressions_compares_p95():
+    baseline = {"stages": {"total": {"p95_ms": 10.0}, "model_call": {"p95_ms": 5.0}}}
+    report = {"stages": {"total": {"p95_ms": 13.0}, "model_call": {"p95_ms": 5.5}}}
+    assert find_regressions(report, baseline, 0.2) == ["total: p95 10.0ms -> 13.0ms"]
@@ -0,0 +1,68 @@
+import json
+import logging
+import pytest
+from api import bulk
+
+def write_jsonl(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({"transcript": f"Call {i}: we want to refinance", "id": f"c{i}"}) + "\n")
+        f.write("not json\n")
+
+def read_output(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_run_extracts_every_record_and_reports_bad_lines(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(source, 20)
+    assert bulk.run(str(source), str(output), workers=4, checkpoint_every=5) == 21
+    results = {r["index"]: r for r in read_output(output)}
+    assert sorted(results) == list(range(21))
+    assert results[3]["id"] == "c3" and "fields" in results[3]
+    assert results[20]["error"] == "Record is not valid JSON"
+    # A second run finds everything in the checkpoint
+    assert bulk.run(str(source), str(output)) == 0
+
+def test_resume_drops_output_written_after_the_checkpoint(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(source, 10)
+    checkpoint = bulk.Checkpoint(str(output) + ".checkpoint")
+    with open(output, 'w') as f:
+        for index in (0, 1, 3):
+            f.write(json.dumps({"index": index, "fields": []}) + "\n")
+            checkpoint.mark(index)
+        offset = f.tell()
+        f.write('{"index": 4, "fie')  # interrupted mid-write
+    checkpoint.save(offset)
+    assert bulk.run(str(source), str(output), workers=2) == 8
+    assert sorted(r["index"] for r in read_output(output)) == list(range(11))
+
+def test_csv_input_and_existing_output_guard(tmp_path):
+    source, output = tmp_path / "in.csv", tmp_path / "out.jsonl"
+    source.write_text('id,transcript\na1,"My name is John Smith"\na2,"We want to refinance"\n')
+    assert bulk.run(str(source), str(output)) == 2
+    assert [r["id"] for r in sorted(read_output(output), key=lambda r: r["index"])] == ["a1", "a2"]
+    (tmp_path / "out.jsonl.checkpoint").unlink()
+    with pytest.raises(FileExistsError):
+        bulk.run(str(source), str(output))
+
+def test_extract_record_retries_then_reports_error(monkeypatch):
+    import api.app
+    calls = []
+
+    def failing(transcript):
+        calls.append(transcript)
+        raise RuntimeError("429 quota")
+
+    monkeypatch.setattr(api.app, 'extract_fields_bulk', failing)
+    result = bulk.extract_record("transcript", max_attempts=3, base_delay=0.001)
+    assert len(calls) == 3
+    assert result == {"error": "RuntimeError: 429 quota", "attempts": 3}
+
+def test_main_configures_logging(tmp_path, monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'handlers', [])
+    monkeypatch.setattr(bulk, 'run', lambda *args: 0)
+    assert bulk.main([str(tmp_path / "in.jsonl"), "--output", str(tmp_path / "out.jsonl"), "--processes", "2"]) == 0
+    assert any(getattr(handler, '_formsiq', False) for handler in root.handlers)
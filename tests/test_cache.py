@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import api.cache
+from api.cache import ExtractionCache, cache_key
+
+def test_cache_key_normalizes_whitespace():
+    """Formatting-only differences share a key; model and prompt version do not"""
+    key = cache_key("Hi, I'm  John\nSmith ", "gemini-1.5-pro", "1")
+    assert key == cache_key("Hi, I'm John Smith", "gemini-1.5-pro", "1")
+    assert key != cache_key("Hi, I'm John Smith", "gemini-1.5-flash", "1")
+    assert key != cache_key("Hi, I'm John Smith", "gemini-1.5-pro", "2")
+
+def test_lru_eviction_and_counters():
+    cache = ExtractionCache(max_entries=2)
+    cache.set("a", {"fields": []})
+    cache.set("b", {"fields": []})
+    assert cache.get("a") is not None
+    cache.set("c", {"fields": []})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+def test_ttl_expiry():
+    cache = ExtractionCache(ttl_seconds=-1)
+    cache.set("a", {"fields": []})
+    assert cache.get("a") is None
+
+def test_disabled_cache():
+    cache = ExtractionCache(max_entries=0)
+    cache.set("a", {"fields": []})
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 0
+
+def test_disk_tier_survives_restart_and_prompt_version_invalidates(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    value = {"fields": [{"field_name": "Loan Amount", "field_value": "$250,000", "confidence_score": 0.9}]}
+    ExtractionCache(db_path=db_path, prompt_version="1").set("a", value)
+
+    assert ExtractionCache(db_path=db_path, prompt_version="1").get("a") == value
+    assert ExtractionCache(db_path=db_path, prompt_version="2").get("a") is None
+    assert ExtractionCache(db_path=db_path, prompt_version="1").get("a") is None
+
+def test_disk_tier_size_bound(tmp_path):
+    cache = ExtractionCache(db_path=str(tmp_path / "cache.db"), max_db_entries=2)
+    for key in "abc":
+        cache.set(key, {"fields": []})
+    assert cache.stats()["disk_entries"] == 2
+
+def test_disk_tier_trims_in_batches(tmp_path):
+    cache = ExtractionCache(db_path=str(tmp_path / "cache.db"), max_db_entries=200)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    for key in range(200):
+        cache.set(str(key), {"fields": []})
+    # Under the bound: no trimming, and the table is only counted every trim_batch writes
+    assert not [statement for statement in statements if statement.startswith("DELETE")]
+    assert sum("COUNT(*)" in statement for statement in statements) == 200 // cache.trim_batch
+    cache.set("200", {"fields": []})
+    # Over it: trimmed by a batch, least recently used first
+    assert cache.stats()["disk_entries"] == 200 - cache.trim_batch + 1
+    assert cache._db.execute("SELECT key FROM extraction_cache WHERE key = '0'").fetchone() is None
+
+def test_disk_hits_refresh_access_time_at_most_once_a_minute(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "cache.db")
+    ExtractionCache(db_path=db_path).set("a", {"fields": []})
+    cache = ExtractionCache(db_path=db_path)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    assert cache.get("a") == {"fields": []}
+    assert not [statement for statement in statements if statement.startswith("UPDATE")]
+    monkeypatch.setattr(api.cache, 'ACCESS_REFRESH_SECONDS', -1)
+    cache._memory.clear()
+    assert cache.get("a") == {"fields": []}
+    assert [statement for statement in statements if statement.startswith("UPDATE")]
+
+def test_output_format_and_prompt_budget_change_the_key(tmp_path):
+    """Settings that change the prompt or the answer format never serve each other's results"""
+    script = (
+        "import api.app\n"
+        "response = api.app.app.test_client().post('/extract-fields', json={'transcript': 'Hi, I am John Smith.'})\n"
+        "print(response.json['cached'])\n"
+    )
+    base = {**os.environ, 'MODEL_BACKEND': 'fake', 'GOOGLE_API_KEY': '', 'WARM_UP_ON_START': 'false',
+            'FAST_PATH_ENABLED': 'false', 'EXTRACTION_CACHE_DB': str(tmp_path / 'cache.db'),
+            'DATA_DIR': str(tmp_path)}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def cached(**settings):
+        result = subprocess.run([sys.executable, '-c', script], env={**base, **settings}, cwd=root,
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        return result.stdout.split()[-1]
+
+    assert cached(MODEL_OUTPUT_FORMAT='text') == 'False'
+    assert cached(MODEL_OUTPUT_FORMAT='text') == 'True'
+    assert cached(MODEL_OUTPUT_FORMAT='json') == 'False'
+    assert cached(MODEL_OUTPUT_FORMAT='json', PROMPT_TOKEN_BUDGET='3000') == 'False'
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import pytest
+import api.app
+from api.app import app
+from api.async_client import AsyncModelClient
+from api.backends import FakeBackend
+from api.cascade import ModelTier, parse_thresholds
+from api.metrics import CASCADE_ESCALATIONS
+from api.scheduler import ModelScheduler
+
+TRANSCRIPT = "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston."
+FIELDS = ["Borrower Name", "Loan Amount"]
+
+class RecordingBackend(FakeBackend):
+    """Fake backend recording the prompts it is sent, optionally failing every call"""
+
+    def __init__(self, failing=False, **kwargs):
+        super().__init__(**kwargs)
+        self.failing = failing
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.failing:
+            raise RuntimeError("tier down")
+        return super().generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.failing:
+            raise RuntimeError("tier down")
+        return await super().generate_content_async(prompt, **kwargs)
+
+def tier(name, backend):
+    scheduled = ModelScheduler(backend, max_retries=0)
+    return ModelTier(name, scheduled, AsyncModelClient(scheduled))
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """A fast tier that gets the loan amount wrong, and a slower pro tier"""
+    fast = RecordingBackend(latency=0.001, model_name='fast',
+                            canned_response="Borrower Name: John Smith\nLoan Amount: $30,000\n")
+    pro = RecordingBackend(latency=0.02, model_name='pro')
+    monkeypatch.setattr(api.app, 'model_tiers', [tier('fast', fast), tier('pro', pro)])
+    monkeypatch.setattr(api.app, 'MODEL_NAME', 'fast>pro')
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    monkeypatch.setattr(api.app, 'CASCADE_MIN_CONFIDENCE', 0.8)
+    monkeypatch.setattr(api.app, 'CASCADE_THRESHOLDS', {"Loan Amount": 0.99})
+    api.app.extraction_cache.clear()
+    return fast, pro
+
+def by_name(fields):
+    return {field['field_name']: field for field in fields}
+
+def test_only_low_confidence_fields_are_escalated(tiers):
+    fast, pro = tiers
+    escalations = CASCADE_ESCALATIONS.value(tier='fast')
+    result = api.app.extract_fields(TRANSCRIPT, FIELDS)
+    fields = by_name(result['fields'])
+
+    assert fields["Borrower Name"]["field_value"] == "John Smith"
+    assert fields["Borrower Name"]["tier"] == "fast"
+    assert fields["Loan Amount"]["field_value"] == "$300,000"
+    assert fields["Loan Amount"]["tier"] == "pro"
+    assert len(fast.prompts) == len(pro.prompts) == 1
+    assert "Only extract these fields: Loan Amount." in pro.prompts[0]
+    assert CASCADE_ESCALATIONS.value(tier='fast') == escalations + 1
+
+def test_confident_answers_skip_the_pro_tier(tiers, monkeypatch):
+    fast, pro = tiers
+    monkeypatch.setattr(api.app, 'CASCADE_THRESHOLDS', {})
+    fields = by_name(api.app.extract_fields(TRANSCRIPT, ["Borrower Name"])['fields'])
+    assert fields["Borrower Name"]["tier"] == "fast"
+    assert pro.prompts == []
+
+def test_async_cascade_matches_sync(tiers):
+    sync_fields = api.app.extract_fields(TRANSCRIPT, FIELDS)['fields']
+    api.app.extraction_cache.clear()
+    async_fields = asyncio.run(api.app.extract_fields_async(TRANSCRIPT, FIELDS))['fields']
+    assert async_fields == sync_fields
+
+def test_failed_tiers_fall_through(tiers):
+    fast, pro = tiers
+    fast.failing = True
+    fields = by_name(api.app.cascade_fields(TRANSCRIPT, FIELDS))
+    assert {name: field["tier"] for name, field in fields.items()} == {"Borrower Name": "pro", "Loan Amount": "pro"}
+
+    # The pro tier failing keeps the fast tier's answers, low-confidence ones included
+    fast.failing, pro.failing = False, True
+    fields = by_name(api.app.cascade_fields(TRANSCRIPT, FIELDS))
+    assert fields["Loan Amount"]["field_value"] == "$30,000" and fields["Loan Amount"]["tier"] == "fast"
+    assert fields["Loan Amount"]["degraded"] is True
+    assert "degraded" not in fields["Borrower Name"]
+
+    fast.failing = True
+    with pytest.raises(RuntimeError):
+        api.app.cascade_fields(TRANSCRIPT, FIELDS)
+
+def test_degraded_results_are_not_cached(tiers):
+    fast, pro = tiers
+    pro.failing = True
+    first = api.app.extract_fields(TRANSCRIPT, FIELDS)
+    assert by_name(first['fields'])["Loan Amount"]["degraded"] is True
+
+    # Once the pro tier is back, the same transcript gets its answer rather than the cached one
+    pro.failing = False
+    second = api.app.extract_fields(TRANSCRIPT, FIELDS)
+    assert second['cached'] is False
+    assert by_name(second['fields'])["Loan Amount"]["field_value"] == "$300,000"
+    assert api.app.extract_fields(TRANSCRIPT, FIELDS)['cached'] is True
+
+def test_stream_uses_cascade(tiers):
+    response = app.test_client().post('/extract-fields/stream', json={"transcript": TRANSCRIPT, "fields": FIELDS})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert {e["field_name"]: e["tier"] for e in events if e["type"] == "field"} == {
+        "Borrower Name": "fast", "Loan Amount": "pro"}
+
+def test_parse_thresholds():
+    assert parse_thresholds("Loan Amount=0.95; Property Address=0.6") == {
+        "Loan Amount": 0.95, "Property Address": 0.6}
+    assert parse_thresholds(None) == {}
+    with pytest.raises(ValueError):
+        parse_thresholds("Favorite Color=0.5")
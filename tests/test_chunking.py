@@ -0,0 +1,50 @@
+from api.chunking import CHARS_PER_TOKEN, merge_chunk_fields, split_transcript
+
+def field(name, value, confidence):
+    return {"field_name": name, "field_value": value, "confidence_score": confidence, "source": "model"}
+
+def test_split_respects_budget_and_overlaps_turns():
+    transcript = "\n".join(f"Agent: turn {i} " + "word " * 20 for i in range(30))
+    chunks = split_transcript(transcript, max_tokens=100, overlap_tokens=40)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 * CHARS_PER_TOKEN for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split("\n")[0] == previous.split("\n")[-1]
+    for i in range(30):
+        assert any(f"turn {i} " in chunk for chunk in chunks)
+
+def test_split_breaks_long_turns_at_sentences():
+    transcript = "Caller: " + "This is a sentence. " * 100
+    chunks = split_transcript(transcript, max_tokens=50, overlap_tokens=0)
+    assert all(len(chunk) <= 50 * CHARS_PER_TOKEN for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+
+def test_merge_prefers_latest_mention_and_flags_conflicts():
+    merged = merge_chunk_fields([
+        [field("Loan Amount", "$400,000", 0.9), field("Borrower Name", "John Smith", 0.8)],
+        [field("Loan Amount", "$450,000", 0.85), field("Borrower Name", "john smith", 0.9)],
+    ])
+    by_name = {f["field_name"]: f for f in merged}
+    assert by_name["Loan Amount"]["field_value"] == "$450,000"
+    assert by_name["Loan Amount"]["conflict"] is True
+    assert by_name["Loan Amount"]["candidates"] == ["$400,000", "$450,000"]
+    assert "conflict" not in by_name["Borrower Name"]
+    assert by_name["Borrower Name"]["confidence_score"] == 0.9
+
+def test_merge_ignores_low_confidence_late_candidates():
+    merged = merge_chunk_fields([
+        [field("Annual Income", "$90,000", 1.0)],
+        [field("Annual Income", "$10,000", 0.5)],
+    ])
+    assert merged[0]["field_value"] == "$90,000"
+    assert merged[0]["conflict"] is True
+
+def test_merge_prefers_later_chunk_for_normalized_values():
+    # The correction was spoken as "four fifty thousand" and normalized; the earlier value
+    # appears word for word in the transcript but still loses
+    merged = merge_chunk_fields([
+        [field("Loan Amount", "$400,000", 0.85)],
+        [field("Loan Amount", "$450,000", 0.7)],
+    ])
+    assert merged[0]["field_value"] == "$450,000"
+    assert merged[0]["candidates"] == ["$400,000", "$450,000"]
@@ -0,0 +1,103 @@
+import random
+import re
+from api.app import build_match_index, calculate_confidence
+from api.fields import FORM_1003_FIELDS
+
+TRANSCRIPT = ("Hi, I'm speaking with John Smith. They are requesting a loan of $250,000 "
+              "for the property located at 123 Main St, Boston. Their annual income is $85,000.")
+
+def test_match_index_records_spans_per_field():
+    """Every field cue should be recorded with its position in the transcript"""
+    match_index = build_match_index(TRANSCRIPT)
+    assert match_index["Borrower Name"]
+    assert match_index["Loan Amount"]
+    start, end = match_index["Property Address"][0]
+    assert TRANSCRIPT[start:end].lower().startswith("located at")
+
+def test_match_index_keeps_overlapping_cues():
+    """A cue shared by several fields is recorded for each of them"""
+    match_index = build_match_index("We are buying a condo")
+    assert match_index["Property Type"]
+    assert match_index["Loan Purpose"]
+
+def test_confidence_with_and_without_index():
+    """Passing a precomputed index must not change the score"""
+    match_index = build_match_index(TRANSCRIPT)
+    for field_name, value in [("Borrower Name", "John Smith"),
+                              ("Loan Amount", "$250,000"),
+                              ("Property Address", "123 Main St, Boston"),
+                              ("Annual Income", "$85,000")]:
+        assert calculate_confidence(field_name, value, TRANSCRIPT) == \
+            calculate_confidence(field_name, value, TRANSCRIPT, match_index)
+
+def test_confidence_scores():
+    """Pattern, format, context and field-specific bonuses add up"""
+    assert calculate_confidence("Borrower Name", "John Smith", TRANSCRIPT) == 1.0
+    assert calculate_confidence("Loan Amount", "$250,000", TRANSCRIPT) == 1.0
+    assert calculate_confidence("Loan Amount", "about 250k", "nothing relevant") == 0.5
+    assert calculate_confidence("Unknown Field", "value", TRANSCRIPT) == 0.5
+
+def baseline_confidence(field_name, value, transcript):
+    """calculate_confidence as it was before the match index, kept as the reference"""
+    confidence = 0.5
+    field_info = FORM_1003_FIELDS.get(field_name, {})
+    for pattern in field_info.get('patterns', []):
+        if re.search(pattern, transcript, re.IGNORECASE):
+            confidence += 0.2
+            break
+    if field_info.get('format') and re.match(field_info['format'], value.strip()):
+        confidence += 0.15
+    value_pos = transcript.find(value)
+    if value_pos != -1:
+        context = transcript[max(0, value_pos - 50):min(len(transcript), value_pos + len(value) + 50)]
+        if any(re.search(pattern, context, re.IGNORECASE) for pattern in field_info.get('patterns', [])):
+            confidence += 0.15
+    if field_name == "Borrower Name":
+        if len(value.split()) >= 2:
+            confidence += 0.1
+    elif field_name == "Loan Amount":
+        if re.match(r'^\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?$', value):
+            confidence += 0.1
+    elif field_name == "Property Type":
+        valid_types = ['Single Family', 'Condo', 'Townhouse', 'Multi-Family', 'Manufactured']
+        if any(t.lower() in value.lower() for t in valid_types):
+            confidence += 0.1
+    return round(min(max(confidence, 0.0), 1.0), 2)
+
+def test_context_edge_cases_match_baseline():
+    """Cues cut off at the window edge or starting mid-word score as the window search did"""
+    cases = [
+        # The cue's \s+ runs past the end of the window
+        ("Loan Amount", "$1", "$1" + "x" * 36 + " loan amount" + " " * 20),
+        # \b holds at the window's first character, though not in the transcript
+        ("Borrower Name", "Smith", "z" * 10 + "hmr. " + "y" * 45 + "Smith"),
+        # speaking with\b cut off inside "without"
+        ("Borrower Name", "Jo", "Jo" + "y" * 35 + " speaking without"),
+        # Dotless i and long s match cues case-insensitively
+        ("Annual Income", "$85,000", "annual ıncome ıs $85,000"),
+        ("Loan Purpose", "Purchase", "Purchaſe"),
+    ]
+    for field_name, value, transcript in cases:
+        assert calculate_confidence(field_name, value, transcript) == \
+            baseline_confidence(field_name, value, transcript), (field_name, value, transcript)
+
+def test_confidence_matches_baseline_on_random_transcripts():
+    """The indexed scoring gives the scores of the original implementation"""
+    pieces = ["borrower's name is", "speaking with", "Mr. ", "mrs.", "I'm ", "this is ", "name:",
+              "loan amount ", "requesting a loan of $", "borrowing ", "mortgage of ", "amount:",
+              "property at ", "located is  ", "looking at ", "buying in", "address:", "annual income is ",
+              "makes ", "earning ", "salary of ", "income:", "works at ", "job is ", "employer:",
+              "home is a ", "buying a  ", "looking to ", "refinance", "purchase", "purpose:", "John Smith",
+              "$250,000", "123 Main St", "Condo", "Purchase", "x", "h", "ı", "ſ", "İ", " ", "  ",
+              "\n", ".", ",", "withou", "out", "ing", "the "]
+    values = ["John Smith", "$250,000", "123 Main St", "Condo", "Purchase", "Acme", "250k"]
+    rng = random.Random(0)
+    for _ in range(3000):
+        parts = [rng.choice(pieces) for _ in range(rng.randint(1, 30))]
+        if rng.random() < 0.3:
+            parts.insert(rng.randrange(len(parts) + 1), 'z' * rng.randint(1, 60))
+        transcript = ''.join(parts)
+        value = rng.choice(values + parts)
+        field_name = rng.choice(list(FORM_1003_FIELDS))
+        assert calculate_confidence(field_name, value, transcript) == \
+            baseline_confidence(field_name, value, transcript), (field_name, value, transcript)
@@ -0,0 +1,125 @@
+import io
+import json
+import time
+import pytest
+from api.app import app
+from api.jobs import InvalidJobInput, JobQueue, JobStore, parse_jsonl
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out waiting for the job queue")
+
+def test_queue_retries_with_backoff_then_succeeds(store):
+    calls = []
+
+    def flaky(transcript):
+        calls.append(transcript)
+        if len(calls) < 3:
+            raise RuntimeError("429 Resource exhausted")
+        return {"fields": [], "cached": False}
+
+    queue = JobQueue(store, flaky, workers=1, max_attempts=5, base_delay=0.01, max_delay=0.05, poll_interval=0.01)
+    job_id = store.create_job([("transcript", "call-1")])
+    queue.start()
+    try:
+        wait_for(lambda: store.get_job(job_id)["status"] == "completed")
+    finally:
+        queue.stop()
+    assert len(calls) == 3
+    assert list(store.results(job_id)) == [{"index": 0, "id": "call-1", "fields": [], "cached": False}]
+
+def test_queue_marks_item_failed_after_max_attempts(store):
+    def broken(transcript):
+        raise RuntimeError("503 unavailable")
+
+    queue = JobQueue(store, broken, workers=2, max_attempts=2, base_delay=0.01, poll_interval=0.01)
+    job_id = store.create_job([("a", None), ("b", None)])
+    queue.start()
+    try:
+        wait_for(lambda: store.get_job(job_id)["status"] == "completed")
+    finally:
+        queue.stop()
+    job = store.get_job(job_id)
+    assert job["failed"] == 2 and job["succeeded"] == 0
+    assert [r["attempts"] for r in store.results(job_id)] == [2, 2]
+    assert "503 unavailable" in next(store.results(job_id))["error"]
+
+def test_expired_lease_makes_item_claimable_again(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0)
+    store.create_job([("transcript", None)])
+    first = store.claim()
+    second = store.claim()
+    assert first[:3] == second[:3]
+    assert (first[3], second[3]) == (1, 2)
+    store.close()
+
+def test_expired_lease_cannot_overwrite_a_reclaimed_item(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0)
+    job_id = store.create_job([("transcript", None)])
+    stale = store.claim()
+    current = store.claim()
+    assert store.complete(current[0], current[1], current[3], {"fields": ["current"]})
+    # The first worker finishes late: none of its outcomes may replace the result
+    assert not store.fail(stale[0], stale[1], stale[3], "late error")
+    assert not store.retry(stale[0], stale[1], stale[3], "late error", 0)
+    assert not store.complete(stale[0], stale[1], stale[3], {"fields": ["stale"]})
+    assert store.get_job(job_id)["succeeded"] == 1
+    assert list(store.results(job_id)) == [{"index": 0, "fields": ["current"]}]
+    store.close()
+
+def test_store_opens_database_on_first_use(tmp_path):
+    path = tmp_path / "state" / "jobs.db"
+    store = JobStore(str(path))
+    assert not path.exists()
+    assert store.get_job("missing") is None
+    assert path.exists()
+    store.close()
+
+def test_parse_jsonl_accepts_objects_and_strings():
+    assert parse_jsonl('{"transcript": "a", "id": 7}\n\n"b"\n') == [("a", "7"), ("b", None)]
+    with pytest.raises(InvalidJobInput):
+        parse_jsonl('{"transcript": "a"}\n{"title": "no transcript"}\n')
+
+def test_jobs_api_end_to_end(client):
+    import api.app
+    api.app.extraction_cache.clear()
+    response = client.post('/jobs', json={"transcripts": ["We want to refinance.", {"transcript": "Income is $90,000", "id": "x"}]})
+    assert response.status_code == 202
+    job_id = response.json["id"]
+    assert response.json["total"] == 2
+
+    wait_for(lambda: client.get(f'/jobs/{job_id}').json["status"] == "completed")
+    results = client.get(f'/jobs/{job_id}/results')
+    assert results.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in results.get_data(as_text=True).splitlines()]
+    assert [line["index"] for line in lines] == [0, 1]
+    assert lines[1]["id"] == "x"
+    assert all("fields" in line for line in lines)
+
+def test_jobs_api_accepts_jsonl_upload(client):
+    upload = io.BytesIO(b'{"transcript": "My name is John Smith", "id": "c1"}\n')
+    response = client.post('/jobs', data={"file": (upload, "calls.jsonl")}, content_type='multipart/form-data')
+    assert response.status_code == 202
+    assert response.json["total"] == 1
+
+def test_jobs_api_rejects_bad_input(client):
+    assert client.post('/jobs', json={}).status_code == 400
+    assert client.post('/jobs', data='not json\n', content_type='application/x-ndjson').status_code == 400
+    assert client.get('/jobs/unknown').status_code == 404
+    assert client.get('/jobs/unknown/results').status_code == 404
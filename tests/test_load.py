@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from benchmarks.load import arrival_times, find_saturation, run_step, serve
+
+TRANSCRIPT = "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston."
+
+def step(rate, throughput, p99_ms=100.0, error_rate=0.0):
+    return {'offered_rate': rate, 'arrival_rate': rate, 'throughput_per_s': throughput,
+            'p99_ms': p99_ms, 'error_rate': error_rate, 'timeout_rate': 0.0}
+
+def test_arrival_times():
+    assert arrival_times(4, 1.0, 'uniform') == [0.25, 0.5, 0.75]
+    poisson = arrival_times(100, 10.0, seed=1)
+    assert poisson == arrival_times(100, 10.0, seed=1)
+    assert 900 < len(poisson) < 1100
+    assert poisson == sorted(poisson) and poisson[-1] < 10.0
+
+def test_saturation_is_the_first_unsustained_rate():
+    steps = [step(40, 25.0), step(10, 10.0), step(20, 19.5, p99_ms=2500.0)]
+    saturation = find_saturation(steps, slo_ms=2000.0, max_error_rate=0.01)
+    assert saturation['max_sustained_rate'] == 10
+    assert saturation['saturation_rate'] == 20
+    assert saturation['reasons'] == ["p99 2500.0ms over 2000.0ms"]
+
+    saturation = find_saturation([step(10, 10.0, error_rate=0.05)], 2000.0, 0.01)
+    assert saturation['max_sustained_rate'] is None
+    assert saturation['reasons'] == ["errors 5.00%, timeouts 0.00%"]
+    assert find_saturation([step(10, 9.5)], 2000.0, 0.01)['saturation_rate'] is None
+
+def test_step_against_the_app(monkeypatch):
+    monkeypatch.setenv('FAKE_MODEL_LATENCY', '0')
+    url, stop = serve()
+    try:
+        report = run_step(url + '/extract-fields', [TRANSCRIPT], rate=20, duration=0.5,
+                          concurrency=4, arrival='uniform')
+    finally:
+        stop()
+    # 0.05s apart over 0.5s, give or take float rounding of the last arrival
+    assert report['requests'] in (9, 10)
+    assert report['ok'] == report['requests']
+    assert report['statuses'] == {'200': report['requests']}
+    assert report['error_rate'] == 0.0
+    assert 0 < report['p50_ms'] <= report['p99_ms'] <= report['max_ms']
+
+def test_load_test_does_not_import_the_app():
+    # Against a running server (--url) the load generator has no use for the app or a model client
+    code = "import sys, benchmarks.load; sys.exit('api.app' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, '-c', code], cwd=root).returncode == 0
@@ -0,0 +1,118 @@
+import json
+import logging
+import multiprocessing
+import os
+import pytest
+from api.app import app
+from api.logs import JsonFormatter
+from api.metrics import MetricsRegistry
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter('demo_requests_total', 'Requests', ('status',))
+    latency = registry.histogram('demo_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    requests.inc(status=200)
+    requests.inc(2, status=200)
+    latency.observe(0.05, stage='parse')
+    latency.observe(0.5, stage='parse')
+    text = registry.render()
+    assert '# TYPE demo_requests_total counter' in text
+    assert 'demo_requests_total{status="200"} 3' in text
+    assert 'demo_seconds_bucket{stage="parse",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="parse",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{stage="parse",le="+Inf"} 2' in text
+    assert 'demo_seconds_count{stage="parse"} 2' in text
+
+def test_registry_rejects_wrong_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter('demo_total', 'Demo', ('kind',))
+    with pytest.raises(ValueError):
+        counter.inc(other='x')
+
+def _worker(registry, directory, ready_value, in_flight, flushed=None, done=None, retire=False):
+    """A forked server worker: shares its metrics, counts five requests, then exits once ``done``"""
+    registry.share(directory, interval=3600)
+    registry._metrics['demo_requests_total'].inc(5, status=200)
+    registry._metrics['demo_seconds'].observe(0.5)
+    registry._metrics['demo_in_flight'].set(in_flight)
+    registry._metrics['demo_ready'].set(ready_value)
+    registry.flush()
+    if done is not None:
+        flushed.set()
+        done.wait(10)
+    if retire:
+        registry.retire()
+
+def test_registry_combines_worker_processes(tmp_path):
+    context = multiprocessing.get_context('fork')
+    registry = MetricsRegistry()
+    requests = registry.counter('demo_requests_total', 'Requests', ('status',))
+    latency = registry.histogram('demo_seconds', 'Latency', buckets=(1.0,))
+    in_flight = registry.gauge('demo_in_flight', 'In flight')
+    ready = registry.gauge('demo_ready', 'Ready', multiprocess_mode='min')
+    # Inherited by the workers through the fork, but not theirs to report
+    requests.inc(100, status=200)
+
+    registry.share(str(tmp_path), interval=3600)
+    requests.inc(status=200)
+    in_flight.set(2)
+    ready.set(1)
+    # One worker exits on its own, one is killed, one keeps running
+    flushed, done = context.Event(), context.Event()
+    workers = [context.Process(target=_worker, args=(registry, str(tmp_path), 1, 4), kwargs={'retire': True}),
+               context.Process(target=_worker, args=(registry, str(tmp_path), 1, 8)),
+               context.Process(target=_worker, args=(registry, str(tmp_path), 0, 3, flushed, done))]
+    for worker in workers[:2]:
+        worker.start()
+        worker.join()
+    workers[2].start()
+    assert flushed.wait(10)
+
+    text = registry.render()
+    assert 'demo_requests_total{status="200"} 16' in text
+    assert 'demo_seconds_count 3' in text
+    # Gauges of exited workers are dropped; live ones are summed, or combined by their mode
+    assert 'demo_in_flight 5' in text
+    assert 'demo_ready 0' in text
+
+    done.set()
+    workers[2].join()
+    text = registry.render()
+    assert 'demo_requests_total{status="200"} 16' in text
+    assert 'demo_in_flight 2' in text
+    assert 'demo_ready 1' in text
+    assert {path.name for path in tmp_path.glob('*.json')} == {'archive.json', f'{os.getpid()}.json'}
+    registry.retire()
+
+def test_metrics_endpoint_reports_requests_stages_and_tokens(client):
+    import api.app
+    api.app.extraction_cache.clear()
+    client.post('/extract-fields', json={"transcript": "We want to refinance. Income is about $95,000 a year."})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.get_data(as_text=True)
+    assert 'formsiq_requests_total{endpoint="/extract-fields",method="POST",status="200"}' in text
+    assert 'formsiq_stage_duration_seconds_count{stage="model_call"}' in text
+    assert 'formsiq_stage_duration_seconds_count{stage="scoring"}' in text
+    assert 'formsiq_model_tokens_total{kind="prompt"}' in text
+    assert 'formsiq_model_queue_size 0' in text
+
+def test_logs_do_not_contain_transcripts(client, caplog):
+    import api.app
+    api.app.extraction_cache.clear()
+    transcript = "My name is Jane Roe and I live at 12 Secret Lane"
+    with caplog.at_level(logging.DEBUG):
+        client.post('/extract-fields', json={"transcript": transcript})
+    assert caplog.records
+    formatter = JsonFormatter()
+    for record in caplog.records:
+        line = formatter.format(record)
+        json.loads(line)
+        assert "Jane Roe" not in line and "Secret Lane" not in line
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+import pytest
+import api.app
+from api.app import app
+from api.normalize import (canonical_value, normalize_address, normalize_loan_purpose, normalize_money,
+                           normalize_name, normalize_property_type, parse_amount)
+
+@pytest.mark.parametrize("value, expected", [
+    ("$300,000", "$300,000"),
+    ("225K/year", "$225,000"),
+    ("$225K", "$225,000"),
+    ("275k", "$275,000"),
+    ("1.2 million", "$1,200,000"),
+    ("three-twenty-five thousand", "$325,000"),
+    ("one-fifty thousand", "$150,000"),
+    ("a hundred and twenty thousand dollars", "$120,000"),
+    ("$85,000.50 per year", "$85,000.50"),
+    ("6 figures - about 100k", "6 figures - about 100k"),  # two amounts: left as worded
+    ("Not specified", "Not specified"),
+    ("two million five hundred thousand", "$2,500,000"),
+    # Ranges and corrections are two amounts, not their sum
+    ("$400K - $450K", "$400K - $450K"),
+    ("450K-500K", "450K-500K"),
+    ("$400K/$450K", "$400K/$450K"),
+    ("$400,000\u2013$450,000", "$400,000\u2013$450,000"),
+    ("fifty-to-sixty thousand", "fifty-to-sixty thousand"),
+    ("400K 450K", "400K 450K"),
+    ("400K, I mean 450K", "400K, I mean 450K"),
+    ("four hundred thousand four fifty thousand", "four hundred thousand four fifty thousand"),
+])
+def test_money(value, expected):
+    assert normalize_money(value) == expected
+
+def test_parse_amount_needs_exactly_one_amount():
+    assert parse_amount("$95,000 plus $30,000") is None
+    assert parse_amount("$400K - $450K") is None
+    assert parse_amount("$400K $450K") is None
+    assert parse_amount("no idea") is None
+
+@pytest.mark.parametrize("value, expected", [
+    ("123 main street, boston", "123 Main St, Boston"),
+    ("42-B West 73rd St., Apt. 5C, New York, ny", "42-B West 73rd St, Apt 5C, New York, NY"),
+    ("789 Oak Drive, Austin, TX", "789 Oak Dr, Austin, TX"),
+    ("12 Court Street", "12 Court St"),
+])
+def test_address(value, expected):
+    assert normalize_address(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("single-family home", "Single Family"),
+    ("Multi-family", "Multi-Family"),
+    ("the condo", "Condo"),
+    ("Condominum", "Condo"),  # misspelled
+    ("townhome", "Townhouse"),
+    ("castle", "castle"),
+])
+def test_property_type(value, expected):
+    assert normalize_property_type(value) == expected
+
+def test_loan_purpose_and_name():
+    assert normalize_loan_purpose("refi") == "Refinance"
+    assert normalize_loan_purpose("buying") == "Purchase"
+    assert normalize_loan_purpose("refinance or buy") == "refinance or buy"
+    assert normalize_name("JEAN-PIERRE O'CONNOR") == "Jean-Pierre O'Connor"
+    assert normalize_name("Dr. Maria Garcia-Rodriguez") == "Dr. Maria Garcia-Rodriguez"
+
+def test_canonical_value_only_normalizes_known_fields():
+    assert canonical_value("Annual Income", "  225K/year ") == "$225,000"
+    assert canonical_value("Employment Info", "acme  corp") == "acme corp"
+
+def test_model_answers_are_normalized(monkeypatch):
+    class LooseModel:
+        model_name = 'loose'
+
+        def generate_content(self, prompt, **kwargs):
+            return SimpleNamespace(text="Annual Income: 225K/year\nProperty Type: condominium\n")
+
+    monkeypatch.setattr(api.app, 'model', LooseModel())
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    transcript = "Caller: I make 225K/year and I'm buying a condominium."
+    response = app.test_client().post('/extract-fields', json={
+        "transcript": transcript, "fields": ["Annual Income", "Property Type"]})
+    fields = {field['field_name']: field for field in response.json['fields']}
+    assert fields["Annual Income"]["field_value"] == "$225,000"
+    assert fields["Property Type"]["field_value"] == "Condo"
+    # Scored as the canonical value, found in the transcript by the model's wording
+    assert fields["Annual Income"]["confidence_score"] == api.app.calculate_confidence(
+        "Annual Income", "$225,000", transcript, value_pos=transcript.find("225K/year"))
@@ -0,0 +1,55 @@
+from api.backends import FakeBackend
+from api.metrics import PROMPT_EXAMPLES_DROPPED, PROMPT_TOKENS
+from api.prompts import (FEW_SHOT_PREFIX, PromptBuilder, build_extraction_prompt, estimate_tokens,
+                         rank_examples, transcripts_in_prompt)
+
+TRANSCRIPT = "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston."
+
+def long_transcript(chars):
+    filler = " We talked about the weather and the schedule for the appraisal."
+    return TRANSCRIPT + filler * (chars // len(filler))
+
+def test_prompt_within_budget_keeps_every_example():
+    builder = PromptBuilder(token_budget=6000)
+    assert builder.extraction_prompt(TRANSCRIPT) == build_extraction_prompt(TRANSCRIPT)
+    assert builder.extraction_prompt(TRANSCRIPT).startswith(FEW_SHOT_PREFIX)
+
+def test_prefix_is_rendered_once():
+    builder = PromptBuilder(token_budget=3000)
+    assert builder.prefix(None, 1500) is builder.prefix(None, 1500)
+
+def test_long_transcript_drops_lowest_ranked_examples_first():
+    budget = 2000
+    transcript = long_transcript(6000)
+    prompt = PromptBuilder(token_budget=budget).extraction_prompt(transcript)
+    ranked = rank_examples()
+    kept = [title for title in ranked if f"({title}):" in prompt]
+
+    assert 0 < len(kept) < len(ranked)
+    assert kept == list(ranked[:len(kept)])
+    assert estimate_tokens(prompt) <= budget
+
+def test_very_long_transcript_keeps_whole_transcript_without_examples():
+    transcript = long_transcript(20000)
+    prompt = PromptBuilder(token_budget=1000).extraction_prompt(transcript)
+
+    assert "Example 1" not in prompt
+    assert transcripts_in_prompt(prompt) == transcript
+    assert "John Smith" in FakeBackend().generate_content(prompt).text
+
+def test_batch_prompt_respects_budget():
+    transcripts = [long_transcript(4000) for _ in range(3)]
+    prompt = PromptBuilder(token_budget=4000).batch_prompt(transcripts)
+    assert len(prompt) < len(PromptBuilder().batch_prompt(transcripts))
+    assert transcripts_in_prompt(prompt) == transcripts
+
+def test_prompt_size_metrics():
+    single, batch = PROMPT_TOKENS.count(kind='single'), PROMPT_TOKENS.count(kind='batch')
+    dropped = PROMPT_EXAMPLES_DROPPED.value()
+
+    PromptBuilder(token_budget=1000).extraction_prompt(long_transcript(2000))
+    PromptBuilder().batch_prompt([TRANSCRIPT])
+
+    assert PROMPT_TOKENS.count(kind='single') == single + 1
+    assert PROMPT_TOKENS.count(kind='batch') == batch + 1
+    assert PROMPT_EXAMPLES_DROPPED.value() > dropped
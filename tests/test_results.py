@@ -0,0 +1,64 @@
+import pytest
+import api.app
+from api.app import app
+from api.backends import FakeBackend
+from api.results import ResultStore, normalize_address, normalize_name, transcript_hash
+
+TRANSCRIPT = "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main Street, Boston."
+
+def fields(**values):
+    return [{"field_name": name.replace('_', ' ').title(), "field_value": value, "confidence_score": 0.9,
+             "source": "model"} for name, value in values.items()]
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    yield store
+    store.close()
+
+def test_lookup_keys_ignore_formatting():
+    assert normalize_name("Mr. JOHN  Smith") == normalize_name("john smith") == "john smith"
+    assert normalize_address("123 Main Street, Boston") == normalize_address("123 main st boston")
+    assert transcript_hash("Hi,  there\n") == transcript_hash("Hi, there")
+
+def test_query_by_borrower_address_and_time(store, monkeypatch):
+    clock = iter([100.0, 200.0, 300.0])
+    monkeypatch.setattr('api.results.time.time', lambda: next(clock))
+    store.record("a", fields(borrower_name="John Smith", loan_amount="$300,000"), "m", "2")
+    store.record("b", fields(borrower_name="Jane Doe", property_address="9 Elm Road"), "m", "2")
+    store.record("c", fields(borrower_name="john smith", loan_amount="$350,000"), "m", "2",
+                 requested_fields=["Borrower Name", "Loan Amount"], duration_seconds=0.25)
+
+    found = store.query(borrower="Mr. John Smith")
+    assert [result["transcript_hash"] for result in found] == ["c", "a"]  # newest first
+    assert found[0]["fields"][1]["field_value"] == "$350,000"
+    assert found[0]["duration_ms"] == 250.0
+    assert found[0]["requested_fields"] == ["Borrower Name", "Loan Amount"]
+    assert [r["transcript_hash"] for r in store.query(address="9 elm rd")] == ["b"]
+    assert [r["transcript_hash"] for r in store.query(borrower="John Smith", since=150)] == ["c"]
+    assert [r["transcript_hash"] for r in store.query(since=150, until=250)] == ["b"]
+    assert [r["transcript_hash"] for r in store.query(transcript_hash="a")] == ["a"]
+    assert len(store.query(limit=2)) == 2
+
+def test_extractions_are_recorded_and_queryable(store, monkeypatch):
+    monkeypatch.setattr(api.app, 'result_store', store)
+    monkeypatch.setattr(api.app, 'model', FakeBackend())
+    api.app.extraction_cache.clear()
+    client = app.test_client()
+    client.post('/extract-fields', json={"transcript": TRANSCRIPT})
+    client.post('/extract-fields', json={"transcript": TRANSCRIPT})  # cached: not recorded again
+
+    results = client.get('/results', query_string={"borrower": "JOHN SMITH"}).json['results']
+    assert len(results) == 1
+    assert results[0]["transcript_hash"] == transcript_hash(TRANSCRIPT)
+    assert {f['field_name']: f['field_value'] for f in results[0]['fields']}["Loan Amount"] == "$300,000"
+    assert results[0]["prompt_version"] == api.app.PROMPT_VERSION
+
+    assert client.get('/results', query_string={"address": "123 Main St, Boston"}).json['results'] == results
+    assert client.get('/results', query_string={"since": "2999-01-01"}).json['results'] == []
+    assert client.get('/results', query_string={"since": "yesterday"}).status_code == 400
+    assert client.get('/results', query_string={"limit": "0"}).status_code == 400
+
+def test_results_endpoint_needs_a_store(monkeypatch):
+    monkeypatch.setattr(api.app, 'result_store', None)
+    assert app.test_client().get('/results').status_code == 404
@@ -0,0 +1,61 @@
+from api.rules import extract_fields_locally
+
+STRUCTURED = "Name: Michael Garcia\nAmount: $661,000\nAddress: 650 Maple Circle, Denver, CO\nIncome: $91,000"
+COMPLETE = ("Hi, I'm John Smith. I'm requesting a loan of $300,000 for the property located at "
+            "123 Main St, Boston. My annual income is $85,000 and I work at Tech Corp. "
+            "Property type: condo. Loan purpose: purchase.")
+
+def by_name(fields):
+    return {field['field_name']: field for field in fields}
+
+def test_structured_transcript():
+    fields = by_name(extract_fields_locally(STRUCTURED))
+    assert fields['Borrower Name']['field_value'] == 'Michael Garcia'
+    assert fields['Loan Amount']['field_value'] == '$661,000'
+    assert fields['Property Address']['field_value'] == '650 Maple Cir, Denver, CO'
+    assert fields['Annual Income']['field_value'] == '$91,000'
+    assert all(field['source'] == 'rules' for field in fields.values())
+    # Each value sits next to the only cue for its field, so none earns the context bonus
+    assert {name: field['confidence_score'] for name, field in fields.items()} == {
+        'Borrower Name': 0.95, 'Loan Amount': 0.95, 'Property Address': 0.85, 'Annual Income': 0.85}
+
+def test_second_cue_earns_context_bonus():
+    fields = by_name(extract_fields_locally("Borrower name is John Smith. That's Mr. John Smith."))
+    assert fields['Borrower Name']['confidence_score'] == 1.0
+
+def test_all_fields_from_cues():
+    fields = by_name(extract_fields_locally(COMPLETE))
+    assert fields['Employment Info']['field_value'] == 'Tech Corp'
+    assert fields['Property Type']['field_value'] == 'Condo'
+    assert fields['Loan Purpose']['field_value'] == 'Purchase'
+    assert len(fields) == 7
+
+def test_requested_fields_only():
+    fields = extract_fields_locally(COMPLETE, fields=['Loan Amount'])
+    assert [field['field_name'] for field in fields] == ['Loan Amount']
+
+def test_corrections_and_conflicts_are_left_for_the_model():
+    fields = by_name(extract_fields_locally(
+        "The loan amount is $400,000 and the loan amount is $450,000. "
+        "Located at 123 Main St - sorry, 321 Main St."))
+    assert 'Loan Amount' not in fields
+    assert 'Property Address' not in fields
+
+def test_ambiguous_employment_cue():
+    fields = by_name(extract_fields_locally("I'm working with Sarah Brown on this application."))
+    assert 'Employment Info' not in fields
+
+def test_organisations_and_phrases_are_not_names():
+    assert extract_fields_locally("Hi, this is Wells Fargo Home Lending calling about your loan.") == []
+    assert extract_fields_locally("I am Not Sure what you need from me.") == []
+    fields = by_name(extract_fields_locally("Hi, this is Chase Mortgage calling. Speaking with Jane Doe?"))
+    assert fields['Borrower Name']['field_value'] == 'Jane Doe'
+
+def test_competing_values_are_left_for_the_model():
+    fields = by_name(extract_fields_locally(
+        "The property is at 12 Oak St, Boston and also 44 Pine St. "
+        "I'm requesting a loan of $300,000, maybe $350,000."))
+    assert fields == {}
+    # A second address anywhere in the call makes the first one ambiguous too
+    fields = by_name(extract_fields_locally("The property is at 12 Oak St, Boston.\nI currently live at 9 Elm Rd."))
+    assert 'Property Address' not in fields
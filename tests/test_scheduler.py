@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+import pytest
+import api.app
+from api.app import app
+from api.async_client import ModelOverloaded
+from api.backends import GeminiBackend, ModelResponse
+from api.deadline import DeadlineExceeded, request_deadline
+from api.scheduler import BULK, INTERACTIVE, ModelScheduler, TokenBucket, current_lane, error_status, model_lane
+
+class CountingModel:
+    """Answers every prompt after ``latency`` seconds, optionally failing first, and records calls"""
+    name = 'counting'
+    model_name = 'counting'
+
+    def __init__(self, latency=0.0, errors=()):
+        self.latency = latency
+        self.errors = list(errors)
+        self.calls = []
+        self.lanes = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls.append(prompt)
+        self.lanes.append(current_lane())
+        time.sleep(self.latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        return ModelResponse(f"answer to {prompt}")
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls.append(prompt)
+        await asyncio.sleep(self.latency)
+        return ModelResponse(f"answer to {prompt}")
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_over_time():
+    clock = Clock()
+    bucket = TokenBucket(per_minute=60, capacity=2, clock=clock)
+    bucket.take(2)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now = 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now = 10
+    assert bucket.wait_time(1) == 0
+    assert bucket.level == 2  # never above capacity
+    # Calls bigger than the bucket wait for a full bucket rather than forever
+    assert bucket.wait_time(100) == 0
+
+def test_error_status():
+    assert error_status(RuntimeError("429 Resource has been exhausted")) == 429
+    assert error_status(RuntimeError("quota")) is None
+
+    class ApiError(Exception):
+        code = 503
+    assert error_status(ApiError("unavailable")) == 503
+
+def test_quota_wait_beyond_lane_limit_is_rejected():
+    scheduler = ModelScheduler(CountingModel(), requests_per_minute=2, max_wait={INTERACTIVE: 0.1})
+    scheduler.generate_content("a")
+    scheduler.generate_content("b")
+    with pytest.raises(ModelOverloaded) as error:
+        scheduler.generate_content("c")
+    assert error.value.retry_after >= 29
+    assert scheduler.model.calls == ["a", "b"]
+
+def test_token_quota_counts_prompt_size():
+    scheduler = ModelScheduler(CountingModel(), tokens_per_minute=1000, output_tokens=0, max_wait={INTERACTIVE: 0})
+    scheduler.generate_content("x" * 3000)  # ~750 tokens
+    with pytest.raises(ModelOverloaded):
+        scheduler.generate_content("y" * 3000)
+
+def test_interactive_lane_goes_before_bulk():
+    model = CountingModel()
+    scheduler = ModelScheduler(model)
+    scheduler.requests = TokenBucket(per_minute=600, capacity=1)
+    scheduler.generate_content("first")
+
+    def call(lane, prompt):
+        with model_lane(lane):
+            scheduler.generate_content(prompt)
+
+    bulk = threading.Thread(target=call, args=(BULK, "bulk"))
+    bulk.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=call, args=(INTERACTIVE, "interactive"))
+    interactive.start()
+    bulk.join()
+    interactive.join()
+    assert model.calls == ["first", "interactive", "bulk"]
+    assert model.lanes == [INTERACTIVE, INTERACTIVE, BULK]
+
+def test_waiting_queue_is_bounded():
+    scheduler = ModelScheduler(CountingModel(), requests_per_minute=60, max_waiting=1, max_wait={BULK: 5})
+    scheduler.requests = TokenBucket(per_minute=60, capacity=1)
+    scheduler.generate_content("first")
+
+    def wait_in_bulk_lane():
+        with model_lane(BULK):
+            scheduler.generate_content("second")
+
+    waiter = threading.Thread(target=wait_in_bulk_lane)
+    waiter.start()
+    time.sleep(0.05)
+    assert scheduler.waiting(BULK) == 1
+    with model_lane(BULK), pytest.raises(ModelOverloaded, match="Too many"):
+        scheduler.generate_content("third")
+    waiter.join()
+    assert scheduler.model.calls == ["first", "second"]
+
+def test_queue_size_counts_waiting_and_running_calls(monkeypatch):
+    scheduler = ModelScheduler(CountingModel(latency=0.3), requests_per_minute=60, max_wait={INTERACTIVE: 5})
+    scheduler.requests = TokenBucket(per_minute=60, capacity=1)
+    monkeypatch.setattr(api.app, 'model', scheduler)
+    threads = [threading.Thread(target=scheduler.generate_content, args=(prompt,)) for prompt in ("one", "two")]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    # One call runs at the model, the other waits for quota
+    assert scheduler.queued() == 2
+    assert 'formsiq_model_queue_size 2' in app.test_client().get('/metrics').get_data(as_text=True)
+    for thread in threads:
+        thread.join()
+    assert scheduler.queued() == 0
+
+def test_identical_calls_in_flight_are_coalesced():
+    model = CountingModel(latency=0.2)
+    scheduler = ModelScheduler(model)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.generate_content("same").text))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.calls == ["same"]
+    assert results == ["answer to same"] * 5
+
+    scheduler.generate_content("same")
+    assert len(model.calls) == 2  # only calls in flight are shared
+
+def test_async_calls_are_coalesced():
+    model = CountingModel(latency=0.1)
+    scheduler = ModelScheduler(model, requests_per_minute=600)
+
+    async def main():
+        return await asyncio.gather(*[scheduler.generate_content_async("same") for _ in range(3)],
+                                    scheduler.generate_content_async("other"))
+
+    responses = asyncio.run(main())
+    assert [r.text for r in responses] == ["answer to same"] * 3 + ["answer to other"]
+    assert sorted(model.calls) == ["other", "same"]
+
+def test_transient_errors_are_retried():
+    model = CountingModel(errors=[RuntimeError("503 Service Unavailable"), TimeoutError("slow")])
+    scheduler = ModelScheduler(model, max_retries=2, base_delay=0.001)
+    assert scheduler.generate_content("a").text == "answer to a"
+    assert len(model.calls) == 3
+
+def test_quota_errors_end_in_overloaded():
+    model = CountingModel(errors=[RuntimeError("429 Resource has been exhausted")] * 3)
+    scheduler = ModelScheduler(model, max_retries=2, base_delay=0.001, max_delay=0.01)
+    with pytest.raises(ModelOverloaded):
+        scheduler.generate_content("a")
+    assert len(model.calls) == 3
+
+def test_other_errors_are_not_retried():
+    model = CountingModel(errors=[ValueError("bad request")])
+    with pytest.raises(ValueError):
+        ModelScheduler(model, base_delay=0.001).generate_content("a")
+    assert len(model.calls) == 1
+
+def test_deadline_stops_retries():
+    model = CountingModel(latency=0.1, errors=[RuntimeError("503 Service Unavailable")] * 3)
+    scheduler = ModelScheduler(model, max_retries=2, base_delay=0.001)
+    with request_deadline(0.05), pytest.raises(DeadlineExceeded):
+        scheduler.generate_content("a")
+    assert len(model.calls) == 1
+
+def test_deadline_bounds_quota_wait():
+    scheduler = ModelScheduler(CountingModel(), max_wait={INTERACTIVE: 10})
+    scheduler.requests = TokenBucket(per_minute=60, capacity=1)
+    scheduler.generate_content("first")
+    started = time.monotonic()
+    with request_deadline(0.1), pytest.raises(DeadlineExceeded):
+        scheduler.generate_content("second")
+    assert time.monotonic() - started < 0.5
+    assert scheduler.model.calls == ["first"]
+
+def test_deadline_bounds_async_calls():
+    scheduler = ModelScheduler(CountingModel(latency=1.0))
+
+    async def main():
+        with request_deadline(0.05):
+            await scheduler.generate_content_async("a")
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert time.monotonic() - started < 0.5
+
+def test_shared_call_past_its_deadline_is_made_again_for_other_callers():
+    model = CountingModel(latency=0.2, errors=[RuntimeError("503 Service Unavailable")])
+    scheduler = ModelScheduler(model, base_delay=0.001)
+    errors, results = [], []
+
+    def leader():
+        with request_deadline(0.1):
+            try:
+                scheduler.generate_content("same")
+            except DeadlineExceeded as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    time.sleep(0.05)
+    results.append(scheduler.generate_content("same").text)
+    thread.join()
+    assert len(errors) == 1
+    assert results == ["answer to same"]
+    assert len(model.calls) == 2
+
+def test_gemini_call_timeout_is_cut_to_the_deadline():
+    backend = GeminiBackend(timeout=60)
+    assert backend._with_timeout({}) == {'request_options': {'timeout': 60}}
+    with request_deadline(5):
+        assert backend._with_timeout({})['request_options']['timeout'] <= 5
+
+@pytest.fixture
+def overloaded_model(monkeypatch):
+    scheduler = ModelScheduler(CountingModel(), requests_per_minute=1, max_wait={INTERACTIVE: 0})
+    scheduler.requests.take(1)
+    monkeypatch.setattr(api.app, 'model', scheduler)
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    api.app.extraction_cache.clear()
+
+def test_overloaded_extraction_answers_429(overloaded_model):
+    response = app.test_client().post('/extract-fields', json={"transcript": "Hi, I'm John Smith."})
+    assert response.status_code == 429
+    assert response.json["overloaded"] is True
+    assert int(response.headers["Retry-After"]) >= 1
+
+def test_overloaded_batch_and_stream_say_so(overloaded_model):
+    client = app.test_client()
+    results = client.post('/extract-fields/batch', json={"transcripts": ["a", "b"]}).json["results"]
+    assert all(result["overloaded"] and "fields" not in result for result in results)
+
+    events = client.post('/extract-fields/stream', json={"transcript": "a"}).data.decode().splitlines()
+    assert '"overloaded": true' in events[-1]
+
+def test_bulk_extraction_uses_bulk_lane(monkeypatch):
+    model = CountingModel()
+    monkeypatch.setattr(api.app, 'model', ModelScheduler(model))
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    api.app.extraction_cache.clear()
+    api.app.extract_fields_bulk("Bulk transcript")
+    api.app.extract_fields("Interactive transcript")
+    assert model.lanes == [BULK, INTERACTIVE]
@@ -0,0 +1,36 @@
+import random
+import pytest
+from api.fields import FORM_1003_FIELDS, calculate_confidence
+from api.scoring import score_batch, score_table
+
+TRANSCRIPTS = [
+    "Hi, I'm speaking with John Smith. They are requesting a loan of $250,000 "
+    "for the property located at 123 Main St, Boston. Their annual income is $85,000.",
+    "We are buying a condo. I work at Tech Corp and make $120,000 a year.",
+    "Nothing relevant was said on this call.",
+]
+VALUES = ["John Smith", "John", "$250,000", "250000", "123 Main St, Boston", "$85,000", "condo", "Condo",
+          "Tech Corp", "Refinance", "Purchase", "", "  $1,000.00 "]
+
+def test_batch_scores_match_scalar_scores():
+    rng = random.Random(11)
+    field_names = [rng.choice(list(FORM_1003_FIELDS) + ["Unknown Field"]) for _ in range(500)]
+    values = [rng.choice(VALUES) for _ in field_names]
+    transcripts = [rng.choice(TRANSCRIPTS) for _ in field_names]
+
+    scores = score_batch(field_names, values, transcripts)
+    assert list(scores) == [calculate_confidence(*row) for row in zip(field_names, values, transcripts)]
+
+def test_score_table_reads_named_columns():
+    table = {"field_name": ["Borrower Name", "Loan Amount"], "field_value": ["John Smith", "about 250k"],
+             "transcript": [TRANSCRIPTS[0], "nothing relevant"]}
+    assert list(score_table(table)) == [1.0, 0.5]
+
+def test_score_table_accepts_dataframes():
+    pandas = pytest.importorskip('pandas')
+    frame = pandas.DataFrame({"field": ["Borrower Name"], "value": ["John Smith"], "text": [TRANSCRIPTS[0]]})
+    assert list(score_table(frame, 'field', 'value', 'text')) == [1.0]
+
+def test_columns_must_line_up():
+    with pytest.raises(ValueError):
+        score_batch(["Borrower Name"], [], [TRANSCRIPTS[0]])
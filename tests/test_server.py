@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import runpy
+import api.app
+
+def test_gunicorn_config_reads_environment(monkeypatch):
+    monkeypatch.setenv('GUNICORN_WORKERS', '3')
+    monkeypatch.setenv('GUNICORN_THREADS', '4')
+    monkeypatch.setenv('PORT', '9000')
+    config = runpy.run_path('gunicorn.conf.py')
+    assert config['workers'] == 3
+    assert config['threads'] == 4
+    assert config['bind'] == '0.0.0.0:9000'
+    assert config['worker_class'] == 'gthread'
+    assert config['timeout'] > 60
+
+def test_init_worker_creates_fresh_per_process_state():
+    previous = (api.app.model, api.app.extraction_cache, api.app.async_model_client,
+                api.app.job_store, api.app.job_queue, api.app.session_store)
+    try:
+        api.app.init_worker()
+        assert api.app.model is not previous[0]
+        assert api.app.extraction_cache is not previous[1]
+        assert api.app.async_model_client.model is api.app.model
+    finally:
+        api.app.job_store.close()
+        api.app.session_store.close()
+        (api.app.model, api.app.extraction_cache, api.app.async_model_client,
+         api.app.job_store, api.app.job_queue, api.app.session_store) = previous
+
+def test_health_and_readiness(monkeypatch):
+    client = api.app.app.test_client()
+    assert client.get('/healthz').json == {'status': 'ok'}
+
+    class ColdModel:
+        model_name = 'cold'
+        failures = 1
+
+        def warm_up(self):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("model unreachable")
+
+    monkeypatch.setattr(api.app, 'model', ColdModel())
+    monkeypatch.setattr(api.app, 'ready', False)
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.json == {'status': 'not ready', 'error': 'model unreachable'}
+    assert 'formsiq_ready 0' in client.get('/metrics').get_data(as_text=True)
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.json['startup_seconds']['import'] > 0
+    assert 'formsiq_ready 1' in client.get('/metrics').get_data(as_text=True)
+
+def test_import_does_not_load_model_sdk(tmp_path):
+    # Without an API key the app still imports and serves; only readiness reports the problem.
+    # Nor does importing it create the jobs or sessions databases
+    script = (
+        "import os, sys\n"
+        "import api.app\n"
+        "assert 'google.generativeai' not in sys.modules\n"
+        "assert not os.path.exists(os.environ['JOB_DB'])\n"
+        "assert not os.path.exists(os.environ['SESSION_DB'])\n"
+        "client = api.app.app.test_client()\n"
+        "assert client.get('/healthz').status_code == 200\n"
+        "response = client.get('/readyz')\n"
+        "assert response.status_code == 503 and 'API key' in response.json['error'], response.json\n"
+    )
+    # An empty key also stops load_dotenv from reading one from a local .env file
+    env = {**os.environ, 'GOOGLE_API_KEY': '', 'MODEL_BACKEND': 'gemini', 'WARM_UP_ON_START': 'false',
+           'JOB_DB': str(tmp_path / 'jobs.db'), 'SESSION_DB': str(tmp_path / 'sessions.db')}
+    result = subprocess.run([sys.executable, '-c', script], env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
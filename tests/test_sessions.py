@@ -0,0 +1,181 @@
+import random
+import pytest
+import api.app
+from api.app import app
+from api.backends import FakeBackend
+from api.fields import IncrementalMatchIndex, build_match_index, calculate_confidence
+from api.prompts import transcripts_in_prompt
+from api.rules import IncrementalLocalValues, local_values
+import api.rules
+from api.sessions import Session, SessionConflict, SessionLimitExceeded, SessionStore
+
+CALL = [
+    "Agent: Thanks for calling, how can I help?\n",
+    "Caller: Hi, I'm John Smith.\n",
+    "Caller: I'm looking to get a $300,000 mortgage for 123 Main St, Boston.\n",
+    "Caller: I work at Tech Corp and we want to refinance the condo.\n",
+]
+
+class RecordingModel:
+    """The fake backend, recording every prompt it is sent"""
+    model_name = 'recording'
+
+    def __init__(self):
+        self.backend = FakeBackend()
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return self.backend.generate_content(prompt, **kwargs)
+
+@pytest.fixture
+def model(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setattr(api.app, 'model', model)
+    return model
+
+def append(client, session_id, text, flush=False):
+    return client.post(f'/sessions/{session_id}/transcript', json={"text": text, "flush": flush})
+
+def values(response):
+    return {field['field_name']: field['field_value'] for field in response.json['fields']}
+
+def test_incremental_index_matches_full_scan():
+    rng = random.Random(7)
+    transcript = "".join(CALL) * 4 + "Borrower's name is Jane Doe. Annual income is $85,000. Name: Bob Lee\n"
+    for _ in range(50):
+        index, position = IncrementalMatchIndex(), 0
+        while position < len(transcript):
+            size = rng.randint(1, 80)
+            index.append(transcript[position:position + size])
+            position += size
+            assert index.spans == build_match_index(index.transcript)
+
+def test_incremental_rule_values_match_full_reading():
+    rng = random.Random(3)
+    transcript = ("".join(CALL) + "Caller: The property is at 9 Elm Road, Salem - sorry, 19 Elm Road, Salem\n"
+                  "Caller: Loan amount $250,000 or maybe $275,000. Name: Bob Lee\n"
+                  "Agent: And the loan amount is $260,000 Annual income is $85,000") * 2
+    for _ in range(30):
+        index, rule_values, position = IncrementalMatchIndex(), IncrementalLocalValues(), 0
+        while position < len(transcript):
+            size = rng.randint(1, 60)
+            index.append(transcript[position:position + size])
+            position += size
+            assert rule_values.update(index.transcript, index.spans) == local_values(index.transcript)
+
+def test_session_rereads_only_open_sentences(monkeypatch):
+    session = Session('s')
+    for text in CALL:
+        session.append(text)
+    session.local_fields()
+    reads = []
+    read_value = api.rules._read_value
+    monkeypatch.setattr(api.rules, '_read_value', lambda *args: reads.append(args[2:]) or read_value(*args))
+    session.append("Caller: My annual income is $85,000")
+    assert {field['field_name'] for field in session.local_fields()} >= {"Borrower Name", "Annual Income"}
+    # Only the new cue was read; the ones in finished lines kept their values
+    assert [session.transcript[start:end] for start, end in reads] == ["annual income is "]
+
+def test_session_confidence_matches_full_scoring():
+    session = Session('s')
+    for text in CALL:
+        session.append(text)
+    transcript = "".join(CALL)
+    for field_name, value in [("Borrower Name", "John Smith"), ("Property Type", "Condo"), ("Loan Amount", "$1")]:
+        assert (session.score(field_name, value, 'model')['confidence_score']
+                == calculate_confidence(field_name, value, transcript))
+
+def test_session_sends_only_new_text_to_model(model, monkeypatch):
+    monkeypatch.setattr(api.app, 'SESSION_CONTEXT_CHARS', 100)
+    client = app.test_client()
+    session_id = client.post('/sessions', json={}).json['id']
+    for text in CALL[:3]:
+        response = append(client, session_id, text)
+    assert response.json['pending_chars'] == len("".join(CALL[:3]))
+    assert values(response) == {"Borrower Name": "John Smith"}  # from rules; the model waits for more text
+    assert model.prompts == []
+
+    response = append(client, session_id, CALL[3], flush=True)
+    assert response.json['pending_chars'] == 0
+    assert values(response)["Property Address"] == "123 Main St, Boston"
+    assert len(model.prompts) == 1
+
+    correction = "Caller: Sorry, the property is at 456 Oak Ave, Boston.\n"
+    response = append(client, session_id, correction, flush=True)
+    sent = transcripts_in_prompt(model.prompts[-1])
+    assert sent == CALL[3] + correction  # the last turn the model saw is repeated as context
+    assert "Borrower Name: John Smith\n" in model.prompts[-1]  # known fields are summarized instead
+    address = {f['field_name']: f for f in response.json['fields']}["Property Address"]
+    assert address["field_value"] == "456 Oak Ave, Boston"
+    assert address["conflict"] and address["candidates"] == ["123 Main St, Boston", "456 Oak Ave, Boston"]
+
+    assert values(client.get(f'/sessions/{session_id}')) == values(response)
+    assert client.delete(f'/sessions/{session_id}').status_code == 204
+    assert client.get(f'/sessions/{session_id}').status_code == 404
+
+def test_failed_update_is_not_stored(monkeypatch):
+    class FailingModel:
+        model_name = 'failing'
+
+        def generate_content(self, prompt, **kwargs):
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(api.app, 'model', FailingModel())
+    client = app.test_client()
+    session_id = client.post('/sessions', json={"fields": ["Annual Income"]}).json['id']
+    assert append(client, session_id, "Caller: Hello there.", flush=True).status_code == 500
+    assert client.get(f'/sessions/{session_id}').json['transcript_chars'] == 0
+
+def test_sessions_are_shared_between_processes(tmp_path, model):
+    first, second = SessionStore(str(tmp_path / 's.db')), SessionStore(str(tmp_path / 's.db'))
+    session = first.create()
+    session.append(CALL[0])
+    first.save(session)
+
+    stale = second.get(session.id)
+    assert stale.transcript == CALL[0]
+    session.append(CALL[1])
+    first.save(session)
+    assert second.get(session.id).transcript == CALL[0] + CALL[1]
+
+    stale.append("Caller: something else\n")
+    with pytest.raises(SessionConflict):
+        second.save(stale)
+
+def test_normalized_values_keep_their_score_in_other_processes(tmp_path):
+    first, second = SessionStore(str(tmp_path / 's.db')), SessionStore(str(tmp_path / 's.db'))
+    session = first.create()
+    session.append("Caller: the loan amount is three hundred thousand, give or take.\n")
+    session.merge(session.score_pairs([("Loan Amount", "three hundred thousand")]))
+    first.save(session)
+    scored = session.state["Loan Amount"]
+    assert scored["field_value"] == "$300,000"
+
+    # The value is found by its spoken wording, so it keeps the context bonus when rescored
+    loaded = second.get(session.id)
+    loaded.rescore()
+    assert loaded.state["Loan Amount"]["confidence_score"] == scored["confidence_score"] == 1.0
+
+def test_idle_sessions_expire(tmp_path, monkeypatch):
+    store = SessionStore(str(tmp_path / 's.db'), idle_seconds=60)
+    session = store.create()
+    assert store.get(session.id) is session
+    now = session.updated_at + 61
+    monkeypatch.setattr('api.sessions.time.time', lambda: now)
+    assert store.get(session.id) is None
+    assert store.expire() == 1
+
+def test_session_limits(tmp_path, monkeypatch, model):
+    store = SessionStore(str(tmp_path / 's.db'), max_sessions=1, max_chars=50)
+    monkeypatch.setattr(api.app, 'session_store', store)
+    client = app.test_client()
+    session_id = client.post('/sessions', json={}).json['id']
+    assert client.post('/sessions', json={}).status_code == 429
+    with pytest.raises(SessionLimitExceeded):
+        store.create()
+
+    assert append(client, session_id, "x" * 40).status_code == 200
+    assert append(client, session_id, "x" * 20).status_code == 413
+    assert client.post('/sessions', json={"fields": ["Favorite Color"]}).status_code == 400
+    assert append(client, 'unknown', "hello").status_code == 404
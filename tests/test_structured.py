@@ -0,0 +1,105 @@
+import json
+import pytest
+import api.app
+from api.app import app
+from api.backends import FakeBackend, ModelResponse
+from api.fields import FORM_1003_FIELDS
+from api.prompts import PromptBuilder
+from api.structured import (MalformedResponse, batch_response_schema, parse_answer, parse_batch_answer,
+                            response_schema)
+
+TRANSCRIPT = ("Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston. "
+              "I work at Tech Corp and we want to refinance the condo.")
+
+class ScriptedModel:
+    """Answers with the given texts in turn and records each call's arguments"""
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return ModelResponse(self.answers.pop(0))
+
+@pytest.fixture
+def json_mode(monkeypatch):
+    monkeypatch.setattr(api.app, 'prompt_builder', PromptBuilder(output_format='json'))
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    api.app.extraction_cache.clear()
+
+def test_response_schema_covers_requested_fields():
+    schema = response_schema()
+    assert schema["required"] == list(FORM_1003_FIELDS)
+    assert all(prop == {"type": "string", "nullable": True} for prop in schema["properties"].values())
+    assert response_schema(["Loan Amount"])["required"] == ["Loan Amount"]
+    assert batch_response_schema(["Loan Amount"])["items"] == response_schema(["Loan Amount"])
+
+def test_parse_answer_keeps_colons_and_drops_unspecified():
+    text = json.dumps({"Employment Info": "Engineer: platform team", "Loan Amount": None,
+                       "Property Type": "Not specified", "Favorite Color": "Blue"})
+    assert parse_answer(text) == [("Employment Info", "Engineer: platform team")]
+
+def test_parse_answer_repairs_fences_and_chatter():
+    text = 'Sure, here you go:\n```json\n{"Loan Amount": "$300,000", "Annual Income": 85000}\n```'
+    assert parse_answer(text) == [("Loan Amount", "$300,000"), ("Annual Income", "85000")]
+
+@pytest.mark.parametrize("text", ["Loan Amount: $300,000", '{"Loan Amount": ["$300,000"]}', '["$300,000"]',
+                                  '{"Loan Amount": "$300,'])
+def test_parse_answer_rejects_schema_violations(text):
+    with pytest.raises(MalformedResponse):
+        parse_answer(text)
+
+def test_parse_batch_answer_marks_invalid_items():
+    text = json.dumps([{"Loan Amount": "$1,000"}, "oops", {"Loan Amount": None}])
+    assert parse_batch_answer(text, 4) == [[("Loan Amount", "$1,000")], None, [], None]
+    with pytest.raises(MalformedResponse):
+        parse_batch_answer('{"Loan Amount": "$1,000"}', 1)
+
+def test_json_mode_extraction(json_mode, monkeypatch):
+    monkeypatch.setattr(api.app, 'model', FakeBackend())
+    response = app.test_client().post('/extract-fields', json={"transcript": TRANSCRIPT})
+    fields = {f['field_name']: f['field_value'] for f in response.json['fields']}
+    assert fields["Borrower Name"] == "John Smith"
+    assert fields["Loan Amount"] == "$300,000"
+    assert fields["Loan Purpose"] == "Refinance"
+
+def test_json_mode_constrains_model_output(json_mode, monkeypatch):
+    model = ScriptedModel('{"Loan Purpose": "Refinance"}')
+    monkeypatch.setattr(api.app, 'model', model)
+    result = api.app.extract_fields(TRANSCRIPT, ["Loan Purpose"])
+    assert [f['field_value'] for f in result['fields']] == ["Refinance"]
+    prompt, kwargs = model.calls[0]
+    assert kwargs["generation_config"]["response_mime_type"] == "application/json"
+    assert kwargs["generation_config"]["response_schema"] == response_schema(["Loan Purpose"])
+    assert '{"Loan Purpose": "Refinance"}' in prompt  # examples are shown as JSON too
+
+def test_json_mode_retries_malformed_answer(json_mode, monkeypatch):
+    model = ScriptedModel("I could not find anything", '{"Loan Purpose": "Refinance"}')
+    monkeypatch.setattr(api.app, 'model', model)
+    result = api.app.extract_fields(TRANSCRIPT, ["Loan Purpose"])
+    assert len(model.calls) == 2
+    assert result['fields'][0]['field_value'] == "Refinance"
+
+def test_json_mode_gives_up_after_retries(json_mode, monkeypatch):
+    monkeypatch.setattr(api.app, 'JSON_OUTPUT_RETRIES', 1)
+    model = ScriptedModel("nope", "still nope", "nope", "still nope")
+    monkeypatch.setattr(api.app, 'model', model)
+    with pytest.raises(MalformedResponse):
+        api.app.extract_fields(TRANSCRIPT, ["Loan Purpose"])
+    assert len(model.calls) == 2
+    with pytest.raises(api.app.ExtractionFailed) as failed:
+        api.app.extract_fields_with_gemini(TRANSCRIPT, ["Loan Purpose"])
+    assert failed.value.status == 502
+    assert len(model.calls) == 4
+
+def test_json_mode_batch(json_mode, monkeypatch):
+    monkeypatch.setattr(api.app, 'model', FakeBackend())
+    results = api.app.extract_fields_batch([TRANSCRIPT, "Hi, this is Jane Doe calling."], ["Borrower Name"])
+    assert [[f['field_value'] for f in r['fields']] for r in results] == [["John Smith"], ["Jane Doe"]]
+
+def test_json_mode_stream_uses_lines(json_mode, monkeypatch):
+    monkeypatch.setattr(api.app, 'model', FakeBackend())
+    response = app.test_client().post('/extract-fields/stream', json={"transcript": TRANSCRIPT})
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert {"Borrower Name", "Loan Amount"} <= {e.get('field_name') for e in events}
+    assert events[-1] == {"type": "done", "cached": False}
@@ -0,0 +1,73 @@
+import threading
+import pytest
+import requests
+from werkzeug.serving import make_server
+import api.app
+from api.app import app
+from ui.client import APIError, ExtractionClient
+
+TRANSCRIPT = "Hi, I'm John Smith. I'm looking to get a $300,000 mortgage for 123 Main St, Boston."
+
+@pytest.fixture
+def server_url():
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Paths of the API requests that reach the server"""
+    seen = []
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    api.app.extraction_cache.clear()
+
+    @app.before_request
+    def record():
+        from flask import request
+        seen.append(request.path)
+
+    yield seen
+    app.before_request_funcs[None].remove(record)
+
+def test_stream_is_memoized_by_transcript(server_url, calls):
+    client = ExtractionClient(server_url)
+    first = list(client.stream_fields(TRANSCRIPT))
+    assert first[-1]["type"] == "done"
+    assert any(event.get("field_value") == "John Smith" for event in first)
+
+    # Whitespace-only differences hash the same; nothing is sent the second time
+    again = list(client.stream_fields(TRANSCRIPT.replace(" ", "  ")))
+    assert [e for e in again if e["type"] == "field"] == [e for e in first if e["type"] == "field"]
+    assert calls == ["/extract-fields/stream"]
+    assert client.extract(TRANSCRIPT)["fields"] == [
+        {k: v for k, v in e.items() if k != "type"} for e in first if e["type"] == "field"]
+    assert calls == ["/extract-fields/stream"]
+
+def test_extract_many_reports_each_item(server_url, calls):
+    client = ExtractionClient(server_url)
+    transcripts = [TRANSCRIPT, "Borrower name is Jane Doe.", TRANSCRIPT, ""]
+    results = dict(client.extract_many(transcripts, concurrency=2))
+    assert sorted(results) == [0, 1, 2, 3]
+    assert results[0] == results[2]
+    assert calls.count("/extract-fields") == 3  # the repeated transcript is sent once
+    assert all("fields" in result or "error" in result for result in results.values())
+
+def test_errors_and_timeouts(server_url, monkeypatch):
+    client = ExtractionClient(server_url)
+    with pytest.raises(APIError) as error:
+        client.extract("x", fields=["Favorite Color"])
+    assert error.value.status == 400 and "Favorite Color" in str(error.value)
+
+    class SlowModel:
+        model_name = 'slow'
+
+        def generate_content(self, prompt, **kwargs):
+            threading.Event().wait(1)
+            raise RuntimeError("too late")
+
+    monkeypatch.setattr(api.app, 'model', SlowModel())
+    monkeypatch.setattr(api.app, 'FAST_PATH_ENABLED', False)
+    with pytest.raises(requests.exceptions.Timeout):
+        ExtractionClient(server_url, read_timeout=0.2).extract("Caller: something new")
@@ -0,0 +1,161 @@
+"""HTTP client the Streamlit UI uses to call the extraction API.
+
+Streamlit re-runs the whole script on every interaction, so nothing here is created per
+run: the app holds one ExtractionClient for the server process (st.cache_resource) and
+every browser session shares it. Its requests.Session keeps a pool of keep-alive
+connections to the API, every call has a connect and a read timeout, and results are
+memoized by transcript hash, so extracting a transcript again (or re-rendering one) doesn't
+call the API. Batches are sent a few transcripts at a time over the same pool.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from api.results import transcript_hash
+
+API_URL = os.getenv('API_URL', 'http://localhost:8000')
+# Seconds to wait for a connection, and for the API to send anything back
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', '3.05'))
+API_READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', '120'))
+# Keep-alive connections to the API, shared by every browser session
+UI_POOL_SIZE = int(os.getenv('UI_POOL_SIZE', '8'))
+# Extraction results remembered by the UI process
+UI_CACHE_SIZE = int(os.getenv('UI_CACHE_SIZE', '512'))
+# Transcripts of an uploaded batch in flight at once
+UI_BATCH_CONCURRENCY = int(os.getenv('UI_BATCH_CONCURRENCY', '4'))
+
+class APIError(Exception):
+    """The API answered with an error"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+def _error_message(response):
+    try:
+        return response.json().get('error') or f"HTTP {response.status_code}"
+    except ValueError:
+        return f"HTTP {response.status_code}"
+
+class ExtractionClient:
+    """Pooled, memoizing client for /extract-fields and /extract-fields/stream.
+
+    Args:
+        base_url: Where the API is served.
+        connect_timeout: Seconds to wait for a connection.
+        read_timeout: Seconds to wait for the API to send anything (between streamed fields
+            when streaming).
+        pool_size: Keep-alive connections kept open to the API.
+        cache_size: Results remembered, least recently used dropped first.
+    """
+
+    def __init__(self, base_url=API_URL, connect_timeout=API_CONNECT_TIMEOUT, read_timeout=API_READ_TIMEOUT,
+                 pool_size=UI_POOL_SIZE, cache_size=UI_CACHE_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        # Only failed connection attempts are retried: the request never reached the API
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def key(transcript, fields=None):
+        """Memoization key: the transcript's hash plus the requested field subset"""
+        return transcript_hash(transcript), tuple(fields or ())
+
+    def cached(self, transcript, fields=None):
+        """The remembered result for this transcript, or None"""
+        key = self.key(transcript, fields)
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+        return result
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _payload(self, transcript, fields):
+        payload = {"transcript": transcript}
+        if fields:
+            payload["fields"] = list(fields)
+        return payload
+
+    def extract(self, transcript, fields=None):
+        """The /extract-fields result for ``transcript``; raises APIError on an error response"""
+        result = self.cached(transcript, fields)
+        if result is not None:
+            return result
+        response = self.session.post(f"{self.base_url}/extract-fields", json=self._payload(transcript, fields),
+                                     timeout=self.timeout)
+        if response.status_code != 200:
+            raise APIError(_error_message(response), response.status_code)
+        result = response.json()
+        self._remember(self.key(transcript, fields), result)
+        return result
+
+    def stream_fields(self, transcript, fields=None):
+        """Yield /extract-fields/stream events, replaying a remembered result without a request.
+
+        A result is remembered only when the stream finished without an error event.
+        """
+        key = self.key(transcript, fields)
+        result = self.cached(transcript, fields)
+        if result is not None:
+            for field in result['fields']:
+                yield {"type": "field", **field}
+            yield {"type": "done", "cached": True}
+            return
+
+        with self.session.post(f"{self.base_url}/extract-fields/stream", json=self._payload(transcript, fields),
+                               timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise APIError(_error_message(response), response.status_code)
+            extracted, failed = [], False
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event['type'] == 'field':
+                    extracted.append({k: v for k, v in event.items() if k != 'type'})
+                elif event['type'] == 'error':
+                    failed = True
+                elif event['type'] == 'done' and not failed:
+                    self._remember(key, {"fields": extracted, "cached": event.get('cached', False)})
+                yield event
+
+    def extract_many(self, transcripts, fields=None, concurrency=UI_BATCH_CONCURRENCY):
+        """Yield (index, result) for each transcript as its extraction finishes.
+
+        At most ``concurrency`` requests are in flight; a transcript repeated in the batch
+        is sent once. A failed item's result is {"error": message}.
+        """
+        indexes = OrderedDict()
+        for index, transcript in enumerate(transcripts):
+            indexes.setdefault(self.key(transcript, fields), []).append((index, transcript))
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(self.extract, items[0][1], fields): items for items in indexes.values()}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except (APIError, requests.RequestException) as e:
+                    result = {"error": str(e)}
+                for index, _ in futures[future]:
+                    yield index, result
+
+    def close(self):
+        self.session.close()
@@ -1,7 +1,11 @@
+import html
+import io
+import json
 import streamlit as st
 import requests
-import json
 import pyperclip
+from api.bulk import iter_records
+from ui.client import APIError, ExtractionClient
 
 # Configure the page
 st.set_page_config(
@@ -48,74 +52,143 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+# One pooled, memoizing API client per server process, shared by every browser session
+@st.cache_resource
+def get_client():
+    return ExtractionClient()
+
+client = get_client()
+
 # Initialize session state
 if 'transcript' not in st.session_state:
     st.session_state.transcript = ""
 if 'extracted_text' not in st.session_state:
     st.session_state.extracted_text = ""
+if 'batch_rows' not in st.session_state:
+    st.session_state.batch_rows = []
+    st.session_state.batch_results = []
 
 def clear_fields():
     st.session_state.transcript = ""
     st.session_state.extracted_text = ""
 
+def render(output):
+    output.markdown(f'<div class="output-container">{html.escape(st.session_state.extracted_text)}</div>',
+                    unsafe_allow_html=True)
+
+def extract_transcript(transcript, output):
+    """Stream fields from the API (or the client's memo) and render each one as it arrives"""
+    output_lines = []
+    st.session_state.extracted_text = ""
+    try:
+        for event in client.stream_fields(transcript):
+            if event['type'] == 'field':
+                output_lines.append(f"{event['field_name']}: {event['field_value']} "
+                                    f"(Confidence: {event['confidence_score']:.2f})")
+            elif event['type'] == 'error':
+                output_lines.append(f"Error: {event['error']}")
+            else:
+                continue
+            st.session_state.extracted_text = "\n".join(output_lines)
+            render(output)
+        if not output_lines:
+            st.session_state.extracted_text = "No fields were extracted from the transcript."
+    except APIError as e:
+        st.session_state.extracted_text = f"Error: {e}"
+    except requests.exceptions.ConnectionError:
+        st.session_state.extracted_text = "Error: Could not connect to the server. Please ensure the backend service is running."
+    except requests.exceptions.Timeout:
+        st.session_state.extracted_text = "Error: The server took too long to answer. Please try again."
+    except Exception as e:
+        st.session_state.extracted_text = f"Error: {str(e)}"
+
+def extract_batch(uploaded):
+    """Send every transcript of an uploaded JSONL or CSV file, showing each item's progress"""
+    text = uploaded.getvalue().decode('utf-8')
+    try:
+        records = list(iter_records(io.StringIO(text, newline=''), uploaded.name.lower().endswith('.csv')))
+    except ValueError as e:
+        st.error(str(e))
+        return
+    rows = [{"#": index + 1, "id": item_id or "", "status": "queued" if error is None else "invalid",
+             "fields": None, "detail": error or ""} for index, _, item_id, error in records]
+    results = [None] * len(records)
+    valid = [(index, transcript) for index, transcript, _, error in records if error is None]
+    if not valid:
+        st.error("The file has no transcripts.")
+        return
+
+    progress = st.progress(0.0, text=f"0 of {len(valid)} transcripts")
+    table = st.empty()
+    table.dataframe(rows, use_container_width=True)
+    for done, (position, result) in enumerate(client.extract_many([t for _, t in valid]), start=1):
+        index = valid[position][0]
+        results[index] = {"id": rows[index]["id"] or None, **result}
+        if 'error' in result:
+            rows[index].update(status="error", detail=result['error'])
+        else:
+            rows[index].update(status="done", fields=len(result['fields']),
+                               detail="cached" if result.get('cached') else "")
+        progress.progress(done / len(valid), text=f"{done} of {len(valid)} transcripts")
+        table.dataframe(rows, use_container_width=True)
+    st.session_state.batch_rows = rows
+    st.session_state.batch_results = [result for result in results if result is not None]
+
 # Title
 st.markdown('<div class="title-container">', unsafe_allow_html=True)
 st.title("FormsiQ - Form Field Extractor")
 st.markdown('</div>', unsafe_allow_html=True)
 
-# Create three columns
-col1, col2, col3 = st.columns([5, 1, 5])
+single_tab, batch_tab = st.tabs(["Transcript", "Batch upload"])
 
-with col1:
-    transcript = st.text_area(
-        "Enter call transcript",
-        key="transcript",
-        height=300,
-        placeholder="Enter the call transcript here...",
-        label_visibility="collapsed"
-    )
+with single_tab:
+    col1, col2 = st.columns([1, 1])
 
-with col2:
-    extract_button = st.button("🔍 Extract", use_container_width=True)
-
-with col3:
-    if extract_button and transcript:
-        try:
-            response = requests.post(
-                'http://localhost:8000/extract-fields',
-                json={"transcript": transcript},
-                headers={'Content-Type': 'application/json'}
+    with col1:
+        # A form, so typing doesn't re-run the script; only Extract does
+        with st.form("extract_form", clear_on_submit=False):
+            transcript = st.text_area(
+                "Enter call transcript",
+                key="transcript",
+                height=300,
+                placeholder="Enter the call transcript here...",
+                label_visibility="collapsed"
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'fields' in data and data['fields']:
-                    output_lines = []
-                    for field in data['fields']:
-                        line = f"{field['field_name']}: {field['field_value']} (Confidence: {field['confidence_score']:.2f})"
-                        output_lines.append(line)
-                    st.session_state.extracted_text = "\n".join(output_lines)
-                else:
-                    st.session_state.extracted_text = "No fields were extracted from the transcript."
-            else:
-                error_message = response.json().get('error', 'Unknown error occurred')
-                st.session_state.extracted_text = f"Error: {error_message}"
-                
-        except requests.exceptions.ConnectionError:
-            st.session_state.extracted_text = "Error: Could not connect to the server. Please ensure the backend service is running."
-        except Exception as e:
-            st.session_state.extracted_text = f"Error: {str(e)}"
-    
-    st.markdown(f'<div class="output-container">{st.session_state.extracted_text}</div>', unsafe_allow_html=True)
-    
-    if st.session_state.extracted_text:
-        if st.button("📋 Copy", use_container_width=True):
-            try:
-                pyperclip.copy(st.session_state.extracted_text)
-                st.success("Content copied to clipboard!")
-            except Exception as e:
-                st.error("Failed to copy to clipboard")
-
-# Clear button at the bottom
-if st.button("🗑️ Clear", use_container_width=True, on_click=clear_fields):
-    st.experimental_rerun()
+            extract_button = st.form_submit_button("🔍 Extract", use_container_width=True)
+
+    with col2:
+        output = st.empty()
+        if extract_button and transcript:
+            extract_transcript(transcript, output)
+        render(output)
+
+        if st.session_state.extracted_text:
+            if st.button("📋 Copy", use_container_width=True):
+                try:
+                    pyperclip.copy(st.session_state.extracted_text)
+                    st.success("Content copied to clipboard!")
+                except Exception as e:
+                    st.error("Failed to copy to clipboard")
+
+    # Clear button at the bottom
+    if st.button("🗑️ Clear", use_container_width=True, on_click=clear_fields):
+        st.experimental_rerun()
+
+with batch_tab:
+    uploaded = st.file_uploader(
+        "JSONL (one transcript string or {\"transcript\": ..., \"id\": ...} per line) or CSV with a transcript column",
+        type=["jsonl", "json", "csv", "txt"]
+    )
+    if uploaded is not None and st.button("🔍 Extract all", use_container_width=True):
+        extract_batch(uploaded)
+    elif st.session_state.batch_rows:
+        st.dataframe(st.session_state.batch_rows, use_container_width=True)
+
+    if st.session_state.batch_results:
+        st.download_button(
+            "⬇️ Download results (JSONL)",
+            "".join(json.dumps(result) + "\n" for result in st.session_state.batch_results),
+            file_name="results.jsonl",
+            mime="application/x-ndjson",
+            use_container_width=True
+        )